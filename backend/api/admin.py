@@ -35,3 +35,20 @@ class MessageAdmin(admin.ModelAdmin):
 @admin.register(models.Event)
 class EventAdmin(admin.ModelAdmin):
     list_display = ('title', 'club', 'date')
+
+
+@admin.register(models.XPEvent)
+class XPEventAdmin(admin.ModelAdmin):
+    list_display = ('user', 'club', 'amount', 'reason', 'applied', 'created_at')
+    list_filter = ('reason', 'applied')
+
+
+@admin.register(models.LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'club', 'xp_points', 'rank')
+
+
+@admin.register(models.OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
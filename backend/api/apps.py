@@ -3,4 +3,18 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'api'
\ No newline at end of file
+    name = 'api'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from . import signals  # noqa: F401
+        from . import metrics, search
+
+        post_migrate.connect(search.ensure_sqlite_triggers, sender=self)
+
+        if metrics.is_enabled():
+            from django.db.backends.signals import connection_created
+
+            connection_created.connect(metrics.add_query_recorder)
+            metrics.install_serializer_timing()
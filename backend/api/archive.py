@@ -0,0 +1,283 @@
+import bisect
+import gzip
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import models
+
+# Cold storage for old chat messages, moved out of the Message table by
+# `manage.py archive_messages`. Each club has a directory of gzipped NDJSON
+# segments, one calendar month (UTC) per segment at most, plus index.json
+# listing every segment's first and last (created_at, id). Everything older
+# than a club's last archived key lives in the archive, everything newer in
+# the database, so readers know from the index alone whether to look here.
+
+INDEX_FILE = 'index.json'
+
+# One segment: file name, row count, and first/last (created_at, id) keys
+Segment = namedtuple('Segment', ['file', 'rows', 'first', 'last'])
+
+_lock = threading.Lock()
+_indexes = {}
+_segments = OrderedDict()
+
+
+def archive_dir():
+    return str(getattr(settings, 'CHAT_ARCHIVE_DIR', settings.BASE_DIR / 'chat_archive'))
+
+
+def club_dir(club_id):
+    return os.path.join(archive_dir(), f'club-{club_id}')
+
+
+def _key(raw):
+    created_at, message_id = raw
+    return datetime.fromisoformat(created_at), message_id
+
+
+def _raw_key(key):
+    created_at, message_id = key
+    return [created_at.astimezone(dt_timezone.utc).isoformat(), message_id]
+
+
+def load_index(club_id):
+    """The club's segments, oldest first. Cached per process until index.json changes."""
+    path = os.path.join(club_dir(club_id), INDEX_FILE)
+    try:
+        version = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    with _lock:
+        cached = _indexes.get(club_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+    with open(path) as handle:
+        segments = [
+            Segment(entry['file'], entry['rows'], _key(entry['first']), _key(entry['last']))
+            for entry in json.load(handle)['segments']
+        ]
+    with _lock:
+        _indexes[club_id] = (version, segments)
+    return segments
+
+
+def boundary(club_id):
+    """(created_at, id) of the club's newest archived message, or None."""
+    segments = load_index(club_id)
+    return segments[-1].last if segments else None
+
+
+def _write_atomically(path, write):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as handle:
+        write(handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, path)
+
+
+def _write_index(club_id, segments):
+    entries = [
+        {'file': segment.file, 'rows': segment.rows, 'first': _raw_key(segment.first), 'last': _raw_key(segment.last)}
+        for segment in segments
+    ]
+    payload = json.dumps({'segments': entries}, indent=1).encode()
+    _write_atomically(os.path.join(club_dir(club_id), INDEX_FILE), lambda handle: handle.write(payload))
+    with _lock:
+        _indexes.pop(club_id, None)
+
+
+def write_segment(club_id, rows):
+    """
+    Append a segment of (created_at, id, author_id, text) rows, sorted and
+    all newer than the club's current boundary, and record it in the index.
+    """
+    directory = club_dir(club_id)
+    os.makedirs(directory, exist_ok=True)
+    first, last = rows[0][:2], rows[-1][:2]
+    name = f'{first[0].astimezone(dt_timezone.utc):%Y-%m}-{first[1]:010d}.jsonl.gz'
+
+    def write(handle):
+        with gzip.GzipFile(fileobj=handle, mode='wb', mtime=0) as compressed:
+            for created_at, message_id, author_id, text in rows:
+                line = [message_id, author_id, text, created_at.astimezone(dt_timezone.utc).isoformat()]
+                compressed.write(json.dumps(line, ensure_ascii=False).encode() + b'\n')
+
+    _write_atomically(os.path.join(directory, name), write)
+    _write_index(club_id, load_index(club_id) + [Segment(name, len(rows), first, last)])
+
+
+def _cached_segments():
+    return getattr(settings, 'CHAT_ARCHIVE_CACHED_SEGMENTS', 8)
+
+
+def load_segment(club_id, segment):
+    """A segment's rows as sorted (created_at, id, author_id, text) tuples, from a small per-process LRU."""
+    path = os.path.join(club_dir(club_id), segment.file)
+    with _lock:
+        rows = _segments.get(path)
+        if rows is not None:
+            _segments.move_to_end(path)
+            return rows
+    with gzip.open(path, 'rt', encoding='utf-8') as handle:
+        rows = []
+        for line in handle:
+            message_id, author_id, text, created_at = json.loads(line)
+            rows.append((datetime.fromisoformat(created_at), message_id, author_id, text))
+    with _lock:
+        _segments[path] = rows
+        while len(_segments) > _cached_segments():
+            _segments.popitem(last=False)
+    return rows
+
+
+def read_before(club_id, key, limit):
+    """Up to `limit` archived rows older than the (created_at, id) key (or the newest ones), newest first."""
+    found = []
+    for segment in reversed(load_index(club_id)):
+        if len(found) >= limit:
+            break
+        if key is not None and segment.first >= key:
+            continue
+        rows = load_segment(club_id, segment)
+        end = len(rows) if key is None else bisect.bisect_left(rows, key)
+        found.extend(reversed(rows[max(0, end - (limit - len(found))):end]))
+    return found
+
+
+def read_after(club_id, key, limit):
+    """Up to `limit` archived rows newer than the (created_at, id) key, oldest first."""
+    found = []
+    # (created_at, id + 1) sorts after the key's own row and before any newer one
+    start_key = (key[0], key[1] + 1)
+    for segment in load_index(club_id):
+        if len(found) >= limit:
+            break
+        if segment.last < start_key:
+            continue
+        rows = load_segment(club_id, segment)
+        start = bisect.bisect_left(rows, start_key)
+        found.extend(rows[start:start + limit - len(found)])
+    return found
+
+
+def _messages(club_id, rows):
+    authors = models.User.objects.only('id', 'username').in_bulk({row[2] for row in rows})
+    return [
+        models.Message(id=message_id, club_id=club_id, author=authors[author_id], text=text, created_at=created_at)
+        for created_at, message_id, author_id, text in rows
+        # The archive outlives deleted accounts; hide their messages as the cascade would have
+        if author_id in authors
+    ]
+
+
+def messages_before(club_id, key, limit):
+    """Unsaved Message instances for read_before(), with their authors loaded."""
+    messages = []
+    while len(messages) < limit:
+        wanted = limit - len(messages)
+        rows = read_before(club_id, key, wanted)
+        messages.extend(_messages(club_id, rows))
+        if len(rows) < wanted:
+            break
+        key = rows[-1][:2]
+    return messages
+
+
+def messages_after(club_id, key, limit):
+    """Unsaved Message instances for read_after(), with their authors loaded."""
+    messages = []
+    while len(messages) < limit:
+        wanted = limit - len(messages)
+        rows = read_after(club_id, key, wanted)
+        messages.extend(_messages(club_id, rows))
+        if len(rows) < wanted:
+            break
+        key = rows[-1][:2]
+    return messages
+
+
+def export_rows(club_id, start=None, end=None):
+    """
+    Archived messages created in [start, end) as (id, author username, text,
+    created_at) rows, oldest first, for api.exports. Usernames are looked
+    up once per segment.
+    """
+    for segment in load_index(club_id):
+        if (start is not None and segment.last[0] < start) or (end is not None and segment.first[0] >= end):
+            continue
+        rows = load_segment(club_id, segment)
+        first = 0 if start is None else bisect.bisect_left(rows, (start,))
+        last = len(rows) if end is None else bisect.bisect_left(rows, (end,))
+        usernames = dict(
+            models.User.objects.filter(id__in={row[2] for row in rows[first:last]}).values_list('id', 'username')
+        )
+        for created_at, message_id, author_id, text in rows[first:last]:
+            if author_id in usernames:
+                yield message_id, usernames[author_id], text, created_at
+
+
+def _next_month(value):
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def archive_club(club_id, before, segment_rows=None):
+    """
+    Move the club's messages created before `before` into the archive,
+    oldest first, one segment at a time. Returns the number of messages
+    moved.
+
+    Each segment is written and indexed before its rows are deleted, so an
+    interrupted run leaves messages in both places at worst; readers ignore
+    the database copies and the next run deletes them.
+    """
+    segment_rows = segment_rows or getattr(settings, 'CHAT_ARCHIVE_SEGMENT_ROWS', 50000)
+    messages = models.Message.objects.filter(club_id=club_id)
+    archived = boundary(club_id)
+    if archived is not None:
+        _delete_archived(club_id, archived)
+    moved = 0
+    while True:
+        oldest = messages.filter(created_at__lt=before).order_by('created_at', 'id').values_list('created_at', flat=True).first()
+        if oldest is None:
+            return moved
+        rows = list(
+            messages.filter(created_at__lt=min(before, _next_month(oldest)))
+            .order_by('created_at', 'id')
+            .values_list('created_at', 'id', 'author_id', 'text')[:segment_rows]
+        )
+        with transaction.atomic():
+            write_segment(club_id, rows)
+            # The segment holds exactly the club's messages up to its last key
+            _delete_archived(club_id, rows[-1][:2])
+        moved += len(rows)
+
+
+def _delete_archived(club_id, key):
+    """
+    Delete the club's messages up to `key` with one DELETE, without the
+    collector's per-row fetch (nothing references messages).
+    """
+    created_at, message_id = key
+    created_at = connection.ops.adapt_datetimefield_value(created_at)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {models.Message._meta.db_table} '
+            'WHERE club_id = %s AND (created_at < %s OR (created_at = %s AND id <= %s))',
+            [club_id, created_at, created_at, message_id],
+        )
+
+
+def delete_club(club_id):
+    """Drop a deleted club's archive."""
+    shutil.rmtree(club_dir(club_id), ignore_errors=True)
+    with _lock:
+        _indexes.pop(club_id, None)
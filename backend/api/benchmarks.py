@@ -0,0 +1,371 @@
+import asyncio
+import io
+import json
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from .models import Club, ClubMembership, Message, User
+
+# Per-endpoint query budgets checked by benchmark_api and the test suite
+BUDGETS = Path(__file__).resolve().with_name('benchmark_budgets.json')
+
+# Endpoint name -> path, formatted with the ids picked by pick_targets()
+ENDPOINTS = {
+    'clubs-list': '/api/clubs/',
+    'clubs-detail': '/api/clubs/{club_id}/',
+    'messages-list': '/api/messages/?club={club_id}',
+    'posts-list': '/api/posts/',
+    'events-list': '/api/events/',
+    'dashboard': '/api/dashboard/',
+    'user-memberships': '/api/users/{user_id}/memberships/',
+    'search': '/api/search/?q=the',
+    'feed': '/api/feed/',
+}
+
+
+def seed(**sizes):
+    """Build the dataset with seed_data; sizes are its command options."""
+    call_command('seed_data', stdout=io.StringIO(), **sizes)
+
+
+def pick_targets():
+    """
+    Benchmark against the busiest active club and the user with the most
+    memberships, which are the worst cases for per-row work.
+    """
+    club = (
+        Club.objects.filter(is_active=True)
+        .annotate(message_count=Count('messages'))
+        .order_by('-message_count', 'id')
+        .first()
+    )
+    user_id = (
+        ClubMembership.objects.values('user_id')
+        .annotate(clubs=Count('id'))
+        .order_by('-clubs', 'user_id')
+        .values_list('user_id', flat=True)
+        .first()
+    )
+    return User.objects.get(id=user_id), club
+
+
+class QueryTimer:
+    """Execute wrapper counting queries and their wall time on a connection."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(client, path, iterations, warmup):
+    for _ in range(warmup):
+        client.get(path)
+    latencies, queries, sql_times = [], [], []
+    for _ in range(iterations):
+        timer = QueryTimer()
+        with connection.execute_wrapper(timer):
+            started = time.perf_counter()
+            response = client.get(path)
+            latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {path} returned {response.status_code}')
+        queries.append(timer.count)
+        sql_times.append(timer.seconds * 1000)
+    return {
+        'p50_ms': round(percentile(latencies, 0.5), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'queries': max(queries),
+        'sql_ms': round(statistics.mean(sql_times), 3),
+    }
+
+
+def run(iterations=20, warmup=2, endpoints=None):
+    """Drive each endpoint through the test client as the picked user. Returns {endpoint: stats}."""
+    user, club = pick_targets()
+    client = APIClient()
+    client.force_authenticate(user)
+    results = {}
+    for name, path in ENDPOINTS.items():
+        if endpoints and name not in endpoints:
+            continue
+        results[name] = measure(client, path.format(club_id=club.id, user_id=user.id), iterations, warmup)
+    return results
+
+
+# Endpoints answered by the lean read path (api.lean) when LEAN_LIST_RESPONSES is on
+LEAN_ENDPOINTS = ('clubs-list', 'posts-list', 'messages-list', 'events-list')
+
+
+def compare_lean(endpoints=None):
+    """
+    Fetch every lean list endpoint with LEAN_LIST_RESPONSES on and off, as
+    the picked user and anonymously, plus the second page of the message
+    history. Returns a failure for each response body that differs.
+    """
+    user, club = pick_targets()
+    member, anonymous = APIClient(), APIClient()
+    member.force_authenticate(user)
+    failures = []
+    for name in LEAN_ENDPOINTS:
+        if endpoints and name not in endpoints:
+            continue
+        paths = [ENDPOINTS[name].format(club_id=club.id, user_id=user.id)]
+        if name == 'messages-list':
+            paths.append(member.get(paths[0]).json()['previous'])
+        for client in (member, anonymous):
+            for path in filter(None, paths):
+                with override_settings(LEAN_LIST_RESPONSES=False):
+                    expected = client.get(path).content
+                with override_settings(LEAN_LIST_RESPONSES=True):
+                    actual = client.get(path).content
+                if actual != expected:
+                    failures.append(f'{name}: lean response for {path} differs from the serializer\'s')
+    return failures
+
+
+EXPORT_PATH = '/api/clubs/{club_id}/export/messages/?format={format}'
+
+
+def export_windows(club, fractions):
+    """
+    ?end= bounds cutting the club's messages at the given fractions of its
+    history (oldest first). Returns [(fraction, end or None)].
+    """
+    messages = Message.objects.filter(club=club).order_by('created_at', 'id').values_list('created_at', flat=True)
+    total = messages.count()
+    windows = []
+    for fraction in sorted(fractions):
+        index = int(total * fraction)
+        windows.append((fraction, messages[index] if index < total else None))
+    return windows
+
+
+def measure_export(client, path):
+    """Stream one export, holding no more than a chunk at a time. Returns its size, speed and peak Python memory."""
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {path} returned {response.status_code}')
+        rows = size = 0
+        for chunk in response.streaming_content:
+            rows += chunk.count(b'\n')
+            size += len(chunk)
+        response.close()
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'rows': rows,
+        'mb': round(size / 2 ** 20, 1),
+        'seconds': round(seconds, 2),
+        'rows_per_s': round(rows / seconds) if seconds else 0,
+        'peak_mb': round(peak / 2 ** 20, 2),
+    }
+
+
+def run_export(fractions=(0.01, 0.1, 1.0), formats=('ndjson', 'csv')):
+    """
+    Export growing slices of the busiest club's chat log as its admin. Flat
+    peak memory across the slices is what shows the export streams.
+    Returns {(format, fraction): stats}.
+    """
+    _, club = pick_targets()
+    client = APIClient()
+    client.force_authenticate(club.admin)
+    results = {}
+    for export_format in formats:
+        for fraction, end in export_windows(club, fractions):
+            path = EXPORT_PATH.format(club_id=club.id, format=export_format)
+            if end is not None:
+                path += '&end=' + end.isoformat().replace('+', '%2B')
+            results[export_format, fraction] = measure_export(client, path)
+    return results
+
+
+async def _broadcast(subscribers, messages, rate, pre_encoded):
+    from .chat_coalescer import frame_coalescer
+    from .chat_history import recent_messages
+    from .consumers import ChatConsumer
+
+    frames = 0
+
+    async def sink(message):
+        nonlocal frames
+        frames += 1
+
+    club_id = 0
+    consumers = []
+    for index in range(subscribers):
+        consumer = ChatConsumer()
+        consumer.base_send = sink
+        consumer.is_club_chat, consumer.club_id = True, club_id
+        consumer.channel_name = f'benchmark.{index}'
+        consumers.append(consumer)
+    recent_messages.subscribe(club_id)
+    try:
+        started = time.process_time()
+        for message_id in range(1, messages + 1):
+            message = {
+                'id': message_id, 'club': club_id, 'author_username': 'benchmark',
+                'text': 'The quick brown fox jumps over the lazy dog ' * 2,
+                'created_at': '2025-01-01T12:00:00.000000Z',
+            }
+            event = {'type': 'chat_message', 'message': message}
+            if pre_encoded:
+                event['text'] = json.dumps(message)
+            for consumer in consumers:
+                await consumer.chat_message(event)
+            if rate:
+                await asyncio.sleep(1 / rate)
+        await frame_coalescer.drain()
+        seconds = time.process_time() - started
+    finally:
+        recent_messages.unsubscribe(club_id)
+    return seconds, frames
+
+
+def run_broadcast(subscribers=2000, messages=100, rate=50, window_ms=100):
+    """
+    Deliver `messages` chat messages, `rate` a second, to `subscribers`
+    club chat consumers in this process, the way the channel layer hands
+    them to ChatConsumer.chat_message, with a counting sink in place of the
+    websocket. Reports CPU time per delivered message and frames sent for
+    per-subscriber encoding (events without "text"), pre-encoded events and
+    pre-encoded events coalesced over `window_ms`.
+    """
+    modes = [
+        ('per-subscriber', False, 0),
+        ('pre-encoded', True, 0),
+        (f'coalesced {window_ms}ms', True, window_ms),
+    ]
+    results = {}
+    for name, pre_encoded, window in modes:
+        with override_settings(CHAT_COALESCE_WINDOW_MS=window):
+            seconds, frames = asyncio.run(_broadcast(subscribers, messages, rate, pre_encoded))
+        deliveries = subscribers * messages
+        results[name] = {
+            'deliveries': deliveries,
+            'frames': frames,
+            'cpu_us_per_delivery': round(seconds / deliveries * 1_000_000, 3),
+        }
+    return results
+
+
+def run_chat_protocol(messages=10000, authors=50, subscribers=100):
+    """
+    Encode `messages` chat messages from `authors` users the ways the chat
+    consumers can. Reports bytes per message on the wire, and CPU time per
+    message spent once per broadcast (sender) and once per connection
+    (subscriber), for JSON through MessageSerializer, JSON from the lean
+    chat_codec.message_data() and MessagePack with interned usernames.
+    """
+    from . import chat_codec
+    from .serializers import MessageSerializer
+
+    created_at = datetime(2025, 1, 1, 12, tzinfo=dt_timezone.utc)
+    users = [User(id=index, username=f'member{index:04d}') for index in range(1, authors + 1)]
+    instances = [
+        Message(
+            id=message_id, club_id=1, author=users[message_id % authors],
+            text='The quick brown fox jumps over the lazy dog ' * 2,
+            created_at=created_at + timedelta(microseconds=message_id * 1234567),
+        )
+        for message_id in range(1, messages + 1)
+    ]
+
+    def drf(message):
+        return json.dumps(MessageSerializer(message).data)
+
+    def lean(message):
+        return json.dumps(chat_codec.message_data(
+            message.id, message.club_id, message.author.username, message.text, message.created_at,
+        ))
+
+    def packed(message):
+        data = chat_codec.message_data(
+            message.id, message.club_id, message.author.username, message.text, message.created_at,
+        )
+        return data, chat_codec.pack_message_body(data)
+
+    results = {}
+    for name, encode in (('json (serializer)', drf), ('json (lean)', lean)):
+        started = time.process_time()
+        frames = [encode(message) for message in instances]
+        seconds = time.process_time() - started
+        results[name] = {
+            'bytes_per_message': round(sum(len(frame.encode()) for frame in frames) / messages, 1),
+            'sender_us': round(seconds / messages * 1_000_000, 3),
+            # Pre-encoded text frames are sent as they are
+            'subscriber_us': 0.0,
+        }
+
+    started = time.process_time()
+    bodies = [packed(message) for message in instances]
+    sender_seconds = time.process_time() - started
+    started = time.process_time()
+    for _ in range(subscribers):
+        encoder = chat_codec.MsgpackEncoder()
+        frames = [encoder.message(data, body) for data, body in bodies]
+    subscriber_seconds = (time.process_time() - started) / subscribers
+    results['msgpack'] = {
+        'bytes_per_message': round(sum(len(frame) for frame in frames) / messages, 1),
+        'sender_us': round(sender_seconds / messages * 1_000_000, 3),
+        'subscriber_us': round(subscriber_seconds / messages * 1_000_000, 3),
+    }
+    return results
+
+
+def check(results, budgets=None, baseline=None, max_regression=0.25):
+    """
+    Compare results against query budgets ({endpoint: max queries}) and a
+    stored baseline run. Returns a list of human-readable failures.
+    """
+    failures = []
+    for name, stats in results.items():
+        budget = (budgets or {}).get(name)
+        if budget is not None and stats['queries'] > budget:
+            failures.append(f'{name}: {stats["queries"]} queries, budget is {budget}')
+        previous = (baseline or {}).get(name)
+        if previous and stats['p95_ms'] > previous['p95_ms'] * (1 + max_regression):
+            failures.append(
+                f'{name}: p95 {stats["p95_ms"]:.1f}ms regressed more than {max_regression:.0%} '
+                f'from baseline {previous["p95_ms"]:.1f}ms'
+            )
+    return failures
+
+
+def load_json(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def dump_json(data, path):
+    with open(path, 'w') as handle:
+        json.dump(data, handle, indent=2, sort_keys=True)
+        handle.write('\n')
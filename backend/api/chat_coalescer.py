@@ -0,0 +1,63 @@
+import asyncio
+import logging
+
+from .chat_codec import pack_batch
+
+logger = logging.getLogger(__name__)
+
+
+class FrameCoalescer:
+    """
+    Batches outgoing chat frames per connection over CHAT_COALESCE_WINDOW_MS.
+
+    The window is shared by the whole process: the first frame queued after
+    a flush starts a single timer, and when it fires every connection with
+    pending frames gets them as one frame. Coalescing thus costs no task or
+    timer per connection, and no frame waits longer than the window. Frames
+    are pre-encoded (JSON strings, or MessagePack bytes for connections that
+    negotiated it), so a batch is built by joining them. All methods run on
+    the event loop.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._flush = None
+
+    def add(self, consumer, text, window_ms):
+        texts = self._pending.get(consumer)
+        if texts is None:
+            self._pending[consumer] = [text]
+        else:
+            texts.append(text)
+        if self._flush is None:
+            self._flush = asyncio.get_running_loop().create_task(self._flush_after(window_ms / 1000))
+
+    def discard(self, consumer):
+        self._pending.pop(consumer, None)
+
+    async def _flush_after(self, delay):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            pending, self._pending = self._pending, {}
+            self._flush = None
+        for consumer, texts in pending.items():
+            if len(texts) == 1:
+                data = texts[0]
+            elif isinstance(texts[0], bytes):
+                data = pack_batch(texts)
+            else:
+                data = '{"type": "batch", "messages": [' + ', '.join(texts) + ']}'
+            try:
+                await consumer.send_data(data)
+            except Exception:
+                # One broken connection mustn't hold up the others' frames
+                logger.exception('Sending a coalesced chat frame failed')
+
+    async def drain(self):
+        """Wait for the pending flush, if any."""
+        if self._flush is not None:
+            await self._flush
+
+
+frame_coalescer = FrameCoalescer()
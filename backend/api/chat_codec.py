@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import msgpack
+
+from .lean import format_datetime
+
+# Chat clients opt into MessagePack frames by offering this websocket
+# subprotocol; everyone else gets JSON. In MessagePack frames every map key
+# is an integer tag from FIELDS, frame types are integers from TYPES,
+# timestamps are microseconds since the epoch, and a message's author is a
+# per-connection reference: the first message from an author carries
+# "author" and "username", later ones only "author".
+SUBPROTOCOL = 'venti.msgpack.v1'
+
+TYPES = {
+    'message': 0, 'batch': 1, 'history': 2, 'presence': 3, 'typing': 4, 'error': 5,
+    'subscribed': 6, 'unsubscribed': 7, 'heartbeat': 8, 'subscribe': 9, 'unsubscribe': 10,
+}
+FIELDS = {
+    'type': 0, 'id': 1, 'club': 2, 'author': 3, 'text': 4, 'created_at': 5, 'username': 6,
+    'messages': 7, 'has_more': 8, 'online': 9, 'heartbeat': 10, 'joined': 11, 'left': 12,
+    'user': 13, 'code': 14, 'detail': 15, 'clubs': 16, 'denied': 17, 'reason': 18,
+    'message': 19, 'last_ids': 20,
+}
+TYPE_NAMES = {tag: name for name, tag in TYPES.items()}
+FIELD_NAMES = {tag: name for name, tag in FIELDS.items()}
+
+# Usernames interned per connection; later authors are sent by name every time
+MAX_INTERNED = 1024
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+_packb = msgpack.Packer().pack
+# Message map fields shared by every connection: type, id, club, text, created_at
+_BODY_FIELDS = 5
+
+
+def message_data(message_id, club_id, username, text, created_at):
+    """
+    A chat message as MessageSerializer represents it, built directly: the
+    same keys in the same order, so json.dumps() gives identical frames.
+    """
+    return {
+        'id': message_id,
+        'club': club_id,
+        'author_username': username,
+        'text': text,
+        'created_at': format_datetime(created_at),
+    }
+
+
+def timestamp(created_at):
+    """Microseconds since the epoch of an ISO 8601 created_at."""
+    return (datetime.fromisoformat(created_at) - _EPOCH) // _MICROSECOND
+
+
+def pack_message_body(message):
+    """
+    The packed fields of a message's map that don't depend on the
+    connection, without the map header. Packed once per broadcast and
+    completed per connection by MsgpackEncoder.message().
+    """
+    return b''.join([
+        _packb(FIELDS['type']), _packb(TYPES['message']),
+        _packb(FIELDS['id']), _packb(message['id']),
+        _packb(FIELDS['club']), _packb(message['club']),
+        _packb(FIELDS['text']), _packb(message['text']),
+        _packb(FIELDS['created_at']), _packb(timestamp(message['created_at'])),
+    ])
+
+
+def pack_batch(packed_messages):
+    """A batch frame of already packed message maps."""
+    packer = msgpack.Packer()
+    return b''.join([
+        packer.pack_map_header(2),
+        _packb(FIELDS['type']), _packb(TYPES['batch']),
+        _packb(FIELDS['messages']), packer.pack_array_header(len(packed_messages)),
+        *packed_messages,
+    ])
+
+
+class MsgpackEncoder:
+    """Packs the frames of one connection, remembering which usernames it has been sent."""
+
+    def __init__(self):
+        self._authors = {}  # username -> packed "author" field
+
+    def _author(self, username):
+        """(packed author fields, how many)."""
+        packed = self._authors.get(username)
+        if packed is not None:
+            return packed, 1
+        if len(self._authors) >= MAX_INTERNED:
+            return _packb(FIELDS['username']) + _packb(username), 1
+        packed = self._authors[username] = _packb(FIELDS['author']) + _packb(len(self._authors))
+        return packed + _packb(FIELDS['username']) + _packb(username), 2
+
+    def message(self, message, body=None):
+        """A message frame; `body` is its pack_message_body(), when already packed."""
+        author, count = self._author(message['author_username'])
+        return b''.join([
+            bytes([0x80 | (_BODY_FIELDS + count)]),  # fixmap header
+            body or pack_message_body(message),
+            author,
+        ])
+
+    def frame(self, frame):
+        """Any other server frame, from the dict sent as JSON to other clients."""
+        if 'type' not in frame:
+            return self.message(frame)
+        packer = msgpack.Packer()
+        parts = [packer.pack_map_header(len(frame))]
+        for key, value in frame.items():
+            parts.append(_packb(FIELDS[key]))
+            if key == 'messages':
+                parts.append(packer.pack_array_header(len(value)))
+                parts.extend(self.message(message) for message in value)
+                continue
+            if key == 'type':
+                value = TYPES[value]
+            elif key in ('online', 'joined'):
+                value = [_user(user) for user in value]
+            elif key == 'user':
+                value = _user(value)
+            parts.append(_packb(value))
+        return b''.join(parts)
+
+
+def _user(user):
+    return {FIELDS['id']: user['id'], FIELDS['username']: user['username']}
+
+
+def decode(data):
+    """A client's MessagePack frame as the dict its JSON form would parse to; None if malformed."""
+    try:
+        frame = msgpack.unpackb(data, strict_map_key=False)
+        decoded = {FIELD_NAMES[key]: value for key, value in frame.items()}
+        if 'type' in decoded:
+            decoded['type'] = TYPE_NAMES[decoded['type']]
+        if isinstance(decoded.get('last_ids'), dict):
+            # JSON object keys are strings
+            decoded['last_ids'] = {str(key): value for key, value in decoded['last_ids'].items()}
+        return decoded
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
@@ -0,0 +1,80 @@
+import json
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from . import chat_codec
+
+logger = logging.getLogger(__name__)
+
+
+def club_group(club_id):
+    """Channel layer group of every connection subscribed to the club's chat."""
+    return f'chat_{club_id}'
+
+
+def user_group(user_id):
+    """Channel layer group of every chat connection of the user (no room group can be named like this)."""
+    return f'user.{user_id}'
+
+
+def chat_message_event(message_data):
+    """The channel layer event broadcasting a chat message to its club's group."""
+    return {
+        'type': 'chat_message',
+        'message': message_data,
+        # Encoded once here rather than once per subscriber
+        'text': json.dumps(message_data),
+        'packed': chat_codec.pack_message_body(message_data),
+    }
+
+
+def broadcast_message(message_data):
+    """
+    Once the transaction commits, send a chat message saved outside the
+    websocket path (e.g. through the REST API) to the club's chat group, so
+    open connections and their recent-message buffers see it too.
+    """
+    event = chat_message_event(message_data)
+
+    def send_after_commit():
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        try:
+            async_to_sync(channel_layer.group_send)(club_group(message_data['club']), event)
+        except Exception:
+            # The message itself has been committed; clients see it in the REST history
+            logger.exception('Broadcasting chat message %s failed', message_data['id'])
+
+    transaction.on_commit(send_after_commit)
+
+
+def notify_memberships_changed(club_id, user_ids, added):
+    """
+    Once the transaction commits, tell the users' open chat connections
+    that they joined or left the club, so they subscribe to or drop the
+    club's group.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    event = {'type': 'membership_changed', 'club': club_id, 'added': added}
+
+    async def send():
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        for user_id in user_ids:
+            await channel_layer.group_send(user_group(user_id), event)
+
+    def send_after_commit():
+        try:
+            async_to_sync(send)()
+        except Exception:
+            # The membership change itself has been committed; sockets catch up when they reconnect
+            logger.exception('Notifying chat connections of membership changes in club %s failed', club_id)
+
+    transaction.on_commit(send_after_commit)
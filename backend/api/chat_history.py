@@ -0,0 +1,110 @@
+import asyncio
+from collections import deque
+
+from django.conf import settings
+
+from .chat_codec import timestamp
+
+
+class RecentMessageBuffer:
+    """
+    Bounded, per-process buffer of the most recent serialized messages per club.
+
+    A club's buffer only exists while at least one consumer in this process is
+    subscribed to its chat group: it is seeded once from the database and then
+    kept current from the group's own chat_message events, so reconnecting
+    clients can be replayed from memory. All methods run on the event loop.
+
+    Messages are ordered by (created_at, id), the order of the history API:
+    with write-behind each process hands out ids from its own reserved
+    block, so ids alone don't follow the order messages were sent in.
+    """
+
+    def __init__(self, maxlen=None):
+        self.maxlen = maxlen or getattr(settings, 'CHAT_RECENT_BUFFER_SIZE', 200)
+        self._messages = {}
+        self._keys = {}  # club_id -> {message id: (created_at, id) sort key}
+        self._warm = set()
+        self._loading = {}
+        self._subscribers = {}
+
+    def subscribe(self, club_id):
+        self._subscribers[club_id] = self._subscribers.get(club_id, 0) + 1
+        self._messages.setdefault(club_id, deque())
+        self._keys.setdefault(club_id, {})
+
+    def unsubscribe(self, club_id):
+        remaining = self._subscribers.get(club_id, 0) - 1
+        if remaining > 0:
+            self._subscribers[club_id] = remaining
+            return
+        # Without a local subscriber we stop seeing the group's events,
+        # so the buffer can no longer be trusted.
+        self._subscribers.pop(club_id, None)
+        self._messages.pop(club_id, None)
+        self._keys.pop(club_id, None)
+        self._warm.discard(club_id)
+
+    def append(self, club_id, message):
+        messages = self._messages.get(club_id)
+        if messages is None or message['id'] in self._keys[club_id]:
+            return
+        keys = self._keys[club_id]
+        key = keys[message['id']] = (timestamp(message['created_at']), message['id'])
+        if messages and key < keys[messages[-1]['id']]:
+            # Out-of-order delivery: keep the buffer sorted.
+            ordered = sorted([*messages, message], key=lambda m: keys[m['id']])
+            messages.clear()
+            messages.extend(ordered)
+        else:
+            messages.append(message)
+        while len(messages) > self.maxlen:
+            del keys[messages.popleft()['id']]
+
+    async def warm(self, club_id, loader):
+        """
+        Seed the club's buffer with `loader(club_id, limit)` unless it is already warm.
+        Concurrent callers for the same club share a single load.
+        """
+        if club_id in self._warm or club_id not in self._messages:
+            return
+        pending = self._loading.get(club_id)
+        if pending is not None:
+            # Completion signal only; a failed load leaves the buffer cold.
+            await asyncio.shield(pending)
+            return
+        pending = asyncio.get_running_loop().create_future()
+        self._loading[club_id] = pending
+        try:
+            rows = await loader(club_id, self.maxlen)
+            if club_id in self._messages:
+                for message in rows:
+                    self.append(club_id, message)
+                self._warm.add(club_id)
+        finally:
+            del self._loading[club_id]
+            pending.set_result(None)
+
+    def is_warm(self, club_id):
+        return club_id in self._warm
+
+    def latest(self, club_id, limit):
+        messages = self._messages.get(club_id) or ()
+        return list(messages)[-limit:] if limit else []
+
+    def since(self, club_id, last_id):
+        """
+        Return the buffered messages after message `last_id`, or None when
+        it isn't buffered: only then is its place in the order known.
+        """
+        messages = self._messages.get(club_id)
+        if club_id not in self._warm or messages is None:
+            return None
+        keys = self._keys[club_id]
+        anchor = keys.get(last_id)
+        if anchor is None:
+            return None
+        return [message for message in messages if keys[message['id']] > anchor]
+
+
+recent_messages = RecentMessageBuffer()
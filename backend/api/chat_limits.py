@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Why a frame from a chat client was turned away, as counted in the metrics registry
+TOO_LARGE = 'too_large'
+INVALID = 'invalid'
+THROTTLED_CONNECTION = 'throttled_connection'
+THROTTLED_USER = 'throttled_user'
+OVERFLOW = 'overflow'
+
+# The error frame detail sent for each reason
+DETAILS = {
+    TOO_LARGE: 'Frame or message too large.',
+    INVALID: 'Malformed frame.',
+    THROTTLED_CONNECTION: 'Too many frames; slow down.',
+    THROTTLED_USER: 'Too many frames; slow down.',
+    OVERFLOW: 'Too many frames waiting; slow down.',
+}
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`; starts full."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class UserBuckets:
+    """
+    One TokenBucket per user, shared by all of the user's chat connections
+    in this process and dropped with the last of them. Limits are per
+    process: a user spread over several processes gets each one's budget.
+    """
+
+    def __init__(self):
+        self._buckets = {}  # user_id -> [TokenBucket, connections]
+
+    def acquire(self, user_id):
+        entry = self._buckets.get(user_id)
+        if entry is None:
+            entry = self._buckets[user_id] = [TokenBucket(
+                getattr(settings, 'CHAT_USER_RATE', 10),
+                getattr(settings, 'CHAT_USER_BURST', 30),
+            ), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, user_id):
+        entry = self._buckets.get(user_id)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._buckets[user_id]
+
+
+user_buckets = UserBuckets()
+
+
+class InboundQueue:
+    """
+    The frames of one connection waiting for `handle`, which runs them one
+    at a time in a task of its own. receive() only enqueues, so the consumer
+    keeps reading the socket while a frame waits on the database, and at
+    most `size` frames can pile up behind the one being handled.
+    """
+
+    def __init__(self, handle, size):
+        self.handle = handle
+        self.size = size
+        self._frames = deque()
+        self._task = None
+
+    def offer(self, frame):
+        """Enqueue the frame; False when the queue is full."""
+        if len(self._frames) >= self.size:
+            return False
+        self._frames.append(frame)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._drain())
+        return True
+
+    async def _drain(self):
+        while self._frames:
+            try:
+                await self.handle(self._frames.popleft())
+            except Exception:
+                logger.exception('Handling a chat frame failed')
+
+    def close(self):
+        """Drop the waiting frames and stop handling."""
+        self._frames.clear()
+        if self._task is not None:
+            self._task.cancel()
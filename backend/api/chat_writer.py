@@ -0,0 +1,148 @@
+import atexit
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """
+    Write-behind persistence for chat messages (CHAT_WRITE_BEHIND).
+
+    Consumers take a pre-reserved primary key, broadcast the message straight
+    away and hand the row to this writer. A per-process flusher thread
+    bulk_creates pending rows every CHAT_WRITE_BEHIND_INTERVAL_MS or as soon
+    as CHAT_WRITE_BEHIND_BATCH_SIZE rows are waiting. Failed batches are
+    retried with backoff, and pending rows are flushed on interpreter exit,
+    so only a hard kill can lose the last interval's messages.
+    """
+
+    def __init__(self):
+        self.interval = getattr(settings, 'CHAT_WRITE_BEHIND_INTERVAL_MS', 20) / 1000
+        self.batch_size = getattr(settings, 'CHAT_WRITE_BEHIND_BATCH_SIZE', 200)
+        self.id_block_size = getattr(settings, 'CHAT_WRITE_BEHIND_ID_BLOCK', 500)
+        self.max_backoff = 5.0
+        self._pending = deque()
+        self._ids = deque()
+        self._lock = threading.Lock()
+        self._id_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def is_supported():
+        return connection.vendor in ('sqlite', 'postgresql')
+
+    # --- Primary keys ---
+
+    def take_id(self):
+        """Pop a reserved id without touching the database, or None if the block is used up."""
+        try:
+            return self._ids.popleft()
+        except IndexError:
+            return None
+
+    def reserve_id(self):
+        """Pop a reserved id, reserving a new block first if needed. Hits the database."""
+        with self._id_lock:
+            if not self._ids:
+                self._ids.extend(self._reserve_block(self.id_block_size))
+            return self._ids.popleft()
+
+    def _reserve_block(self, size):
+        # Ids come from the table's own sequence so they never collide with
+        # rows inserted synchronously (REST, or CHAT_WRITE_BEHIND=False).
+        table = Message._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                    [table, size],
+                )
+                return sorted(row[0] for row in cursor.fetchall())
+            cursor.execute("UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s", [size, table])
+            if cursor.rowcount == 0:
+                cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)}")
+                start = cursor.fetchone()[0]
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start + size])
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+            end = cursor.fetchone()[0]
+        return list(range(end - size + 1, end + 1))
+
+    # --- Writes ---
+
+    def enqueue(self, message):
+        with self._lock:
+            self._pending.append(message)
+            pending = len(self._pending)
+        self._ensure_started()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Persist everything pending in the calling thread."""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            self._write(batch)
+
+    def close(self):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._stopping.is_set():
+                self._thread = threading.Thread(target=self._run, name='chat-message-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        backoff = self.interval
+        try:
+            while not self._stopping.is_set():
+                self._wakeup.wait(backoff)
+                self._wakeup.clear()
+                try:
+                    self.flush()
+                    backoff = self.interval
+                except Exception:
+                    backoff = min(max(backoff * 2, 0.1), self.max_backoff)
+                    logger.exception('Chat write-behind flush failed, retrying in %.2fs', backoff)
+        finally:
+            connection.close()
+
+    def _write(self, batch):
+        try:
+            with transaction.atomic():
+                Message.objects.bulk_create(batch)
+        except IntegrityError:
+            # A bad row (e.g. its club was deleted) must not sink the whole batch.
+            for message in batch:
+                try:
+                    with transaction.atomic():
+                        Message.objects.bulk_create([message])
+                except IntegrityError:
+                    logger.warning('Dropping chat message %s', message.pk, exc_info=True)
+        except Exception:
+            with self._lock:
+                self._pending.extendleft(reversed(batch))
+            raise
+
+
+message_writer = MessageWriter()
+atexit.register(message_writer.close)
@@ -0,0 +1,69 @@
+import hashlib
+import time
+
+from django.db.models import Count, IntegerField, Max, Value
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+
+
+def list_validators(parts, key=''):
+    """
+    (ETag, Last-Modified timestamp) for a list response, from the row count
+    and latest modification time of each (queryset, datetime field) part.
+    All parts are aggregated in a single UNION ALL query; `key` adds
+    whatever else the response depends on (query string, user, ...).
+    """
+    aggregates = [
+        queryset.order_by()
+        .annotate(part=Value(index, output_field=IntegerField()))
+        .values('part')
+        .annotate(rows=Count('pk'), last=Max(field))
+        .values_list('part', 'rows', 'last')
+        for index, (queryset, field) in enumerate(parts)
+    ]
+    query = aggregates[0].union(*aggregates[1:], all=True) if len(aggregates) > 1 else aggregates[0]
+    rows = sorted(query)
+
+    last_modified = None
+    for _, _, last in rows:
+        if isinstance(last, str):
+            last = parse_datetime(last)
+        if last is not None and (last_modified is None or last > last_modified):
+            last_modified = last
+    digest = hashlib.sha1(repr((key, [(part, count, str(last)) for part, count, last in rows])).encode()).hexdigest()
+    return f'"{digest}"', int(last_modified.timestamp()) if last_modified else None
+
+
+class ConditionalListMixin:
+    """
+    Answer unchanged list requests with 304 Not Modified before anything is
+    serialized. Validators come from list_validators() over the parts given
+    by get_list_validator_parts(); override it (and get_list_validator_key)
+    when the response also depends on other tables or on the user.
+    """
+
+    def get_list_validator_parts(self, queryset):
+        return [(queryset, 'updated_at')]
+
+    def get_list_validator_key(self, request):
+        return request.get_full_path()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        etag, last_modified = list_validators(
+            self.get_list_validator_parts(queryset), self.get_list_validator_key(request)
+        )
+        if last_modified is not None and last_modified >= int(time.time()):
+            # Later writes this second would share the timestamp, so it can't
+            # validate anything yet; clients revalidate with the ETag instead
+            last_modified = None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        response['Vary'] = 'Authorization'
+        return response
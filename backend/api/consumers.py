@@ -1,23 +1,326 @@
+import asyncio
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from . import chat_codec, chat_limits
+from .chat_coalescer import frame_coalescer
+from .chat_groups import chat_message_event, club_group, user_group
+from .chat_history import recent_messages
+from .chat_writer import message_writer
+from .membership_cache import membership_cache
+from .metrics import instrument_consumer_call, registry
 from .models import Club, ClubMembership, Message
-from .serializers import MessageSerializer
+from .pagination import KeysetPagination
+from .presence import club_presence
 
-class ChatConsumer(AsyncWebsocketConsumer):
+# Arguments of chat_codec.message_data(), as a values_list() of Message
+MESSAGE_COLUMNS = ('id', 'club_id', 'author__username', 'text', 'created_at')
+
+
+class ClubChatMixin:
+    """
+    What club chat consumers share: history replay, presence, posting and
+    the channel layer event handlers. Frames of a multiplexed consumer carry
+    the club they belong to.
+    """
+    is_club_chat = True
+    multiplexed = False
+    # Frame type assumed when a frame has no "type"
+    default_frame_type = None
+    # Frames limited by a connection bucket of their own, so they never use up the chat message budget
+    control_frame_types = ('heartbeat', 'typing')
+    # Set for connections that negotiated MessagePack frames
+    encoder = None
+
+    def tag(self, frame, club_id):
+        if self.multiplexed:
+            frame['club'] = club_id
+        return frame
+
+    async def accept_chat(self):
+        """Accept the connection, with MessagePack frames if the client offers chat_codec.SUBPROTOCOL."""
+        if chat_codec.SUBPROTOCOL in self.scope.get('subprotocols', ()):
+            self.encoder = chat_codec.MsgpackEncoder()
+            await self.accept(chat_codec.SUBPROTOCOL)
+        else:
+            await self.accept()
+        self.open_inbound()
+
+    async def send_frame(self, frame):
+        if self.encoder is None:
+            await self.send(text_data=json.dumps(frame))
+        else:
+            await self.send(bytes_data=self.encoder.frame(frame))
+
+    async def send_error(self, detail, club_id=None):
+        frame = {'type': 'error', 'detail': detail}
+        if club_id is not None:
+            frame['club'] = club_id
+        await self.send_frame(frame)
+
+    # --- Inbound limits ---
+
+    def open_inbound(self):
+        self.inbound = chat_limits.InboundQueue(self.handle_frame, getattr(settings, 'CHAT_INBOUND_QUEUE_SIZE', 16))
+        self.connection_bucket = chat_limits.TokenBucket(
+            getattr(settings, 'CHAT_CONNECTION_RATE', 5),
+            getattr(settings, 'CHAT_CONNECTION_BURST', 20),
+        )
+        self.control_bucket = chat_limits.TokenBucket(
+            getattr(settings, 'CHAT_CONTROL_RATE', 2),
+            getattr(settings, 'CHAT_CONTROL_BURST', 10),
+        )
+        self.user_bucket = chat_limits.user_buckets.acquire(self.user.id)
+        self.rejected = None
+
+    def close_inbound(self):
+        if getattr(self, 'inbound', None) is None:
+            return
+        self.inbound.close()
+        self.inbound = None
+        chat_limits.user_buckets.release(self.user.id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """
+        Admit the frame to the connection's inbound queue, or turn it away:
+        frames over CHAT_MAX_FRAME_SIZE characters, malformed, over the
+        connection's or the user's rate, or arriving while the queue is
+        full. Nothing here touches the database, and JSON is only parsed
+        once the size check has passed.
+        """
+        if getattr(self, 'inbound', None) is None:
+            # Closing; frames still in flight are ignored
+            return
+        frame, reason = self.admit(text_data, bytes_data)
+        if reason is None and not self.inbound.offer(frame):
+            reason = chat_limits.OVERFLOW
+        if reason is None:
+            self.rejected = None
+            return
+        registry.count_chat_frame_rejected(type(self).__name__, reason)
+        if reason == chat_limits.OVERFLOW and getattr(settings, 'CHAT_INBOUND_OVERFLOW', 'drop') == 'close':
+            self.close_inbound()
+            await self.close(code=1013)  # Try again later
+            return
+        if reason != self.rejected:
+            # One error frame per run of frames rejected for the same reason, not one per frame
+            self.rejected = reason
+            await self.send_rejection(reason)
+
+    async def send_rejection(self, reason):
+        await self.send_frame({
+            'type': 'error',
+            'code': reason,
+            'detail': chat_limits.DETAILS[reason],
+        })
+
+    def admit(self, text_data, bytes_data):
+        """
+        (frame, None) for a frame to handle, or (None, reason) for one to
+        drop. Binary frames are MessagePack, on connections that negotiated it.
+        """
+        data = text_data if text_data is not None else bytes_data
+        if data is None or (text_data is None and self.encoder is None):
+            return None, chat_limits.INVALID
+        if len(data) > getattr(settings, 'CHAT_MAX_FRAME_SIZE', 8192):
+            return None, chat_limits.TOO_LARGE
+        if text_data is None:
+            frame = chat_codec.decode(bytes_data)
+        else:
+            try:
+                frame = json.loads(text_data)
+            except ValueError:
+                return None, chat_limits.INVALID
+        if not isinstance(frame, dict):
+            return None, chat_limits.INVALID
+        frame_type = frame.get('type', self.default_frame_type)
+        if frame_type in self.control_frame_types:
+            # Heartbeats and typing notifications only count against their own bucket
+            if not self.control_bucket.take():
+                return None, chat_limits.THROTTLED_CONNECTION
+            return frame, None
+        if not self.connection_bucket.take():
+            return None, chat_limits.THROTTLED_CONNECTION
+        if not self.user_bucket.take():
+            return None, chat_limits.THROTTLED_USER
+        if frame_type == 'message':
+            message = frame.get('message')
+            if not isinstance(message, str) or not message.strip():
+                return None, chat_limits.INVALID
+            if len(message) > getattr(settings, 'CHAT_MAX_MESSAGE_LENGTH', 2000):
+                return None, chat_limits.TOO_LARGE
+        return frame, None
+
+    async def send_history(self, club_id, last_id=None):
+        """
+        Replay what the client missed: messages after last_id when given,
+        otherwise the latest CHAT_REPLAY_SIZE messages. Served from the
+        in-memory buffer, falling back to the database only for large gaps.
+        has_more tells the client to page the rest through the REST history.
+        """
+        has_more = False
+        await recent_messages.warm(club_id, self.load_recent_messages)
+        if last_id is None:
+            replay_size = getattr(settings, 'CHAT_REPLAY_SIZE', 50)
+            if recent_messages.is_warm(club_id):
+                messages = recent_messages.latest(club_id, replay_size)
+            else:
+                messages = await self.load_recent_messages(club_id, replay_size)
+        else:
+            messages = recent_messages.since(club_id, last_id)
+            if messages is None:
+                messages, has_more = await self.load_messages_since(club_id, last_id)
+        await self.send_frame(self.tag({
+            'type': 'history',
+            'messages': messages,
+            'has_more': has_more,
+        }, club_id))
+
+    async def send_presence(self, club_id):
+        """
+        The club's online users; presence frames with joined/left deltas
+        follow. Clients stay online by sending any frame (e.g. a heartbeat)
+        every PRESENCE_HEARTBEAT_SECONDS.
+        """
+        online = await club_presence.aonline(club_id)
+        # Our own join is only published on the next tick
+        online[self.user.id] = self.user.username
+        await self.send_frame(self.tag({
+            'type': 'presence',
+            'online': [{'id': user_id, 'username': username} for user_id, username in online.items()],
+            'heartbeat': getattr(settings, 'PRESENCE_HEARTBEAT_SECONDS', 25),
+        }, club_id))
+
+    async def send_typing(self, club_id):
+        if club_presence.allow_typing(club_id, self.user.id):
+            await self.channel_layer.group_send(club_group(club_id), {
+                "type": "user_typing",
+                "club": club_id,
+                "user_id": self.user.id,
+                "username": self.user.username,
+                "sender": self.channel_name,
+            })
+
+    async def post_message(self, club_id, message_text):
+        if club_id is not None and self.write_behind_enabled():
+            message_data = await self.queue_chat_message(self.user, club_id, message_text)
+        else:
+            message_data = await self.create_chat_message(self.user, club_id, message_text)
+
+        if message_data:
+            await self.channel_layer.group_send(club_group(club_id), chat_message_event(message_data))
+
+    async def chat_message(self, event):
+        message = event["message"]
+        if self.is_club_chat:
+            recent_messages.append(message["club"], message)
+        if self.encoder is None:
+            # Events from processes that predate pre-encoding carry no "text"
+            data = event.get("text") or json.dumps(message)
+        else:
+            data = self.encoder.message(message, event.get("packed"))
+        window = getattr(settings, 'CHAT_COALESCE_WINDOW_MS', 0)
+        if not window:
+            await self.send_data(data)
+            return
+        # Coalesce: messages arriving within the window go out as one batch frame
+        frame_coalescer.add(self, data, window)
+
+    async def send_data(self, data):
+        """Send an encoded frame: str as a text frame, bytes as a binary one."""
+        if isinstance(data, bytes):
+            await self.send(bytes_data=data)
+        else:
+            await self.send(text_data=data)
+
+    async def presence_delta(self, event):
+        await self.send_frame(self.tag({
+            'type': 'presence',
+            'joined': [{'id': user_id, 'username': username} for user_id, username in event['joined']],
+            'left': event['left'],
+        }, event.get('club')))
+
+    async def presence_expired(self, event):
+        # No heartbeat within PRESENCE_TIMEOUT_SECONDS; club_presence already dropped us
+        await self.close()
+
+    async def user_typing(self, event):
+        if event['sender'] == self.channel_name:
+            return
+        await self.send_frame(self.tag({
+            'type': 'typing',
+            'user': {'id': event['user_id'], 'username': event['username']},
+        }, event.get('club')))
+
+    def write_behind_enabled(self):
+        return getattr(settings, 'CHAT_WRITE_BEHIND', False) and message_writer.is_supported()
+
+    async def queue_chat_message(self, user, club_id, message_text):
+        """
+        Write-behind variant of create_chat_message: the message gets a reserved
+        id and timestamp and is broadcast before message_writer persists it.
+        Membership (and so the club) was already checked on connect.
+        """
+        pk = message_writer.take_id()
+        if pk is None:
+            pk = await database_sync_to_async(message_writer.reserve_id)()
+        message = Message(id=pk, club_id=club_id, author=user, text=message_text)
+        message_writer.enqueue(message)
+        return chat_codec.message_data(message.id, message.club_id, user.username, message.text, message.created_at)
+
+    @database_sync_to_async
+    def create_chat_message(self, user, club_id, message_text):
+        if club_id is None:
+            return None
+        try:
+            club = Club.objects.get(id=club_id)
+            message = Message.objects.create(club=club, author=user, text=message_text)
+            return chat_codec.message_data(message.id, club.id, user.username, message.text, message.created_at)
+        except Club.DoesNotExist:
+            return None
+
+    @database_sync_to_async
+    def load_recent_messages(self, club_id, limit):
+        rows = list(
+            Message.objects.filter(club_id=club_id)
+            .order_by('-created_at', '-id')
+            .values_list(*MESSAGE_COLUMNS)[:limit]
+        )
+        rows.reverse()
+        return [chat_codec.message_data(*row) for row in rows]
+
+    @database_sync_to_async
+    def load_messages_since(self, club_id, last_id):
+        limit = getattr(settings, 'CHAT_REPLAY_MAX_MESSAGES', 500)
+        queryset = Message.objects.filter(club_id=club_id)
+        anchor = queryset.filter(id=last_id).values_list('created_at', flat=True).first()
+        if anchor is None:
+            queryset = queryset.filter(id__gt=last_id)
+        else:
+            queryset = KeysetPagination().filter_after(queryset, anchor, last_id)
+        rows = list(queryset.order_by('created_at', 'id').values_list(*MESSAGE_COLUMNS)[:limit + 1])
+        return [chat_codec.message_data(*row) for row in rows[:limit]], len(rows) > limit
+
+
+class ChatConsumer(ClubChatMixin, AsyncWebsocketConsumer):
+    default_frame_type = "message"
+
+    @instrument_consumer_call
     async def connect(self):
         self.room_name = self.scope["url_route"]["kwargs"].get("room_name", "general")
         self.room_group_name = f"chat_{self.room_name}"
         self.user = self.scope["user"]
-        
+
         self.is_club_chat = self.room_name.isdigit()
         self.club_id = int(self.room_name) if self.is_club_chat else None
-        
+
         if not self.user.is_authenticated:
             await self.close()
             return
-            
+
         if self.is_club_chat:
             is_member = await self.check_club_membership(self.user, self.club_id)
             if not is_member:
@@ -28,53 +331,200 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
-        await self.accept()
+        await self.accept_chat()
+
+        if self.is_club_chat:
+            # Told when the user leaves or is removed from the club
+            await self.channel_layer.group_add(user_group(self.user.id), self.channel_name)
+            recent_messages.subscribe(self.club_id)
+            self.subscribed = True
+            club_presence.connect(self.channel_name, self.club_id, self.user.id, self.user.username)
+            await self.send_history(self.club_id, self.get_last_seen_id())
+            await self.send_presence(self.club_id)
 
     async def disconnect(self, close_code):
+        frame_coalescer.discard(self)
+        self.close_inbound()
+        if getattr(self, 'subscribed', False):
+            recent_messages.unsubscribe(self.club_id)
+            club_presence.disconnect(self.channel_name)
+            await self.channel_layer.group_discard(user_group(self.user.id), self.channel_name)
+            self.subscribed = False
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message_text = text_data_json["message"]
+    def get_last_seen_id(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            return int(query['last_id'][0])
+        except (KeyError, ValueError):
+            return None
 
-        if not self.user.is_authenticated:
-            return
-            
-        message_data = await self.create_chat_message(self.user, message_text)
+    @instrument_consumer_call
+    async def handle_frame(self, text_data_json):
+        frame_type = text_data_json.get("type", self.default_frame_type)
 
-        if message_data:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "chat_message",
-                    "message": message_data,
-                }
-            )
+        if self.is_club_chat:
+            # Every frame counts as a heartbeat
+            club_presence.heartbeat(self.channel_name)
+        if frame_type == "heartbeat":
+            return
+        if frame_type == "typing":
+            if self.is_club_chat:
+                await self.send_typing(self.club_id)
+            return
+        if frame_type != "message":
+            await self.send_error("Unknown frame type.")
+            return
 
-    async def chat_message(self, event):
-        message = event["message"]
-        await self.send(text_data=json.dumps(message))
+        # admit() checked the message of every "message" frame
+        await self.post_message(self.club_id, text_data_json["message"])
 
-    @database_sync_to_async
-    def create_chat_message(self, user, message_text):
-        if not self.is_club_chat:
-            return None
-        try:
-            club = Club.objects.get(id=self.club_id)
-            message = Message.objects.create(club=club, author=user, text=message_text)
-            return MessageSerializer(message).data
-        except Club.DoesNotExist:
-            return None
+    async def membership_changed(self, event):
+        if not event['added'] and event['club'] == self.club_id:
+            await self.close()
 
     @database_sync_to_async
     def check_club_membership(self, user, club_id):
         if user.is_superuser:
             return True
-        try:
-            club = Club.objects.get(id=club_id, is_active=True)
-            return ClubMembership.objects.filter(club=club, user=user).exists()
-        except Club.DoesNotExist:
-            return False
\ No newline at end of file
+        return club_id in membership_cache.get(user).active_club_ids
+
+
+class MultiplexChatConsumer(ClubChatMixin, AsyncWebsocketConsumer):
+    """
+    A single connection for all of a user's club chats (ws/clubs/).
+
+    Clients send {"type": "subscribe", "clubs": [ids], "last_ids": {id: last
+    seen message id}} and {"type": "unsubscribe", "clubs": [ids]}; chat
+    frames name their club: {"type": "message" | "typing", "club": id, ...}.
+    Every frame from the server other than chat messages (which already
+    carry "club") is tagged with its club. Membership of all requested
+    clubs is checked at once, and subscriptions follow the user joining or
+    being removed from clubs while connected.
+    """
+    multiplexed = True
+
+    @instrument_consumer_call
+    async def connect(self):
+        self.user = self.scope["user"]
+        self.clubs = set()
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        await self.channel_layer.group_add(user_group(self.user.id), self.channel_name)
+        await self.accept_chat()
+
+    async def disconnect(self, close_code):
+        frame_coalescer.discard(self)
+        if not self.user.is_authenticated:
+            return
+        self.close_inbound()
+        club_presence.disconnect(self.channel_name)
+        for club_id in self.clubs:
+            recent_messages.unsubscribe(club_id)
+        await asyncio.gather(*(
+            self.channel_layer.group_discard(group, self.channel_name)
+            for group in [user_group(self.user.id)] + [club_group(club_id) for club_id in self.clubs]
+        ))
+        self.clubs = set()
+
+    @instrument_consumer_call
+    async def handle_frame(self, frame):
+        frame_type = frame.get("type")
+        # Every frame counts as a heartbeat
+        club_presence.heartbeat(self.channel_name)
+        if frame_type == "heartbeat":
+            return
+        if frame_type == "subscribe":
+            last_ids = frame.get("last_ids") or {}
+            if not isinstance(last_ids, dict):
+                await self.send_rejection(chat_limits.INVALID)
+                return
+            await self.subscribe(frame.get("clubs"), last_ids)
+        elif frame_type == "unsubscribe":
+            await self.unsubscribe(self.parse_club_ids(frame.get("clubs")), reason="requested")
+        elif frame_type in ("message", "typing"):
+            club_id = frame.get("club")
+            if not self.parse_club_ids([club_id]):
+                await self.send_rejection(chat_limits.INVALID)
+            elif club_id not in self.clubs:
+                await self.send_error("Not subscribed to this club.", club_id)
+            elif frame_type == "typing":
+                await self.send_typing(club_id)
+            else:
+                # admit() checked the message of every "message" frame
+                await self.post_message(club_id, frame["message"])
+        else:
+            await self.send_error("Unknown frame type.")
+
+    def parse_club_ids(self, club_ids):
+        if not isinstance(club_ids, list):
+            return []
+        return list(dict.fromkeys(club_id for club_id in club_ids if isinstance(club_id, int) and club_id > 0))
+
+    async def subscribe(self, club_ids, last_ids):
+        requested = [club_id for club_id in self.parse_club_ids(club_ids) if club_id not in self.clubs]
+        room = getattr(settings, 'CHAT_MULTIPLEX_MAX_CLUBS', 100) - len(self.clubs)
+        allowed = await self.allowed_clubs(requested[:max(room, 0)])
+        joined = [club_id for club_id in requested if club_id in allowed]
+        denied = [club_id for club_id in requested if club_id not in allowed]
+        await self.join_clubs(joined, last_ids, denied)
+
+    async def join_clubs(self, club_ids, last_ids=None, denied=()):
+        if not isinstance(last_ids, dict):
+            last_ids = {}
+        await asyncio.gather(*(
+            self.channel_layer.group_add(club_group(club_id), self.channel_name) for club_id in club_ids
+        ))
+        for club_id in club_ids:
+            self.clubs.add(club_id)
+            recent_messages.subscribe(club_id)
+            club_presence.connect(self.channel_name, club_id, self.user.id, self.user.username)
+        await self.send_frame({
+            'type': 'subscribed',
+            'clubs': club_ids,
+            'denied': list(denied),
+            'heartbeat': getattr(settings, 'PRESENCE_HEARTBEAT_SECONDS', 25),
+        })
+        for club_id in club_ids:
+            last_id = last_ids.get(str(club_id))
+            await self.send_history(club_id, last_id if isinstance(last_id, int) else None)
+            await self.send_presence(club_id)
+
+    async def unsubscribe(self, club_ids, reason):
+        club_ids = [club_id for club_id in club_ids if club_id in self.clubs]
+        if not club_ids:
+            return
+        for club_id in club_ids:
+            self.clubs.discard(club_id)
+            recent_messages.unsubscribe(club_id)
+        club_presence.disconnect(self.channel_name, club_ids)
+        await asyncio.gather(*(
+            self.channel_layer.group_discard(club_group(club_id), self.channel_name) for club_id in club_ids
+        ))
+        await self.send_frame({'type': 'unsubscribed', 'clubs': club_ids, 'reason': reason})
+
+    async def membership_changed(self, event):
+        club_id = event['club']
+        if not event['added']:
+            await self.unsubscribe([club_id], reason="removed")
+        elif club_id not in self.clubs and len(self.clubs) < getattr(settings, 'CHAT_MULTIPLEX_MAX_CLUBS', 100):
+            # Checked against the database: this process's membership cache may not have caught up yet
+            if await self.is_active_member(club_id):
+                await self.join_clubs([club_id])
+
+    @database_sync_to_async
+    def allowed_clubs(self, club_ids):
+        """The clubs among club_ids whose chat the user may join, with at most one query."""
+        if not club_ids:
+            return set()
+        if self.user.is_superuser:
+            return set(Club.objects.filter(id__in=club_ids).values_list('id', flat=True))
+        return membership_cache.get(self.user).active_club_ids.intersection(club_ids)
+
+    @database_sync_to_async
+    def is_active_member(self, club_id):
+        return ClubMembership.objects.filter(user=self.user, club_id=club_id, club__is_active=True).exists()
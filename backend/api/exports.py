@@ -0,0 +1,152 @@
+import csv
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from . import archive, models
+
+# Export name -> (model, timestamp field filtered by ?start=/?end=, output column -> values() lookup)
+EXPORTS = {
+    'messages': (models.Message, 'created_at', {
+        'id': 'id',
+        'author': 'author__username',
+        'text': 'text',
+        'created_at': 'created_at',
+    }),
+    'posts': (models.Post, 'created_at', {
+        'id': 'id',
+        'author': 'author__username',
+        'content': 'content',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }),
+    'members': (models.ClubMembership, 'joined_at', {
+        'user_id': 'user_id',
+        'username': 'user__username',
+        'email': 'user__email',
+        'is_subadmin': 'is_subadmin',
+        'joined_at': 'joined_at',
+    }),
+}
+
+# Rows fetched from the database at a time, and bytes buffered per chunk sent
+CHUNK_ROWS = 2000
+CHUNK_BYTES = 64 * 1024
+
+
+class TextExportRenderer(BaseRenderer):
+    """
+    Selects the export format through content negotiation (?format= or
+    Accept). The exports themselves are streamed by the view; this only
+    renders errors, as JSON like every other API error.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data, renderer_context=renderer_context)
+
+
+class NDJSONRenderer(TextExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class CSVRenderer(TextExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+def rows(name, club_id, start=None, end=None, chunk_size=CHUNK_ROWS):
+    """
+    Stream an export's rows as tuples, oldest first. values_list() plus
+    iterator() keeps memory flat: no model instances, and rows are fetched
+    from the database chunk_size at a time.
+    """
+    model, timestamp, columns = EXPORTS[name]
+    queryset = model.objects.filter(club_id=club_id)
+    if start is not None:
+        queryset = queryset.filter(**{f'{timestamp}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{timestamp}__lt': end})
+    queryset = queryset.order_by(timestamp, 'id').values_list(*columns.values())
+    if name == 'messages':
+        # Archived messages are older than any left in the table
+        return itertools.chain(archive.export_rows(club_id, start, end), queryset.iterator(chunk_size=chunk_size))
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def columns(name):
+    return list(EXPORTS[name][2])
+
+
+def format_value(value):
+    """Datetimes as ISO 8601 with a Z suffix for UTC, like the REST API renders them."""
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+    return value
+
+
+def ndjson_lines(names, rows):
+    encoder = json.JSONEncoder(ensure_ascii=False, default=format_value)
+    for row in rows:
+        yield encoder.encode(dict(zip(names, row))) + '\n'
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes, instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(names, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow([format_value(value) for value in row])
+
+
+def chunked(lines, size=CHUNK_BYTES):
+    """Join lines into chunks of about `size` bytes, so each write carries many rows."""
+    buffer, buffered = [], 0
+    for line in lines:
+        encoded = line.encode()
+        buffer.append(encoded)
+        buffered += len(encoded)
+        if buffered >= size:
+            yield b''.join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+async def _aiterate(iterator):
+    # Each chunk is produced in the thread-sensitive sync thread, so the
+    # database cursor is always used from the thread that opened it.
+    sentinel = object()
+    get_next = sync_to_async(next, thread_sensitive=True)
+    while True:
+        chunk = await get_next(iterator, sentinel)
+        if chunk is sentinel:
+            return
+        yield chunk
+
+
+def streaming_response(request, chunks, content_type):
+    """
+    A StreamingHttpResponse that stays streaming under both handlers.
+    Django's ASGI handler would buffer a plain iterator in full (and the
+    WSGI handler an async one), so hand it the matching kind.
+    """
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = _aiterate(iter(chunks))
+    return StreamingHttpResponse(chunks, content_type=content_type)
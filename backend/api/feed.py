@@ -0,0 +1,245 @@
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import Coalesce, RowNumber
+
+from . import models
+from .membership_cache import membership_cache
+
+POST = 'post'
+EVENT = 'event'
+KINDS = (POST, EVENT)
+
+# One feed item. pk is the tie-breaker for equal created_at, id * 2 for posts
+# and id * 2 + 1 for events, so timeline rows and posts/events read straight
+# from large clubs interleave the same way (and KeysetPagination's cursor
+# helpers apply as-is).
+FeedItem = namedtuple('FeedItem', ['created_at', 'pk', 'kind', 'object_id'])
+
+_timeline_writes_since_trim = 0
+_untrimmed_user_ids = set()
+_trim_lock = threading.Lock()
+
+
+def fanout_max_members():
+    return getattr(settings, 'FEED_FANOUT_MAX_MEMBERS', 1000)
+
+
+def timeline_size():
+    return getattr(settings, 'FEED_TIMELINE_SIZE', 500)
+
+
+def club_size_cache_key(club_id):
+    return f'club-size:v1:{club_id}'
+
+
+def club_sizes(club_ids):
+    """Member counts of the given clubs, cached for FEED_CLUB_SIZE_CACHE_TIMEOUT. Returns {club_id: count}."""
+    keys = {club_size_cache_key(club_id): club_id for club_id in club_ids}
+    sizes = {keys[key]: size for key, size in cache.get_many(keys).items()}
+    missing = [club_id for club_id in club_ids if club_id not in sizes]
+    if missing:
+        counted = dict(
+            models.ClubMembership.objects.filter(club_id__in=missing)
+            .values_list('club_id').annotate(members=Count('id')).order_by()
+        )
+        fresh = {club_id: counted.get(club_id, 0) for club_id in missing}
+        cache.set_many(
+            {club_size_cache_key(club_id): size for club_id, size in fresh.items()},
+            getattr(settings, 'FEED_CLUB_SIZE_CACHE_TIMEOUT', 300),
+        )
+        sizes.update(fresh)
+    return sizes
+
+
+def read_side_club_ids(club_ids):
+    """The clubs too large to fan out to, whose posts and events are merged in when a feed is read."""
+    limit = fanout_max_members()
+    return [club_id for club_id, size in club_sizes(club_ids).items() if size > limit]
+
+
+def _entry(user_id, club_id, kind, object_id, created_at):
+    field = 'post_id' if kind == POST else 'event_id'
+    return models.TimelineEntry(user_id=user_id, club_id=club_id, created_at=created_at, **{field: object_id})
+
+
+def fan_out(instance):
+    """
+    Add a new post or event to the timeline of every member of its club.
+    Returns the number of timelines written; 0 for clubs above
+    FEED_FANOUT_MAX_MEMBERS, which are served on read instead.
+    """
+    kind = POST if isinstance(instance, models.Post) else EVENT
+    limit = fanout_max_members()
+    user_ids = list(
+        models.ClubMembership.objects.filter(club_id=instance.club_id).values_list('user_id', flat=True)[:limit + 1]
+    )
+    if len(user_ids) > limit:
+        return 0
+    models.TimelineEntry.objects.bulk_create(
+        [_entry(user_id, instance.club_id, kind, instance.id, instance.created_at) for user_id in user_ids],
+        batch_size=500,
+    )
+    _note_timeline_writes(user_ids)
+    return len(user_ids)
+
+
+def backfill(user_ids, club_id):
+    """
+    Seed new members' timelines with the club's recent posts and events
+    (FEED_BACKFILL_SIZE of each).
+    """
+    if not user_ids or read_side_club_ids([club_id]):
+        return
+    size = getattr(settings, 'FEED_BACKFILL_SIZE', 20)
+    recent = []
+    for model, kind in ((models.Post, POST), (models.Event, EVENT)):
+        rows = model.objects.filter(club_id=club_id).order_by('-created_at', '-id').values_list('id', 'created_at')
+        recent.extend((kind, object_id, created_at) for object_id, created_at in rows[:size])
+    remove(user_ids, club_id)
+    models.TimelineEntry.objects.bulk_create(
+        [_entry(user_id, club_id, *item) for user_id in user_ids for item in recent],
+        batch_size=500,
+    )
+
+
+def remove(user_ids, club_id):
+    """Drop a club's items from (former) members' timelines."""
+    models.TimelineEntry.objects.filter(user_id__in=user_ids, club_id=club_id).delete()
+
+
+def _note_timeline_writes(user_ids):
+    # Trimming every timeline on every write would cost more than the writes,
+    # so the timelines written since the last trim are trimmed in one go
+    # every FEED_TRIM_EVERY fan-outs (per process).
+    global _timeline_writes_since_trim
+    with _trim_lock:
+        _untrimmed_user_ids.update(user_ids)
+        _timeline_writes_since_trim += 1
+        if _timeline_writes_since_trim < getattr(settings, 'FEED_TRIM_EVERY', 100):
+            return
+        _timeline_writes_since_trim = 0
+        user_ids = list(_untrimmed_user_ids)
+        _untrimmed_user_ids.clear()
+    transaction.on_commit(lambda: trim_timelines(user_ids))
+
+
+def trim_timelines(user_ids, chunk_size=500):
+    """
+    Keep only the newest FEED_TIMELINE_SIZE entries of each given timeline.
+    Returns the number of entries deleted.
+    """
+    deleted = 0
+    for start in range(0, len(user_ids), chunk_size):
+        overflow = (
+            models.TimelineEntry.objects.filter(user_id__in=user_ids[start:start + chunk_size])
+            .annotate(position=Window(RowNumber(), partition_by=F('user_id'), order_by=[F('created_at').desc(), F('id').desc()]))
+            .filter(position__gt=timeline_size())
+            .values('id')
+        )
+        deleted += models.TimelineEntry.objects.filter(id__in=overflow).delete()[0]
+    return deleted
+
+
+def rebuild_timelines():
+    """
+    Recompute every timeline from the posts and events tables, e.g. after
+    seeding with bulk_create (which skips the fan-out signals). Returns the
+    number of entries written.
+    """
+    table = models.TimelineEntry._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (user_id, club_id, post_id, event_id, created_at)
+            SELECT user_id, club_id, post_id, event_id, created_at FROM (
+                SELECT m.user_id, items.club_id, items.post_id, items.event_id, items.created_at,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY m.user_id ORDER BY items.created_at DESC, items.sort_key DESC
+                       ) AS position
+                FROM api_clubmembership m
+                JOIN (
+                    SELECT club_id, id AS post_id, NULL AS event_id, created_at, id * 2 AS sort_key FROM api_post
+                    UNION ALL
+                    SELECT club_id, NULL, id, created_at, id * 2 + 1 FROM api_event
+                ) items ON items.club_id = m.club_id
+                WHERE m.club_id IN (
+                    SELECT club_id FROM api_clubmembership GROUP BY club_id HAVING COUNT(*) <= %s
+                )
+            ) ranked
+            WHERE position <= %s
+            """,
+            [fanout_max_members(), timeline_size()],
+        )
+        return cursor.rowcount
+
+
+def _page(queryset, before, limit):
+    if before is not None:
+        created_at, pk = before
+        queryset = queryset.filter(created_at__lte=created_at).filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, sort_key__lt=pk)
+        )
+    return queryset.order_by('-created_at', '-sort_key')[:limit]
+
+
+def get_feed(user, before=None, limit=20, kinds=KINDS):
+    """
+    The newest posts and events of the user's clubs, older than the
+    (created_at, pk) cursor `before` if given. Reads the user's timeline plus,
+    for clubs too large to fan out to, their posts and events directly.
+    Returns ([(FeedItem, instance), ...], has_more).
+    """
+    club_ids = membership_cache.get(user).club_ids
+    if not club_ids:
+        return [], False
+    large_club_ids = read_side_club_ids(club_ids)
+
+    entries = models.TimelineEntry.objects.filter(user=user).annotate(
+        sort_key=Coalesce(F('post_id') * 2, F('event_id') * 2 + 1)
+    )
+    if large_club_ids:
+        # Also hides entries fanned out before the club grew past the limit
+        entries = entries.exclude(club_id__in=large_club_ids)
+    if kinds == (POST,):
+        entries = entries.filter(post__isnull=False)
+    elif kinds == (EVENT,):
+        entries = entries.filter(event__isnull=False)
+    items = [
+        FeedItem(created_at, sort_key, POST if post_id else EVENT, post_id or event_id)
+        for created_at, sort_key, post_id, event_id
+        in _page(entries, before, limit + 1).values_list('created_at', 'sort_key', 'post_id', 'event_id')
+    ]
+
+    if large_club_ids:
+        for model, kind, tie_break in ((models.Post, POST, 0), (models.Event, EVENT, 1)):
+            if kind not in kinds:
+                continue
+            rows = model.objects.filter(club_id__in=large_club_ids).annotate(sort_key=F('id') * 2 + tie_break)
+            items.extend(
+                FeedItem(created_at, sort_key, kind, object_id)
+                for created_at, sort_key, object_id in _page(rows, before, limit + 1).values_list('created_at', 'sort_key', 'id')
+            )
+        items = sorted(set(items), key=lambda item: (item.created_at, item.pk), reverse=True)
+
+    has_more = len(items) > limit
+    items = items[:limit]
+    instances = _load(items)
+    return [(item, instances[item.kind, item.object_id]) for item in items if (item.kind, item.object_id) in instances], has_more
+
+
+def _load(items):
+    ids = {kind: [item.object_id for item in items if item.kind == kind] for kind in KINDS}
+    instances = {}
+    if ids[POST]:
+        posts = models.Post.objects.select_related('author', 'club').filter(id__in=ids[POST])
+        instances.update(((POST, post.id), post) for post in posts)
+    if ids[EVENT]:
+        events = models.Event.objects.select_related('club').filter(id__in=ids[EVENT])
+        instances.update(((EVENT, event.id), event) for event in events)
+    return instances
@@ -0,0 +1,140 @@
+import hashlib
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+from . import models
+
+TOKEN_SALT = 'api.ical.feed'
+
+
+class ICalendarRenderer(BaseRenderer):
+    """
+    Lets content negotiation accept calendar clients (Accept: text/calendar).
+    Feeds themselves are streamed by the view; this only renders errors.
+    """
+    media_type = 'text/calendar'
+    format = 'ics'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and 'detail' in data:
+            data = data['detail']
+        return str(data or '').encode(self.charset)
+
+
+def feed_token(user):
+    """Signed token standing in for the user's credentials in their calendar URL."""
+    return signing.dumps(user.id, salt=TOKEN_SALT)
+
+
+def user_for_token(token):
+    try:
+        user_id = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        return None
+    return models.User.objects.filter(id=user_id, is_active=True).first()
+
+
+# --- Conditional GET ---
+# Each club has a version stamp (ns since the epoch) in the cache, bumped by the
+# signal handlers whenever one of its events, or anything else shown in the
+# feed, changes. Validators are derived from the stamps alone, so answering a
+# poll with 304 Not Modified doesn't touch the events table.
+
+def version_cache_key(club_id):
+    return f'calendar-version:v1:{club_id}'
+
+
+def club_versions(club_ids):
+    keys = {version_cache_key(club_id): club_id for club_id in club_ids}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    missing = {version_cache_key(club_id): time.time_ns() for club_id in club_ids if club_id not in versions}
+    if missing:
+        # An evicted stamp just makes clients download the feed once more
+        cache.set_many(missing, None)
+        versions.update((keys[key], version) for key, version in missing.items())
+    return versions
+
+
+def bump_versions(*club_ids):
+    """Mark the feeds of the given clubs as changed, now and once the transaction commits."""
+    keys = [version_cache_key(club_id) for club_id in club_ids if club_id is not None]
+    if not keys:
+        return
+    cache.set_many({key: time.time_ns() for key in keys}, None)
+    transaction.on_commit(lambda: cache.set_many({key: time.time_ns() for key in keys}, None))
+
+
+def validators(scope, club_ids):
+    """(ETag, Last-Modified timestamp) of a feed over the given clubs."""
+    versions = club_versions(club_ids)
+    digest = hashlib.sha1(repr((scope, sorted(versions.items()))).encode()).hexdigest()
+    last_modified = max(versions.values(), default=0) // 1_000_000_000
+    return f'"{digest}"', last_modified
+
+
+# --- Serialization (RFC 5545) ---
+
+def escape(text):
+    return (
+        (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """Fold a content line at 75 octets, without splitting a UTF-8 sequence."""
+    if len(line.encode()) <= 75:
+        return line + '\r\n'
+    parts, current, size = [], '', 0
+    for char in line:
+        width = len(char.encode())
+        if size + width > 75:
+            parts.append(current)
+            current, size = ' ', 1
+        current += char
+        size += width
+    parts.append(current)
+    return '\r\n'.join(parts) + '\r\n'
+
+
+def format_datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def stream(name, club_ids, chunk_size=500):
+    """
+    Yield the feed's lines: the events of the given clubs from
+    CALENDAR_PAST_DAYS ago onwards, read in chunks so memory stays flat
+    however many events there are.
+    """
+    yield fold('BEGIN:VCALENDAR')
+    yield fold('VERSION:2.0')
+    yield fold('PRODID:-//Venti//Club events//EN')
+    yield fold('CALSCALE:GREGORIAN')
+    yield fold(f'X-WR-CALNAME:{escape(name)}')
+    since = timezone.now() - timedelta(days=getattr(settings, 'CALENDAR_PAST_DAYS', 30))
+    events = (
+        models.Event.objects.filter(club_id__in=club_ids, date__gte=since)
+        .order_by('date', 'id')
+        .values_list('id', 'title', 'description', 'date', 'created_at', 'club__name')
+    )
+    for event_id, title, description, date, created_at, club_name in events.iterator(chunk_size=chunk_size):
+        yield (
+            fold('BEGIN:VEVENT')
+            + fold(f'UID:event-{event_id}@venti')
+            + fold(f'DTSTAMP:{format_datetime(created_at)}')
+            + fold(f'DTSTART:{format_datetime(date)}')
+            + fold(f'SUMMARY:{escape(title)}')
+            + (fold(f'DESCRIPTION:{escape(description)}') if description else '')
+            + fold(f'CATEGORIES:{escape(club_name)}')
+            + fold('END:VEVENT')
+        )
+    yield fold('END:VCALENDAR')
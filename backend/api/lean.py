@@ -0,0 +1,81 @@
+from operator import attrgetter
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.response import Response
+
+# Lean read path for list endpoints: rows are fetched with values_list() and
+# turned into response dicts by a RowEncoder instead of a ModelSerializer,
+# skipping model instances, lazy related lookups and DRF's per-field calls.
+# Each encoder must produce exactly what its serializer does; benchmark_api
+# and api.tests.LeanListResponseTests compare the two renderings.
+
+
+def is_enabled():
+    return getattr(settings, 'LEAN_LIST_RESPONSES', True)
+
+
+def format_datetime(value):
+    """
+    A datetime the way DRF's DateTimeField renders it. Nothing activates a
+    timezone, so the current one is always the default; looking that up
+    directly skips the context-local lookup, most of DRF's cost here.
+    """
+    if value is None:
+        return None
+    value = value.astimezone(timezone.get_default_timezone()).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+class RowEncoder:
+    """
+    Maps values_list() rows to output dicts. Fields are (output key,
+    lookup) or (output key, lookup, convert) tuples, in output order.
+
+    encode() is generated once from the fields, so a row costs one dict
+    display with the converters inlined rather than a loop over fields.
+    """
+
+    def __init__(self, *fields):
+        self.keys = [field[0] for field in fields]
+        self.lookups = [field[1] for field in fields]
+        namespace = {}
+        items = []
+        for index, field in enumerate(fields):
+            value = f'row[{index}]'
+            if len(field) > 2:
+                namespace[f'convert_{index}'] = field[2]
+                value = f'convert_{index}({value})'
+            items.append(f'{field[0]!r}: {value}')
+        exec(f'def encode(row):\n    return {{{", ".join(items)}}}\n', namespace)
+        self.encode = namespace['encode']
+        # Model instances mixed into a page (e.g. archived messages) are read attribute by attribute
+        self._instance_row = attrgetter(*[lookup.replace('__', '.') for lookup in self.lookups])
+
+    def rows(self, queryset, named=False):
+        return queryset.values_list(*self.lookups, named=named)
+
+    def encode_all(self, rows):
+        encode, instance_row = self.encode, self._instance_row
+        return [encode(row if isinstance(row, tuple) else instance_row(row)) for row in rows]
+
+
+class LeanListMixin:
+    """
+    List through `lean_encoder` instead of the serializer while
+    LEAN_LIST_RESPONSES is on. Pagination still applies: paginators get
+    named rows, so cursors can read row.pk and row.created_at.
+    """
+    lean_encoder = None
+
+    def list(self, request, *args, **kwargs):
+        if self.lean_encoder is None or not is_enabled():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = self.lean_encoder.rows(queryset, named=self.paginator is not None)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.lean_encoder.encode_all(page))
+        return Response(self.lean_encoder.encode_all(rows))
@@ -0,0 +1,37 @@
+# api/management/commands/archive_messages.py
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api import archive
+from api.models import Message
+
+class Command(BaseCommand):
+    help = ('Moves chat messages older than a cutoff out of the database into compressed per-club, per-month '
+            'segment files, which the message history API reads through into')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 180),
+                            help='Archive messages created more than this many days ago')
+        parser.add_argument('--club', type=int, action='append', dest='clubs',
+                            help='Only archive this club (repeatable)')
+        parser.add_argument('--segment-rows', type=int, default=None, help='Most messages per segment file')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many messages would be moved')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['older_than_days'])
+        club_ids = Message.objects.filter(created_at__lt=before).values_list('club_id', flat=True).distinct().order_by('club_id')
+        if options['clubs']:
+            club_ids = club_ids.filter(club_id__in=options['clubs'])
+        started = time.monotonic()
+        total = 0
+        for club_id in list(club_ids):
+            if options['dry_run']:
+                moved = Message.objects.filter(club_id=club_id, created_at__lt=before).count()
+            else:
+                moved = archive.archive_club(club_id, before, options['segment_rows'])
+            self.stdout.write(f'Club {club_id}: {moved} messages')
+            total += moved
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(f'{verb} {total} messages older than {before:%Y-%m-%d} in {time.monotonic() - started:.2f}s')
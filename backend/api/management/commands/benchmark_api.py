@@ -0,0 +1,72 @@
+# api/management/commands/benchmark_api.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from api import benchmarks
+
+class Command(BaseCommand):
+    help = ('Benchmarks the REST endpoints against a seeded test database, reporting latency and SQL per '
+            'request, and fails when a query budget is exceeded, the p95 regresses against a baseline or a '
+            'lean list response differs from the serializer\'s')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--clubs', type=int, default=20)
+        parser.add_argument('--members-per-club', type=int, default=30)
+        parser.add_argument('--messages-per-club', type=int, default=500)
+        parser.add_argument('--posts-per-club', type=int, default=20)
+        parser.add_argument('--events-per-club', type=int, default=5)
+        parser.add_argument('--skew', type=float, default=1.0)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--iterations', type=int, default=20, help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per endpoint')
+        parser.add_argument('--endpoint', action='append', dest='endpoints', choices=list(benchmarks.ENDPOINTS),
+                            help='Only benchmark this endpoint (repeatable)')
+        parser.add_argument('--budgets', default=str(benchmarks.BUDGETS), help='JSON file of per-endpoint query budgets')
+        parser.add_argument('--baseline', help='Baseline JSON from a previous --save run to compare against')
+        parser.add_argument('--max-regression', type=float, default=0.25,
+                            help='Allowed p95 slowdown against the baseline (0.25 = 25%%)')
+        parser.add_argument('--save', help='Write the results to this JSON file (e.g. a new baseline)')
+        parser.add_argument('--use-current-db', action='store_true',
+                            help="Benchmark the configured database as-is instead of seeding a throwaway test database")
+
+    def handle(self, *args, **options):
+        if options['use_current_db']:
+            results, mismatches = self.benchmark(options)
+        else:
+            # Same isolation as `manage.py test`: a fresh test database, destroyed afterwards
+            setup_test_environment()
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                benchmarks.seed(
+                    users=options['users'], clubs=options['clubs'],
+                    members_per_club=options['members_per_club'], messages_per_club=options['messages_per_club'],
+                    posts_per_club=options['posts_per_club'], events_per_club=options['events_per_club'],
+                    skew=options['skew'], seed=options['seed'],
+                )
+                results, mismatches = self.benchmark(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        if options['save']:
+            benchmarks.dump_json(results, options['save'])
+            self.stdout.write(f"Results written to {options['save']}")
+
+        budgets = benchmarks.load_json(options['budgets']) if options['budgets'] else None
+        baseline = benchmarks.load_json(options['baseline']) if options['baseline'] else None
+        failures = benchmarks.check(results, budgets, baseline, options['max_regression']) + mismatches
+        if failures:
+            raise CommandError('Benchmark failed:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS('All endpoints within budget.'))
+
+    def benchmark(self, options):
+        results = benchmarks.run(options['iterations'], options['warmup'], options['endpoints'])
+        self.stdout.write(f"{'endpoint':<18} {'p50 ms':>8} {'p95 ms':>8} {'queries':>8} {'sql ms':>8}")
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<18} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['queries']:>8} {stats['sql_ms']:>8.2f}"
+            )
+        # The lean list responses must match the serializers byte for byte
+        return results, benchmarks.compare_lean(options['endpoints'])
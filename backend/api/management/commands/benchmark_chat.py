@@ -0,0 +1,23 @@
+# api/management/commands/benchmark_chat.py
+from django.core.management.base import BaseCommand
+from api import benchmarks
+
+class Command(BaseCommand):
+    help = ('Measures the CPU cost per delivered chat message of the websocket broadcast path, with '
+            'per-subscriber encoding, pre-encoded group events and coalesced frames')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=2000, help='Club chat connections in this process')
+        parser.add_argument('--messages', type=int, default=100, help='Messages broadcast to the club')
+        parser.add_argument('--rate', type=float, default=50, help='Messages per second (0 = back to back)')
+        parser.add_argument('--window-ms', type=int, default=100, help='Coalescing window to compare against')
+
+    def handle(self, *args, **options):
+        results = benchmarks.run_broadcast(
+            options['subscribers'], options['messages'], options['rate'], options['window_ms'],
+        )
+        self.stdout.write(f"{'mode':<18} {'deliveries':>11} {'frames':>9} {'cpu us/msg':>11}")
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<18} {stats['deliveries']:>11} {stats['frames']:>9} {stats['cpu_us_per_delivery']:>11.2f}"
+            )
@@ -0,0 +1,20 @@
+# api/management/commands/benchmark_chat_protocol.py
+from django.core.management.base import BaseCommand
+from api import benchmarks
+
+class Command(BaseCommand):
+    help = ('Compares chat message frames as JSON through MessageSerializer, lean JSON and MessagePack: '
+            'bytes on the wire and encoding CPU per message')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10000, help='Messages to encode')
+        parser.add_argument('--authors', type=int, default=50, help='Distinct message authors')
+        parser.add_argument('--subscribers', type=int, default=100, help='Connections each message is completed for')
+
+    def handle(self, *args, **options):
+        results = benchmarks.run_chat_protocol(options['messages'], options['authors'], options['subscribers'])
+        self.stdout.write(f"{'encoding':<18} {'bytes/msg':>10} {'sender us/msg':>14} {'per-conn us/msg':>16}")
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<18} {stats['bytes_per_message']:>10.1f} {stats['sender_us']:>14.2f} {stats['subscriber_us']:>16.2f}"
+            )
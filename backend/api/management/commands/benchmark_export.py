@@ -0,0 +1,60 @@
+# api/management/commands/benchmark_export.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from api import benchmarks
+
+class Command(BaseCommand):
+    help = ('Streams growing slices of one very large club chat log through the export endpoint, reporting '
+            'throughput and peak Python memory, and fails when the peak exceeds --max-peak-mb. Timings include '
+            'the overhead of tracemalloc, which slows the export several times over')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2_000_000, help='Chat messages in the benchmarked club')
+        parser.add_argument('--members', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--format', action='append', dest='formats', choices=['ndjson', 'csv'],
+                            help='Only benchmark this format (repeatable)')
+        parser.add_argument('--max-peak-mb', type=float, default=16.0,
+                            help='Largest allowed peak of traced Python memory during any one export')
+        parser.add_argument('--use-current-db', action='store_true',
+                            help="Benchmark the configured database as-is instead of seeding a throwaway test database")
+
+    def handle(self, *args, **options):
+        if options['use_current_db']:
+            results = self.benchmark(options)
+        else:
+            setup_test_environment()
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                # A single club; seed_data only fills active clubs, which the default seed makes it
+                benchmarks.seed(
+                    users=options['members'], clubs=1, members_per_club=options['members'],
+                    messages_per_club=options['messages'], posts_per_club=0, events_per_club=0,
+                    seed=options['seed'],
+                )
+                results = self.benchmark(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        over = [
+            f'{export_format} {fraction:.0%}: peak {stats["peak_mb"]:.1f}MB'
+            for (export_format, fraction), stats in results.items() if stats['peak_mb'] > options['max_peak_mb']
+        ]
+        if over:
+            raise CommandError(f"Export memory above {options['max_peak_mb']}MB:\n  " + '\n  '.join(over))
+        self.stdout.write(self.style.SUCCESS('Peak memory within budget for every export.'))
+
+    def benchmark(self, options):
+        if benchmarks.pick_targets()[1] is None:
+            raise CommandError('No active club with messages to export; try another --seed')
+        results = benchmarks.run_export(formats=options['formats'] or ('ndjson', 'csv'))
+        self.stdout.write(f"{'format':<8} {'slice':>6} {'rows':>10} {'MB':>8} {'seconds':>8} {'rows/s':>10} {'peak MB':>8}")
+        for (export_format, fraction), stats in results.items():
+            self.stdout.write(
+                f"{export_format:<8} {fraction:>6.0%} {stats['rows']:>10} {stats['mb']:>8.1f} {stats['seconds']:>8.2f} "
+                f"{stats['rows_per_s']:>10} {stats['peak_mb']:>8.2f}"
+            )
+        return results
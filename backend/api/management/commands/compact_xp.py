@@ -0,0 +1,24 @@
+# api/management/commands/compact_xp.py
+import time
+from django.core.management.base import BaseCommand
+from api import services
+
+class Command(BaseCommand):
+    help = 'Compacts the XP ledger into user totals and rebuilds the leaderboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running, compacting every INTERVAL seconds')
+        parser.add_argument('--skip-rankings', action='store_true',
+                            help='Only compact the ledger, leave the leaderboards as they are')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            applied = services.compact_xp()
+            if not options['skip_rankings']:
+                services.rebuild_leaderboards()
+            self.stdout.write(f'Applied {applied} XP events in {time.monotonic() - started:.2f}s')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,12 @@
+# api/management/commands/rebuild_timelines.py
+import time
+from django.core.management.base import BaseCommand
+from api import feed
+
+class Command(BaseCommand):
+    help = 'Rebuilds every activity feed timeline from the posts and events tables'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = feed.rebuild_timelines()
+        self.stdout.write(f'Wrote {written} timeline entries in {time.monotonic() - started:.2f}s')
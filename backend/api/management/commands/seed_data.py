@@ -1,30 +1,77 @@
 # api/management/commands/seed_data.py
 import random
+import time
 from faker import Faker
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
 from django.utils import timezone
 from datetime import timedelta
-from api.models import User, Club, ClubMembership, Post, Event, Message
+from api import feed
+from api.models import User, Club, ClubMembership, Post, Event, Message, XPEvent, LeaderboardEntry, TimelineEntry
 
 class Command(BaseCommand):
-    help = 'Seeds the database with realistic test data'
+    help = 'Seeds the database with realistic test data (use the size options for benchmark datasets)'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Regular users to create')
+        parser.add_argument('--clubs', type=int, default=5, help='Clubs to create')
+        parser.add_argument('--members-per-club', type=int, default=4, help='Average members per active club')
+        parser.add_argument('--messages-per-club', type=int, default=10, help='Average chat messages per active club')
+        parser.add_argument('--posts-per-club', type=int, default=3, help='Average posts per active club')
+        parser.add_argument('--events-per-club', type=int, default=2, help='Average upcoming events per active club')
+        parser.add_argument('--skew', type=float, default=0.0,
+                            help='Power-law exponent for club popularity (0 = uniform, ~1 = Zipf)')
+        parser.add_argument('--history-days', type=int, default=90, help='Spread chat messages over this many days')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for a reproducible dataset')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create batch')
+
+    def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting database seeding...'))
-        
+        self.rng = random.Random(options['seed'])
+        self.fake = Faker()
+        if options['seed'] is not None:
+            self.fake.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        started = time.monotonic()
+
         # Clean slate
         self.stdout.write('Deleting old data...')
-        User.objects.exclude(is_superuser=True).delete()
-        Club.objects.all().delete()
-        Post.objects.all().delete()
-        Event.objects.all().delete()
-        Message.objects.all().delete()
+        self.delete_old_data()
+
+        superuser = self.create_superuser()
+        users = [superuser] + self.create_users(options['users'])
+        clubs = self.create_clubs(options['clubs'], users)
+        active_clubs = [c for c in clubs if c.is_active]
+
+        weights = self.popularity(len(active_clubs), options['skew'])
+        members = self.create_memberships(active_clubs, users, weights, options['members_per_club'])
+        self.create_posts(active_clubs, members, weights, options['posts_per_club'])
+        self.create_events(active_clubs, weights, options['events_per_club'])
+        self.create_messages(active_clubs, members, weights, options['messages_per_club'], options['history_days'])
+        self.stdout.write(f'{feed.rebuild_timelines()} timeline entries created.')
 
-        fake = Faker()
+        # Rows were written with bulk_create / raw deletes, which skip the cache-invalidating and fan-out signals
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f'Database seeding completed successfully in {time.monotonic() - started:.1f}s!'
+        ))
 
-        # Create Superuser
+    def delete_old_data(self):
+        # Plain DELETE statements skip per-row signals and cascade collection, which
+        # is what makes clearing a multi-million row dataset take minutes. Children
+        # go before the tables they reference.
+        with connection.cursor() as cursor:
+            for model in (Message, XPEvent, LeaderboardEntry, TimelineEntry, Post, Event, ClubMembership):
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+        Club.objects.all().delete()
+        User.objects.exclude(is_superuser=True).delete()
+
+    def create_superuser(self):
         superuser, created = User.objects.get_or_create(
-            username='admin', 
+            username='admin',
             defaults={
                 'email': 'admin@venti.com',
                 'is_staff': True,
@@ -35,72 +82,131 @@ class Command(BaseCommand):
             superuser.set_password('adminpass')
             superuser.save()
             self.stdout.write(self.style.SUCCESS('Superuser "admin" created with password "adminpass"'))
+        return superuser
 
-        # Create Regular Users
-        users = [superuser]
-        for _ in range(10):
-            username = fake.user_name()
-            user, created = User.objects.get_or_create(
-                username=username,
-                defaults={'email': fake.email()}
-            )
-            if created:
-                user.set_password('password')
-                user.save()
-            users.append(user)
-        self.stdout.write(f'{len(users)} users created.')
-
-        # Create Clubs
-        clubs = []
+    def create_users(self, count):
+        # Hashing is deliberately slow, so hash the shared password once
+        password = make_password('password')
+        rows = (
+            User(username=f'{self.fake.user_name()}{i}', email=f'user{i}@example.com', password=password)
+            for i in range(count)
+        )
+        self.bulk_insert(User, rows, count)
+        return list(User.objects.filter(is_superuser=False).order_by('id'))
+
+    def create_clubs(self, count, users):
         club_names = ['Tech Innovators', 'Book Worms Society', 'Hiking Adventures', 'Future Entrepreneurs', 'Code & Coffee']
-        for name in club_names:
-            admin = random.choice(users)
-            club = Club.objects.create(
-                name=name,
-                description=fake.paragraph(nb_sentences=3),
-                admin=admin,
-                is_active=random.choice([True, True, False]) # More likely to be active
-            )
+        rows = []
+        for i in range(count):
+            name = club_names[i] if i < len(club_names) else f'{self.fake.catch_phrase()} Club'
+            is_active = self.rng.choice([True, True, False]) # More likely to be active
+            rows.append(Club(
+                name=name[:150],
+                description=self.fake.paragraph(nb_sentences=3),
+                admin=self.rng.choice(users),
+                is_active=is_active,
+                approved_date=self.now if is_active else None,
+            ))
+        self.bulk_insert(Club, rows, count)
+        return list(Club.objects.order_by('id'))
+
+    def popularity(self, count, skew):
+        """
+        Relative popularity of each club: 1 / rank**skew, normalised so the
+        average weight is 1 and the per-club options stay averages.
+        """
+        raw = [1 / (rank ** skew) for rank in range(1, count + 1)]
+        total = sum(raw) or 1
+        return [weight * count / total for weight in raw]
+
+    def scaled(self, average, weight):
+        expected = average * weight
+        count = int(expected)
+        if self.rng.random() < expected - count:
+            count += 1
+        return count
+
+    def create_memberships(self, clubs, users, weights, average):
+        members = {}
+        rows = []
+        for club, weight in zip(clubs, weights):
             # Creator is automatically a member
-            ClubMembership.objects.create(club=club, user=admin)
-            clubs.append(club)
-        self.stdout.write(f'{len(clubs)} clubs created.')
+            size = min(len(users), max(1, self.scaled(average, weight)))
+            chosen = {club.admin_id}
+            chosen.update(user.id for user in self.rng.sample(users, k=size))
+            members[club.id] = sorted(chosen)
+            rows.extend(ClubMembership(club=club, user_id=user_id) for user_id in members[club.id])
+        self.bulk_insert(ClubMembership, rows, len(rows))
+        return members
 
-        active_clubs = [c for c in clubs if c.is_active]
+    def create_posts(self, clubs, members, weights, average):
+        counts = [self.scaled(average, weight) for weight in weights]
+        pool = [self.fake.sentence(nb_words=15) for _ in range(min(1000, max(sum(counts), 1)))]
+        rows = (
+            Post(club=club, author_id=self.rng.choice(members[club.id]), content=self.rng.choice(pool))
+            for club, count in zip(clubs, counts)
+            for _ in range(count)
+        )
+        self.bulk_insert(Post, rows, sum(counts))
+
+    def create_events(self, clubs, weights, average):
+        counts = [self.scaled(average, weight) for weight in weights]
+        rows = (
+            Event(
+                club=club,
+                title=self.fake.catch_phrase(),
+                description=self.fake.text(),
+                date=self.now + timedelta(days=self.rng.randint(1, 30), minutes=self.rng.randint(0, 1439)),
+            )
+            for club, count in zip(clubs, counts)
+            for _ in range(count)
+        )
+        self.bulk_insert(Event, rows, sum(counts))
+
+    def create_messages(self, clubs, members, weights, average, history_days):
+        counts = [self.scaled(average, weight) for weight in weights]
+        # Faker is far too slow to call per row at this scale, so draw from a pool
+        pool = [self.fake.sentence(nb_words=8) for _ in range(min(1000, max(sum(counts), 1)))]
+        start = self.now - timedelta(days=history_days)
+        span = (self.now - start).total_seconds()
+
+        adapt = connection.ops.adapt_datetimefield_value
+        randrange = self.rng.randrange
+
+        def rows():
+            for club, count in zip(clubs, counts):
+                authors = members[club.id]
+                step = timedelta(seconds=span / max(count, 1))
+                created_at = start
+                for _ in range(count):
+                    yield (club.id, authors[randrange(len(authors))], pool[randrange(len(pool))], adapt(created_at))
+                    created_at += step
+
+        self.bulk_insert(Message, rows(), sum(counts), columns=['club', 'author', 'text', 'created_at'])
+
+    def bulk_insert(self, model, rows, total, columns=None):
+        started = time.monotonic()
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.flush(model, batch, columns)
+                batch = []
+        if batch:
+            self.flush(model, batch, columns)
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed > 0 else 0
+        self.stdout.write(f'{total} {model._meta.verbose_name_plural} created in {elapsed:.2f}s ({rate:,.0f} rows/s).')
 
-        # Create Memberships
-        for club in active_clubs:
-            # Add 2 to 5 random members to each active club
-            members_to_add = random.sample(users, k=random.randint(2, 5))
-            for user in members_to_add:
-                ClubMembership.objects.get_or_create(club=club, user=user)
-        self.stdout.write('Added random members to active clubs.')
-
-        # Create Posts, Events, and Messages for active clubs
-        for club in active_clubs:
-            club_members = list(club.members.all())
-            # Create Posts
-            for _ in range(random.randint(2, 5)):
-                Post.objects.create(
-                    club=club,
-                    author=random.choice(club_members),
-                    content=fake.sentence(nb_words=15)
-                )
-            # Create Events
-            for _ in range(random.randint(1, 3)):
-                Event.objects.create(
-                    club=club,
-                    title=fake.catch_phrase(),
-                    description=fake.text(),
-                    date=timezone.now() + timedelta(days=random.randint(1, 30))
-                )
-            # Create Messages
-            for _ in range(random.randint(5, 15)):
-                Message.objects.create(
-                    club=club,
-                    author=random.choice(club_members),
-                    text=fake.sentence(nb_words=8)
-                )
-        self.stdout.write('Created posts, events, and messages for active clubs.')
-
-        self.stdout.write(self.style.SUCCESS('Database seeding completed successfully!'))
\ No newline at end of file
+    def flush(self, model, batch, columns=None):
+        with transaction.atomic():
+            if columns is None:
+                model.objects.bulk_create(batch)
+                return
+            # Tuples of already-adapted values: at millions of rows, building
+            # model instances costs more than the inserts themselves.
+            table = connection.ops.quote_name(model._meta.db_table)
+            names = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in columns)
+            placeholders = ', '.join(['%s'] * len(columns))
+            with connection.cursor() as cursor:
+                cursor.executemany(f'INSERT INTO {table} ({names}) VALUES ({placeholders})', batch)
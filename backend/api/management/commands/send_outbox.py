@@ -0,0 +1,27 @@
+# api/management/commands/send_outbox.py
+import time
+from django.core.management.base import BaseCommand
+from api import outbox
+
+class Command(BaseCommand):
+    help = 'Delivers queued outbox emails in batches over a single mail connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Emails per batch (defaults to EMAIL_OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running, polling the outbox every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            handled = outbox.drain(options['batch_size'])
+            if handled:
+                self.stdout.write(
+                    f"Handled {handled} emails in {time.monotonic() - started:.2f}s "
+                    f"(sent={outbox.metrics['sent']} retried={outbox.metrics['retried']} "
+                    f"failed={outbox.metrics['failed']} batches={outbox.metrics['batches']})"
+                )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Club, ClubMembership
+
+Memberships = namedtuple('Memberships', ['club_ids', 'active_club_ids', 'subadmin_club_ids', 'admin_club_ids'])
+
+NO_MEMBERSHIPS = Memberships(frozenset(), frozenset(), frozenset(), frozenset())
+
+
+class MembershipCache:
+    """
+    Per-user membership and role lookups for permission checks.
+
+    Two tiers: a small in-process LRU (entries live for at most
+    MEMBERSHIP_CACHE_LOCAL_TTL seconds, which bounds staleness in other
+    processes) in front of the Django cache. Entries are invalidated by the
+    signal handlers in api.signals whenever memberships or a club's admin or
+    approval status change.
+    """
+
+    def __init__(self):
+        self.timeout = getattr(settings, 'MEMBERSHIP_CACHE_TIMEOUT', 300)
+        self.local_size = getattr(settings, 'MEMBERSHIP_CACHE_LOCAL_SIZE', 1024)
+        self.local_ttl = getattr(settings, 'MEMBERSHIP_CACHE_LOCAL_TTL', 2)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(user_id):
+        return f'memberships:v1:{user_id}'
+
+    def get(self, user):
+        if user is None or not user.is_authenticated:
+            return NO_MEMBERSHIPS
+        return self.get_for_id(user.id)
+
+    def get_for_id(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._local.move_to_end(user_id)
+                return entry[0]
+
+        memberships = cache.get(self.cache_key(user_id))
+        if memberships is None:
+            memberships = self.load(user_id)
+            cache.set(self.cache_key(user_id), memberships, self.timeout)
+        self._remember(user_id, memberships, now)
+        return memberships
+
+    def is_member(self, user, club_id):
+        return club_id in self.get(user).club_ids
+
+    def is_admin(self, user, club_id):
+        return club_id in self.get(user).admin_club_ids
+
+    def is_subadmin(self, user, club_id):
+        return club_id in self.get(user).subadmin_club_ids
+
+    def load(self, user_id):
+        rows = ClubMembership.objects.filter(user_id=user_id).values_list('club_id', 'club__is_active', 'is_subadmin')
+        club_ids, active_club_ids, subadmin_club_ids = set(), set(), set()
+        for club_id, club_is_active, is_subadmin in rows:
+            club_ids.add(club_id)
+            if club_is_active:
+                active_club_ids.add(club_id)
+            if is_subadmin:
+                subadmin_club_ids.add(club_id)
+        admin_club_ids = Club.objects.filter(admin_id=user_id).values_list('id', flat=True)
+        return Memberships(
+            frozenset(club_ids),
+            frozenset(active_club_ids),
+            frozenset(subadmin_club_ids),
+            frozenset(admin_club_ids),
+        )
+
+    def invalidate(self, *user_ids):
+        """
+        Drop cached memberships now and again once the surrounding transaction
+        commits, so a concurrent reader can't re-cache pre-commit state.
+        """
+        user_ids = [user_id for user_id in user_ids if user_id is not None]
+        if not user_ids:
+            return
+        self._forget(user_ids)
+        transaction.on_commit(lambda: self._forget(user_ids))
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def _remember(self, user_id, memberships, now):
+        with self._lock:
+            self._local[user_id] = (memberships, now + self.local_ttl)
+            self._local.move_to_end(user_id)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _forget(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._local.pop(user_id, None)
+        cache.delete_many([self.cache_key(user_id) for user_id in user_ids])
+
+
+membership_cache = MembershipCache()
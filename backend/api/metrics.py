@@ -0,0 +1,213 @@
+import contextvars
+import functools
+import threading
+import time
+
+from django.conf import settings
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def is_enabled():
+    return getattr(settings, 'REQUEST_METRICS_ENABLED', False)
+
+
+class RequestMetrics:
+    """Timings collected while handling one request or consumer call."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+
+    @property
+    def total_seconds(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total_seconds):
+        return ', '.join([
+            f'sql;dur={self.sql_seconds * 1000:.2f};desc="{self.sql_queries} queries"',
+            f'serializer;dur={self.serializer_seconds * 1000:.2f}',
+            f'total;dur={total_seconds * 1000:.2f}',
+        ])
+
+
+def start():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.serializer_seconds = 0.0
+
+    def observe(self, seconds, metrics):
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.sql_queries += metrics.sql_queries
+        self.sql_seconds += metrics.sql_seconds
+        self.serializer_seconds += metrics.serializer_seconds
+
+
+class Registry:
+    """In-process aggregation of request and consumer timings, by label set."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.consumer_calls = {}
+        self.chat_frames_rejected = {}
+
+    def observe_request(self, route, method, status, seconds, metrics):
+        self._observe(self.requests, (('route', route), ('method', method), ('status', str(status))), seconds, metrics)
+
+    def observe_consumer_call(self, consumer, call, seconds, metrics):
+        self._observe(self.consumer_calls, (('consumer', consumer), ('call', call)), seconds, metrics)
+
+    def count_chat_frame_rejected(self, consumer, reason):
+        labels = (('consumer', consumer), ('reason', reason))
+        with self._lock:
+            self.chat_frames_rejected[labels] = self.chat_frames_rejected.get(labels, 0) + 1
+
+    def _observe(self, series, labels, seconds, metrics):
+        with self._lock:
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram()
+            histogram.observe(seconds, metrics)
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.consumer_calls.clear()
+            self.chat_frames_rejected.clear()
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            self._render_family(lines, 'venti_http_request', 'HTTP requests', self.requests)
+            self._render_family(lines, 'venti_consumer_call', 'Websocket consumer calls', self.consumer_calls)
+            name = 'venti_chat_frames_rejected_total'
+            lines.append(f'# HELP {name} Chat frames dropped by size, rate or queue limits before handling.')
+            lines.append(f'# TYPE {name} counter')
+            for labels, count in sorted(self.chat_frames_rejected.items()):
+                lines.append(f'{name}{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def _render_family(self, lines, prefix, description, series):
+        name = f'{prefix}_duration_seconds'
+        lines.append(f'# HELP {name} {description}, total time in seconds.')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, histogram in sorted(series.items()):
+            for bound, count in zip(BUCKETS, histogram.buckets):
+                lines.append(f'{name}_bucket{_labels(labels, le=repr(bound))} {count}')
+            lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {histogram.count}')
+            lines.append(f'{name}_sum{_labels(labels)} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+        for suffix, attribute, help_text in (
+            ('sql_queries_total', 'sql_queries', 'SQL queries executed'),
+            ('sql_seconds_total', 'sql_seconds', 'time spent in SQL'),
+            ('serializer_seconds_total', 'serializer_seconds', 'time spent serializing'),
+        ):
+            name = f'{prefix}_{suffix}'
+            lines.append(f'# HELP {name} {description}, {help_text}.')
+            lines.append(f'# TYPE {name} counter')
+            for labels, histogram in sorted(series.items()):
+                lines.append(f'{name}{_labels(labels)} {getattr(histogram, attribute):g}')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+registry = Registry()
+
+
+# --- Hooks, installed by ApiConfig.ready() when REQUEST_METRICS_ENABLED ---
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper feeding the current RequestMetrics, if any."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_seconds += time.perf_counter() - started
+        metrics.sql_queries += 1
+
+
+def add_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver: every new connection, in any thread, reports its queries."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install_serializer_timing():
+    """
+    Time DRF serialization by wrapping the base to_representation methods.
+    Only the outermost call is timed, so nested serializers aren't counted twice.
+    """
+    from rest_framework import serializers
+
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        original = cls.to_representation
+        if getattr(original, 'timed', False):
+            continue
+
+        @functools.wraps(original)
+        def to_representation(self, instance, _original=original):
+            metrics = _current.get()
+            if metrics is None or metrics.serializing:
+                return _original(self, instance)
+            metrics.serializing = True
+            started = time.perf_counter()
+            try:
+                return _original(self, instance)
+            finally:
+                metrics.serializer_seconds += time.perf_counter() - started
+                metrics.serializing = False
+
+        to_representation.timed = True
+        cls.to_representation = to_representation
+
+
+def instrument_consumer_call(method):
+    """Record the duration and SQL of a consumer's connect/receive in the registry."""
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if not is_enabled():
+            return await method(self, *args, **kwargs)
+        metrics, token = start()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            finish(token)
+            registry.observe_consumer_call(type(self).__name__, method.__name__, metrics.total_seconds, metrics)
+
+    return wrapper
@@ -0,0 +1,26 @@
+from . import metrics
+
+
+class RequestMetricsMiddleware:
+    """
+    Opt-in (REQUEST_METRICS_ENABLED) per-request instrumentation: SQL query
+    count and time, serializer time and total time, reported in a
+    Server-Timing header and aggregated per route for /api/_metrics/.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics, token = metrics.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish(token)
+        total_seconds = request_metrics.total_seconds
+        response['Server-Timing'] = request_metrics.server_timing(total_seconds)
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match and match.view_name else 'unmatched'
+        metrics.registry.observe_request(route, request.method, response.status_code, total_seconds, request_metrics)
+        return response
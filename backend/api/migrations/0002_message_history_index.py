@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['club', 'created_at', 'id'], name='api_message_club_history_idx'),
+        ),
+    ]
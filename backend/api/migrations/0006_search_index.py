@@ -0,0 +1,89 @@
+# Full-text search index over clubs, posts and events (see api/search.py).
+#
+# SQLite: one FTS5 table holding all three kinds, kept in sync by triggers so
+# bulk_create, queryset updates and raw deletes are covered too. The rowid
+# encodes (object id, kind), which keeps trigger deletes O(log n).
+# PostgreSQL: GIN expression indexes matching the tsvector built in search.py.
+
+from django.db import migrations
+
+# (table, kind, code, title column, body column)
+SOURCES = [
+    ('api_club', 'club', 1, 'name', 'description'),
+    ('api_post', 'post', 2, "''", 'content'),
+    ('api_event', 'event', 3, 'title', 'description'),
+]
+
+
+def _row(prefix, kind, code, title, body):
+    title = title if title.startswith("'") else f'{prefix}.{title}'
+    return f"{prefix}.id * 4 + {code}, '{kind}', {prefix}.id, {title}, {prefix}.{body}"
+
+
+def sqlite_forwards():
+    statements = [
+        "CREATE VIRTUAL TABLE api_search_index USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, title, body, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    ]
+    columns = 'rowid, kind, object_id, title, body'
+    for table, kind, code, title, body in SOURCES:
+        watched = body if title.startswith("'") else f'{title}, {body}'
+        statements += [
+            f"INSERT INTO api_search_index ({columns}) SELECT {_row(table, kind, code, title, body)} FROM {table}",
+            f"CREATE TRIGGER {table}_search_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO api_search_index ({columns}) VALUES ({_row('new', kind, code, title, body)}); END",
+            f"CREATE TRIGGER {table}_search_au AFTER UPDATE OF {watched} ON {table} BEGIN "
+            f"DELETE FROM api_search_index WHERE rowid = old.id * 4 + {code}; "
+            f"INSERT INTO api_search_index ({columns}) VALUES ({_row('new', kind, code, title, body)}); END",
+            f"CREATE TRIGGER {table}_search_ad AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM api_search_index WHERE rowid = old.id * 4 + {code}; END",
+        ]
+    return statements
+
+
+def sqlite_backwards():
+    statements = []
+    for table, *_ in SOURCES:
+        statements += [f'DROP TRIGGER IF EXISTS {table}_search_{suffix}' for suffix in ('ai', 'au', 'ad')]
+    return statements + ['DROP TABLE IF EXISTS api_search_index']
+
+
+def postgresql_forwards():
+    return [
+        f"CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} USING GIN "
+        f"(to_tsvector('simple', coalesce({title}, '') || ' ' || coalesce({body}, '')))"
+        for table, kind, code, title, body in SOURCES
+    ]
+
+
+def postgresql_backwards():
+    return [f'DROP INDEX IF EXISTS {table}_search_idx' for table, *_ in SOURCES]
+
+
+STATEMENTS = {
+    'sqlite': (sqlite_forwards, sqlite_backwards),
+    'postgresql': (postgresql_forwards, postgresql_backwards),
+}
+
+
+def run(direction):
+    def operation(apps, schema_editor):
+        builders = STATEMENTS.get(schema_editor.connection.vendor)
+        if builders is None:
+            # Other backends fall back to unindexed icontains matching
+            return
+        for statement in builders[direction]():
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_email_outbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(0), run(1)),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_event_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clubmembership',
+            index=models.Index(fields=['club', 'joined_at', 'id'], name='api_membership_roster_idx'),
+        ),
+    ]
@@ -18,6 +18,7 @@ class Club(models.Model):
     rejected_reason = models.TextField(blank=True, null=True, help_text="Reason for rejection if club was rejected")
     rejection_date = models.DateTimeField(null=True, blank=True)
     approved_date = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -28,9 +29,13 @@ class ClubMembership(models.Model):
     user = models.ForeignKey('api.User', on_delete=models.CASCADE, related_name='memberships')
     is_subadmin = models.BooleanField(default=False)
     joined_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('club', 'user')
+        indexes = [
+            models.Index(fields=['club', 'joined_at', 'id'], name='api_membership_roster_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} @ {self.club.name} (subadmin={self.is_subadmin})"
@@ -41,6 +46,7 @@ class Post(models.Model):
     author = models.ForeignKey('api.User', on_delete=models.CASCADE, related_name='posts')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Post by {self.author.username} in {self.club.name}"
@@ -50,7 +56,14 @@ class Message(models.Model):
     club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name='messages')
     author = models.ForeignKey('api.User', on_delete=models.CASCADE, related_name='messages')
     text = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: write-behind persistence stamps messages before they are saved
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a club's chat history
+            models.Index(fields=['club', 'created_at', 'id'], name='api_message_club_history_idx'),
+        ]
 
     def __str__(self):
         return f"Message by {self.author.username} in {self.club.name}"
@@ -62,6 +75,119 @@ class Event(models.Model):
     description = models.TextField(blank=True)
     date = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['club', 'date'], name='api_event_club_date_idx'),
+            models.Index(fields=['date'], name='api_event_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.club.name})"
+
+
+class XPEvent(models.Model):
+    """
+    Append-only XP ledger. Awards are inserted here and periodically
+    compacted into User.xp_points (see services.compact_xp).
+    """
+    JOIN_CLUB = 'join_club'
+    POST = 'post'
+    MESSAGE = 'message'
+    REASON_CHOICES = [
+        (JOIN_CLUB, 'Joined a club'),
+        (POST, 'Created a post'),
+        (MESSAGE, 'Sent a message'),
+    ]
+
+    user = models.ForeignKey('api.User', on_delete=models.CASCADE, related_name='xp_events')
+    club = models.ForeignKey(Club, on_delete=models.SET_NULL, related_name='xp_events', null=True, blank=True)
+    amount = models.IntegerField()
+    reason = models.CharField(max_length=32, choices=REASON_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied = models.BooleanField(default=False, help_text="Set once the amount is compacted into User.xp_points")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user'], condition=models.Q(applied=False), name='api_xpevent_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.amount} XP to {self.user_id} ({self.reason})"
+
+
+class LeaderboardEntry(models.Model):
+    """
+    Precomputed leaderboard row. club=None is the global leaderboard;
+    rank stays empty until the next services.rebuild_leaderboards run.
+    """
+    club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name='leaderboard_entries', null=True, blank=True)
+    user = models.ForeignKey('api.User', on_delete=models.CASCADE, related_name='leaderboard_entries')
+    xp_points = models.IntegerField(default=0)
+    rank = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['club', 'rank'], name='api_leaderboard_rank_idx'),
+            models.Index(fields=['club', 'user'], name='api_leaderboard_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.rank} {self.user_id} ({self.club_id or 'global'})"
+
+
+class OutboxEmail(models.Model):
+    """
+    Email queued in the same transaction as the change it announces and
+    delivered later by the send_outbox command.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='api_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+
+class TimelineEntry(models.Model):
+    """
+    A post or event in a member's activity feed, written when it is
+    created (fan-out on write). Clubs above FEED_FANOUT_MAX_MEMBERS are
+    skipped and merged in when the feed is read instead (see api/feed.py).
+    """
+    user = models.ForeignKey('api.User', on_delete=models.CASCADE, related_name='timeline_entries')
+    club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries', null=True, blank=True)
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='timeline_entries', null=True, blank=True)
+    # Copied from the post or event, so a page is one index range scan per user
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='api_timeline_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{'post' if self.post_id else 'event'} {self.post_id or self.event_id} for {self.user_id}"
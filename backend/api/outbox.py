@@ -0,0 +1,116 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+# Process-wide delivery counters, reported by the send_outbox command
+metrics = {
+    'batches': 0,
+    'sent': 0,
+    'retried': 0,
+    'failed': 0,
+}
+
+
+def queue_email(subject, message, recipient_list, from_email=None):
+    """
+    Queue an email for delivery. Call it inside the transaction that makes
+    the change being announced so both commit (or roll back) together.
+    """
+    recipients = [address for address in recipient_list if address]
+    if not recipients:
+        return None
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=recipients,
+    )
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_BASE_SECONDS', 30)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 6 * 60 * 60))
+
+
+def deliver_batch(batch_size=None, connection=None):
+    """
+    Send up to batch_size due emails over a single SMTP connection.
+    Failed messages are retried with exponential backoff until
+    EMAIL_OUTBOX_MAX_ATTEMPTS, then marked failed. Returns the number of
+    emails handled.
+    """
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 100)
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+
+    with transaction.atomic():
+        due = OutboxEmail.objects.filter(status=OutboxEmail.PENDING, next_attempt_at__lte=timezone.now())
+        if db_connection.features.has_select_for_update_skip_locked:
+            # Lets several workers drain the outbox side by side
+            due = due.select_for_update(skip_locked=True)
+        emails = list(due.order_by('next_attempt_at', 'id')[:batch_size])
+        if not emails:
+            return 0
+
+        mail_connection = connection or get_connection()
+        sent, retried, failed = [], [], []
+        try:
+            mail_connection.open()
+        except Exception as exc:
+            logger.warning('Could not open the mail connection: %s', exc)
+            for email in emails:
+                _record_failure(email, exc, max_attempts, retried, failed)
+        else:
+            try:
+                for email in emails:
+                    message = EmailMessage(email.subject, email.body, email.from_email, email.recipients)
+                    try:
+                        # One message per call so a bad address only fails its own email
+                        mail_connection.send_messages([message])
+                    except Exception as exc:
+                        _record_failure(email, exc, max_attempts, retried, failed)
+                    else:
+                        email.status = OutboxEmail.SENT
+                        email.sent_at = timezone.now()
+                        email.attempts += 1
+                        sent.append(email)
+            finally:
+                mail_connection.close()
+
+        OutboxEmail.objects.bulk_update(
+            emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+        )
+
+    metrics['batches'] += 1
+    metrics['sent'] += len(sent)
+    metrics['retried'] += len(retried)
+    metrics['failed'] += len(failed)
+    return len(emails)
+
+
+def _record_failure(email, exc, max_attempts, retried, failed):
+    email.attempts += 1
+    email.last_error = f'{type(exc).__name__}: {exc}'
+    if email.attempts >= max_attempts:
+        email.status = OutboxEmail.FAILED
+        failed.append(email)
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+        retried.append(email)
+
+
+def drain(batch_size=None, connection=None):
+    """Deliver due emails batch by batch until none are left. Returns the number handled."""
+    handled = 0
+    while True:
+        count = deliver_batch(batch_size, connection)
+        handled += count
+        if count == 0:
+            return handled
@@ -0,0 +1,237 @@
+import asyncio
+import time
+import uuid
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+from .chat_groups import club_group
+
+
+class ClubPresence:
+    """
+    Who is connected to each club chat, with heartbeat expiry.
+
+    Each process tracks its own connections in memory: a heartbeat only
+    moves the connection between deadline buckets, so it costs O(1) and
+    touches neither the database nor the cache. Once per tick a background
+    task expires connections that missed their deadline, publishes the
+    process's online set of every changed club to the Django cache (one
+    shard per process and club, listed in a per-club registry) and
+    broadcasts the join/leave deltas collected since the previous tick to
+    the club's chat group in one event. Readers merge the shards, so the
+    online set is exact across processes up to one tick behind.
+
+    All methods except the readers run on the event loop.
+    """
+
+    def __init__(self):
+        self.timeout = getattr(settings, 'PRESENCE_TIMEOUT_SECONDS', 70)
+        self.tick = getattr(settings, 'PRESENCE_TICK_SECONDS', 1.0)
+        self.refresh_every = getattr(settings, 'PRESENCE_REFRESH_SECONDS', 20)
+        self.typing_interval = getattr(settings, 'PRESENCE_TYPING_INTERVAL_SECONDS', 3.0)
+        self.node = uuid.uuid4().hex[:12]
+        self._users = {}        # club_id -> {user_id: [username, local connections]}
+        self._connections = {}  # channel name -> [user_id, deadline bucket, {club_ids}]
+        self._buckets = {}      # deadline bucket -> {channel names}
+        self._joined = {}       # club_id -> {user_id: username} since the last tick
+        self._left = {}         # club_id -> {user_ids} since the last tick
+        self._dirty = set()     # clubs whose shard is out of date
+        self._typing = {}       # (club_id, user_id) -> when their last typing event went out
+        self._task = None
+        self._refreshed_at = 0.0
+
+    # --- Cache layout ---
+
+    @staticmethod
+    def registry_key(club_id):
+        return f'presence:v1:{club_id}'
+
+    @staticmethod
+    def shard_key(club_id, node):
+        return f'presence:v1:{club_id}:{node}'
+
+    def shard_timeout(self):
+        # Shards of a process that died expire on their own
+        return int(self.timeout + self.refresh_every)
+
+    # --- Connections ---
+
+    def _bucket(self, now):
+        return int((now + self.timeout) // self.tick)
+
+    def connect(self, channel_name, club_id, user_id, username):
+        """Mark the connection as present in the club; one connection may be present in several clubs."""
+        connection = self._connections.get(channel_name)
+        if connection is None:
+            bucket = self._bucket(time.monotonic())
+            connection = self._connections[channel_name] = [user_id, bucket, set()]
+            self._buckets.setdefault(bucket, set()).add(channel_name)
+        if club_id in connection[2]:
+            return
+        connection[2].add(club_id)
+        users = self._users.setdefault(club_id, {})
+        entry = users.get(user_id)
+        if entry is None:
+            users[user_id] = [username, 1]
+            self._joined.setdefault(club_id, {})[user_id] = username
+            self._left.get(club_id, set()).discard(user_id)
+            self._dirty.add(club_id)
+        else:
+            entry[1] += 1
+        self._ensure_running()
+
+    def heartbeat(self, channel_name):
+        connection = self._connections.get(channel_name)
+        if connection is None:
+            return
+        new_bucket = self._bucket(time.monotonic())
+        if new_bucket == connection[1]:
+            return
+        self._discard_from_bucket(channel_name, connection[1])
+        connection[1] = new_bucket
+        self._buckets.setdefault(new_bucket, set()).add(channel_name)
+
+    def disconnect(self, channel_name, club_ids=None):
+        """Drop the connection from the given clubs, or from all of them."""
+        connection = self._connections.get(channel_name)
+        if connection is None:
+            return
+        user_id, bucket, clubs = connection
+        for club_id in list(clubs if club_ids is None else clubs.intersection(club_ids)):
+            clubs.discard(club_id)
+            self._leave(club_id, user_id)
+        if not clubs:
+            del self._connections[channel_name]
+            self._discard_from_bucket(channel_name, bucket)
+
+    def _leave(self, club_id, user_id):
+        users = self._users[club_id]
+        users[user_id][1] -= 1
+        if users[user_id][1] > 0:
+            return
+        del users[user_id]
+        if not users:
+            del self._users[club_id]
+        self._typing.pop((club_id, user_id), None)
+        if self._joined.get(club_id, {}).pop(user_id, None) is None:
+            self._left.setdefault(club_id, set()).add(user_id)
+        self._dirty.add(club_id)
+
+    def _discard_from_bucket(self, channel_name, bucket):
+        channels = self._buckets.get(bucket)
+        if channels is not None:
+            channels.discard(channel_name)
+            if not channels:
+                del self._buckets[bucket]
+
+    def allow_typing(self, club_id, user_id):
+        """Whether a typing event from the user may go out now (at most one per PRESENCE_TYPING_INTERVAL_SECONDS)."""
+        now = time.monotonic()
+        last = self._typing.get((club_id, user_id))
+        if last is not None and now - last < self.typing_interval:
+            return False
+        self._typing[club_id, user_id] = now
+        return True
+
+    # --- Background task ---
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self._connections or self._dirty:
+            await asyncio.sleep(self.tick)
+            await self.run_tick()
+
+    async def run_tick(self):
+        now = time.monotonic()
+        expired = self._expire(now)
+        refresh = now - self._refreshed_at >= self.refresh_every
+        if refresh:
+            self._refreshed_at = now
+        clubs = set(self._users) | self._dirty if refresh else set(self._dirty)
+        self._dirty.clear()
+        if clubs:
+            await self._publish(clubs)
+        await self._broadcast()
+        channel_layer = get_channel_layer()
+        for channel_name in expired:
+            await channel_layer.send(channel_name, {'type': 'presence_expired'})
+
+    def _expire(self, now):
+        current = int(now // self.tick)
+        expired = []
+        for bucket in [bucket for bucket in self._buckets if bucket <= current]:
+            for channel_name in list(self._buckets.get(bucket, ())):
+                self.disconnect(channel_name)
+                expired.append(channel_name)
+        return expired
+
+    async def _publish(self, club_ids):
+        timeout = self.shard_timeout()
+        await cache.aset_many({
+            self.shard_key(club_id, self.node): {
+                user_id: entry[0] for user_id, entry in self._users.get(club_id, {}).items()
+            }
+            for club_id in club_ids
+        }, timeout)
+        # Registries are read-modify-write; a concurrent update lost here is repaired by the next refresh
+        registries = await cache.aget_many([self.registry_key(club_id) for club_id in club_ids])
+        expires_at = time.time() + timeout
+        updates = {}
+        for club_id in club_ids:
+            key = self.registry_key(club_id)
+            nodes = {node: until for node, until in registries.get(key, {}).items() if until > time.time()}
+            if self.node not in nodes or nodes[self.node] < expires_at - self.refresh_every:
+                nodes[self.node] = expires_at
+                updates[key] = nodes
+        if updates:
+            await cache.aset_many(updates, timeout)
+
+    async def _broadcast(self):
+        joined, left = self._joined, self._left
+        self._joined, self._left = {}, {}
+        channel_layer = get_channel_layer()
+        for club_id in set(joined) | set(left):
+            gone = left.get(club_id, set())
+            if gone:
+                # Still connected through another process
+                gone = gone - set(await self.aonline(club_id))
+            if not joined.get(club_id) and not gone:
+                continue
+            await channel_layer.group_send(club_group(club_id), {
+                'type': 'presence_delta',
+                'club': club_id,
+                'joined': [[user_id, username] for user_id, username in joined.get(club_id, {}).items()],
+                'left': sorted(gone),
+            })
+
+    # --- Readers ---
+
+    def _merge(self, club_id, registry, shards):
+        online = {}
+        for node, until in (registry or {}).items():
+            if until > time.time():
+                online.update(shards.get(self.shard_key(club_id, node)) or {})
+        return online
+
+    def online(self, club_id):
+        """{user_id: username} of the users connected to the club chat in any process."""
+        registry = cache.get(self.registry_key(club_id))
+        if not registry:
+            return {}
+        return self._merge(club_id, registry, cache.get_many([self.shard_key(club_id, node) for node in registry]))
+
+    async def aonline(self, club_id):
+        registry = await cache.aget(self.registry_key(club_id))
+        if not registry:
+            return {}
+        shards = await cache.aget_many([self.shard_key(club_id, node) for node in registry])
+        return self._merge(club_id, registry, shards)
+
+
+club_presence = ClubPresence()
@@ -6,4 +6,6 @@ websocket_urlpatterns = [
     re_path(r'ws/chat/$', consumers.ChatConsumer.as_asgi()),
     # Named chat rooms
     re_path(r'ws/chat/(?P<room_name>\w+)/$', consumers.ChatConsumer.as_asgi()),
+    # All of the user's club chats over one connection
+    re_path(r'ws/clubs/$', consumers.MultiplexChatConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -0,0 +1,167 @@
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+
+from . import models
+from .services import annotate_clubs
+
+KINDS = ('club', 'post', 'event')
+
+# Only the first few words of a query are used; longer queries don't rank any better
+MAX_TERMS = 8
+
+# Column weights for bm25(): kind, object_id, title, body
+SQLITE_WEIGHTS = '0.0, 0.0, 10.0, 1.0'
+
+# Must match the GIN expression indexes created by migration 0006_search_index
+POSTGRES_SOURCES = {
+    'club': ('api_club', 'name', 'description'),
+    'post': ('api_post', "''", 'content'),
+    'event': ('api_event', 'title', 'description'),
+}
+
+# SQLite index feeds: table -> (kind, rowid code, title expression or None, body column)
+SQLITE_SOURCES = {
+    'api_club': ('club', 1, 'name', 'description'),
+    'api_post': ('post', 2, None, 'content'),
+    'api_event': ('event', 3, 'title', 'description'),
+}
+
+# Fallback for backends without an index: kind -> (model, searched fields)
+FALLBACK_SOURCES = {
+    'club': (models.Club, ('name', 'description')),
+    'post': (models.Post, ('content',)),
+    'event': (models.Event, ('title', 'description')),
+}
+
+
+def sqlite_trigger_statements():
+    """
+    The triggers keeping api_search_index in sync (see migration
+    0006_search_index). SQLite drops a table's triggers whenever a migration
+    rebuilds the table, so ensure_sqlite_triggers() recreates any missing
+    ones after every migrate.
+    """
+    columns = 'rowid, kind, object_id, title, body'
+    statements = []
+    for table, (kind, code, title, body) in SQLITE_SOURCES.items():
+        new_title = f'new.{title}' if title else "''"
+        new_row = f"new.id * 4 + {code}, '{kind}', new.id, {new_title}, new.{body}"
+        watched = f'{title}, {body}' if title else body
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO api_search_index ({columns}) VALUES ({new_row}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE OF {watched} ON {table} BEGIN "
+            f"DELETE FROM api_search_index WHERE rowid = old.id * 4 + {code}; "
+            f"INSERT INTO api_search_index ({columns}) VALUES ({new_row}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM api_search_index WHERE rowid = old.id * 4 + {code}; END",
+        ]
+    return statements
+
+
+def ensure_sqlite_triggers(sender, using='default', **kwargs):
+    """post_migrate receiver: recreate search triggers dropped by table rebuilds."""
+    db = connections[using]
+    if db.vendor != 'sqlite' or 'api_search_index' not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for statement in sqlite_trigger_statements():
+            cursor.execute(statement)
+
+
+def parse_terms(query):
+    """Lower-cased words of the query, without punctuation or search-syntax operators."""
+    return re.findall(r'[^\W_]+', (query or '').lower())[:MAX_TERMS]
+
+
+def search(terms, kinds=KINDS, limit=20, offset=0, include_inactive=False):
+    """
+    Rank clubs, posts and events matching every term (the last one as a
+    prefix, so results update while typing). Returns a list of
+    (kind, object_id, score) tuples, best match first.
+    """
+    if not terms or not kinds:
+        return []
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(terms, kinds, limit, offset, include_inactive)
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(terms, kinds, limit, offset, include_inactive)
+    return _search_fallback(terms, kinds, limit, offset, include_inactive)
+
+
+def _search_sqlite(terms, kinds, limit, offset, include_inactive):
+    match = ' '.join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+    sql = [
+        f'SELECT kind, object_id, -bm25(api_search_index, {SQLITE_WEIGHTS}) AS score',
+        'FROM api_search_index WHERE api_search_index MATCH %s',
+    ]
+    params = [match.strip()]
+    if len(kinds) < len(KINDS):
+        sql.append(f"AND kind IN ({', '.join(['%s'] * len(kinds))})")
+        params.extend(kinds)
+    if not include_inactive and 'club' in kinds:
+        # Pending clubs are few; excluding them here keeps the pages full
+        sql.append("AND NOT (kind = 'club' AND object_id IN (SELECT id FROM api_club WHERE NOT is_active))")
+    sql.append('ORDER BY score DESC, rowid LIMIT %s OFFSET %s')
+    params.extend([limit, offset])
+    with connection.cursor() as cursor:
+        cursor.execute(' '.join(sql), params)
+        return [(kind, int(object_id), score) for kind, object_id, score in cursor.fetchall()]
+
+
+def _search_postgresql(terms, kinds, limit, offset, include_inactive):
+    query = ' & '.join(f'{term}:*' if index == len(terms) - 1 else term for index, term in enumerate(terms))
+    branches = []
+    for kind in kinds:
+        table, title, body = POSTGRES_SOURCES[kind]
+        vector = f"to_tsvector('simple', coalesce({title}, '') || ' ' || coalesce({body}, ''))"
+        where = f'{vector} @@ q.query'
+        if kind == 'club' and not include_inactive:
+            where += ' AND is_active'
+        branches.append(
+            f"SELECT '{kind}' AS kind, id AS object_id, ts_rank({vector}, q.query) AS score "
+            f"FROM {table}, q WHERE {where}"
+        )
+    sql = (
+        "WITH q AS (SELECT to_tsquery('simple', %s) AS query) "
+        f"SELECT kind, object_id, score FROM ({' UNION ALL '.join(branches)}) hits "
+        "ORDER BY score DESC, kind, object_id LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query, limit, offset])
+        return [(kind, object_id, float(score)) for kind, object_id, score in cursor.fetchall()]
+
+
+def _search_fallback(terms, kinds, limit, offset, include_inactive):
+    hits = []
+    for kind in kinds:
+        model, fields = FALLBACK_SOURCES[kind]
+        queryset = model.objects.all()
+        for term in terms:
+            condition = Q()
+            for field in fields:
+                condition |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(condition)
+        if kind == 'club' and not include_inactive:
+            queryset = queryset.filter(is_active=True)
+        hits.extend((kind, object_id, 0.0) for object_id in queryset.values_list('id', flat=True)[:offset + limit])
+    return hits[offset:offset + limit]
+
+
+def load_objects(hits, user):
+    """Fetch the hit objects with one query per kind. Returns {(kind, id): instance}."""
+    ids = {kind: [] for kind in KINDS}
+    for kind, object_id, _ in hits:
+        ids[kind].append(object_id)
+    querysets = {
+        'club': lambda: annotate_clubs(models.Club.objects.filter(id__in=ids['club']), user),
+        'post': lambda: models.Post.objects.select_related('author').filter(id__in=ids['post']),
+        'event': lambda: models.Event.objects.select_related('club').filter(id__in=ids['event']),
+    }
+    objects = {}
+    for kind, object_ids in ids.items():
+        if object_ids:
+            objects.update(((kind, instance.id), instance) for instance in querysets[kind]())
+    return objects
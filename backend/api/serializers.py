@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from . import models
+from .membership_cache import membership_cache
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -8,21 +9,41 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'xp_points']
 
 
-class ClubSerializer(serializers.ModelSerializer):
+class ClubMembersCountMixin:
+    """
+    Read members_count from the services.annotate_clubs annotation,
+    falling back to a COUNT query for unannotated instances.
+    """
+
+    def get_members_count(self, obj):
+        members_count = getattr(obj, 'members_count', None)
+        if members_count is None:
+            return obj.members.count()
+        return members_count
+
+
+class ClubIsMemberMixin:
+    """
+    Read is_member from the services.annotate_clubs annotation, falling
+    back to the membership cache for unannotated instances.
+    """
+
+    def get_is_member(self, obj):
+        is_member = getattr(obj, 'is_member', None)
+        if is_member is not None:
+            return is_member
+        return membership_cache.is_member(self.context['request'].user, obj.id)
+
+
+class ClubSerializer(ClubMembersCountMixin, ClubIsMemberMixin, serializers.ModelSerializer):
     admin_username = serializers.CharField(source='admin.username', read_only=True)
-    members_count = serializers.IntegerField(source='members.count', read_only=True)
+    members_count = serializers.SerializerMethodField()
     is_member = serializers.SerializerMethodField()
 
     class Meta:
         model = models.Club
         fields = ['id', 'name', 'description', 'admin_username', 'members_count', 'is_member', 'is_active']
 
-    def get_is_member(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return obj.members.filter(id=user.id).exists()
-        return False
-
 
 class ClubMembershipSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
@@ -33,23 +54,52 @@ class ClubMembershipSerializer(serializers.ModelSerializer):
         fields = ['username', 'email', 'is_subadmin', 'joined_at']
 
 
-class ClubDetailSerializer(serializers.ModelSerializer):
+class ClubDetailSerializer(ClubMembersCountMixin, ClubIsMemberMixin, serializers.ModelSerializer):
+    """
+    Club details with member counts. The roster itself is paginated: the
+    view adds its first page as `members` and the link to the next one as
+    `members_next` (see ClubViewSet.members).
+    """
     admin_username = serializers.CharField(source='admin.username', read_only=True)
     admin_email = serializers.CharField(source='admin.email', read_only=True)
-    members_count = serializers.IntegerField(source='members.count', read_only=True)
+    members_count = serializers.SerializerMethodField()
+    subadmins_count = serializers.SerializerMethodField()
+    is_member = serializers.SerializerMethodField()
     chat_websocket_url = serializers.SerializerMethodField()
-    members = ClubMembershipSerializer(source='memberships', many=True, read_only=True)
 
     class Meta:
         model = models.Club
         fields = ['id', 'name', 'description', 'admin_username', 'admin_email', 
-                 'members_count', 'chat_websocket_url', 'members', 'created_at', 'is_active']
+                 'members_count', 'subadmins_count', 'is_member', 'chat_websocket_url', 'created_at', 'is_active']
+
+    def get_subadmins_count(self, obj):
+        subadmins_count = getattr(obj, 'subadmins_count', None)
+        if subadmins_count is None:
+            return obj.memberships.filter(is_subadmin=True).count()
+        return subadmins_count
 
     def get_chat_websocket_url(self, obj):
         """Generate the WebSocket URL for this club's chat"""
         return f"/ws/chat/{obj.id}/"
 
 
+class BulkMembershipSerializer(serializers.Serializer):
+    """Users targeted by a bulk membership action, by id and/or username."""
+    max_users = 1000
+
+    user_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    usernames = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    is_subadmin = serializers.BooleanField(required=False, default=True)
+
+    def validate(self, attrs):
+        total = len(attrs['user_ids']) + len(attrs['usernames'])
+        if not total:
+            raise serializers.ValidationError('Provide user_ids and/or usernames.')
+        if total > self.max_users:
+            raise serializers.ValidationError(f'At most {self.max_users} users per request.')
+        return attrs
+
+
 class PostSerializer(serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
 
@@ -103,4 +153,13 @@ class DashboardSerializer(serializers.Serializer):
     memberships = ClubMembershipSerializerForDashboard(many=True)
     clubs_count = serializers.IntegerField()
     recent_posts = PostSerializerForDashboard(many=True)
-    upcoming_events = EventSerializerForDashboard(many=True)
\ No newline at end of file
+    upcoming_events = EventSerializerForDashboard(many=True)
+
+
+class LeaderboardEntrySerializer(serializers.ModelSerializer):
+    user_id = serializers.IntegerField(read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = models.LeaderboardEntry
+        fields = ['rank', 'user_id', 'username', 'xp_points']
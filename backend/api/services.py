@@ -1,26 +1,106 @@
-from . import models
+from . import feed, models
+from .chat_groups import notify_memberships_changed
+from .membership_cache import membership_cache
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
-from django.core.mail import send_mail
+from .outbox import queue_email
 from django.conf import settings
-from django.db.models import F
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Case, Count, Exists, IntegerField, OuterRef, Value, When, BooleanField, Sum
+import threading
+import time
+
+def annotate_clubs(queryset, user):
+    """
+    Annotate a club queryset with members_count and a per-user is_member flag
+    so serializers don't issue extra queries per club.
+    """
+    if user is not None and user.is_authenticated:
+        is_member = Exists(models.ClubMembership.objects.filter(club=OuterRef('pk'), user=user))
+    else:
+        is_member = Value(False, output_field=BooleanField())
+    return queryset.select_related('admin').annotate(
+        members_count=Count('memberships', distinct=True),
+        is_member=is_member,
+    )
 
 def get_student_dashboard_data(user):
     """
     Get the data for the student dashboard.
     """
-    memberships = models.ClubMembership.objects.filter(user=user).select_related('club')
-    user_clubs = [membership.club for membership in memberships]
-    recent_posts = models.Post.objects.filter(club__in=user_clubs).select_related('author', 'club').order_by('-created_at')[:5]
-    upcoming_events = models.Event.objects.filter(club__in=user_clubs, date__gte=timezone.now()).order_by('date')[:3]
+    memberships = list(models.ClubMembership.objects.filter(user=user).select_related('club'))
+    user_club_ids = [membership.club_id for membership in memberships]
+    recent_posts = [post for _, post in feed.get_feed(user, limit=5, kinds=(feed.POST,))[0]]
+    upcoming_events = models.Event.objects.filter(club_id__in=user_club_ids, date__gte=timezone.now()).select_related('club').order_by('date')[:3]
 
     return {
         'memberships': memberships,
-        'clubs_count': memberships.count(),
+        'clubs_count': len(memberships),
         'recent_posts': recent_posts,
         'upcoming_events': upcoming_events,
     }
 
+def dashboard_cache_key(user_id):
+    return f'dashboard:v2:{user_id}'
+
+def dashboard_version_cache_key(club_id):
+    return f'dashboard-version:v1:{club_id}'
+
+def get_cached_dashboard(user):
+    """
+    (cached dashboard data or None, stamp to cache a rebuilt one with).
+    Cached dashboards carry the version stamps (ns since the epoch) of the
+    user's clubs when they were built; a write to a club bumps its stamp,
+    so every member's dashboard goes stale without being looked up.
+    """
+    key = dashboard_cache_key(user.id)
+    version_keys = {dashboard_version_cache_key(club_id): club_id for club_id in membership_cache.get(user).club_ids}
+    found = cache.get_many([key, *version_keys])
+    versions = {club_id: found[version_key] for version_key, club_id in version_keys.items() if version_key in found}
+    missing = {version_key: time.time_ns() for version_key, club_id in version_keys.items() if club_id not in versions}
+    if missing:
+        # An evicted stamp just makes the members' dashboards rebuild once more
+        cache.set_many(missing, None)
+        versions.update((version_keys[version_key], version) for version_key, version in missing.items())
+    stamp = sorted(versions.items())
+    cached = found.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1], stamp
+    return None, stamp
+
+def dashboard_cache_timeout(dashboard_data):
+    """
+    Cache until the first upcoming event starts (it then drops off the
+    dashboard), capped at DASHBOARD_CACHE_TIMEOUT.
+    """
+    timeout = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+    events = list(dashboard_data['upcoming_events'])
+    if events:
+        until_first_event = (events[0].date - timezone.now()).total_seconds()
+        timeout = max(1, min(timeout, int(until_first_event)))
+    return timeout
+
+def invalidate_dashboards(*user_ids):
+    """
+    Drop the cached dashboards of the given users, now and once the
+    surrounding transaction commits.
+    """
+    keys = [dashboard_cache_key(user_id) for user_id in user_ids if user_id is not None]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+def invalidate_club_dashboards(club_id):
+    """
+    Outdate the cached dashboards of every member of a club by bumping the
+    club's version stamp, now and once the surrounding transaction commits.
+    """
+    key = dashboard_version_cache_key(club_id)
+    cache.set(key, time.time_ns(), None)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), None))
+
 def get_fake_dashboard_data():
     """
     Get fake data for the student dashboard.
@@ -87,8 +167,8 @@ def get_club_dashboard_data(user, club_id):
     
     if user.is_authenticated:
         is_superuser = user.is_superuser
-        is_admin = club.admin == user
-        is_member = club.members.filter(id=user.id).exists()
+        is_admin = club.admin_id == user.id
+        is_member = membership_cache.is_member(user, club.id)
         
         if is_superuser:
             is_member = True
@@ -121,13 +201,39 @@ def get_club_events_data(user):
     """
     user_memberships = models.ClubMembership.objects.filter(user=user).select_related('club')
     user_clubs = [membership.club for membership in user_memberships]
-    upcoming_events = models.Event.objects.filter(club__in=user_clubs, date__gte=timezone.now()).order_by('date')
-    
+    upcoming_events = filter_events(models.Event.objects.select_related('club'), user, mine=True)
+
     return {
         'events': upcoming_events,
         'user_clubs': user_clubs,
     }
 
+def club_roster(club_id, is_subadmin=None, username_prefix=None):
+    """
+    A club's memberships with their users, optionally only (non-)subadmins
+    or members whose username starts with a prefix.
+    """
+    queryset = models.ClubMembership.objects.filter(club_id=club_id).select_related('user')
+    if is_subadmin is not None:
+        queryset = queryset.filter(is_subadmin=is_subadmin)
+    if username_prefix:
+        queryset = queryset.filter(user__username__istartswith=username_prefix)
+    return queryset
+
+def filter_events(queryset, user, start=None, end=None, club_id=None, mine=False):
+    """
+    Restrict an event queryset to dates in [start, end) (start defaults to
+    now, so only upcoming events), one club and/or the user's clubs.
+    """
+    queryset = queryset.filter(date__gte=start or timezone.now())
+    if end is not None:
+        queryset = queryset.filter(date__lt=end)
+    if club_id is not None:
+        queryset = queryset.filter(club_id=club_id)
+    if mine:
+        queryset = queryset.filter(club_id__in=membership_cache.get(user).club_ids)
+    return queryset.order_by('date', 'id')
+
 def create_club(user, validated_data):
     """
     Create a new club.
@@ -149,40 +255,34 @@ def create_club(user, validated_data):
 
 def send_club_creation_notification(club, creator):
     """
-    Send notification email to admins if club needs approval.
+    Queue a notification email to admins if club needs approval.
     """
     if not club.is_active:
         superusers = models.User.objects.filter(is_superuser=True)
-        send_mail(
+        queue_email(
             subject=f'New Club Pending Approval: {club.name}',
             message=f'A new club "{club.name}" has been created by {creator.username} and needs approval.',
-            from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[u.email for u in superusers if u.email],
-            fail_silently=True
         )
 
 def send_approval_email(club):
     """
-    Send approval email to club admin.
+    Queue an approval email to the club admin.
     """
-    send_mail(
+    queue_email(
         subject=f'Your Club "{club.name}" has been approved!',
         message=f'Congratulations! Your club "{club.name}" has been approved and is now active.',
-        from_email=settings.DEFAULT_FROM_EMAIL,
         recipient_list=[club.admin.email],
-        fail_silently=True
     )
 
 def send_rejection_email(club, reason):
     """
-    Send rejection email to club admin.
+    Queue a rejection email to the club admin.
     """
-    send_mail(
+    queue_email(
         subject=f'Your Club "{club.name}" was not approved',
         message=f'Unfortunately, your club "{club.name}" was not approved.\n\nReason: {reason}',
-        from_email=settings.DEFAULT_FROM_EMAIL,
         recipient_list=[club.admin.email],
-        fail_silently=True
     )
 
 def approve_club(club):
@@ -192,11 +292,11 @@ def approve_club(club):
     if club.is_active:
         return False, 'Club is already active'
     
-    club.is_active = True
-    club.approved_date = timezone.now()
-    club.save(update_fields=['is_active', 'approved_date'])
-    
-    send_approval_email(club)
+    with transaction.atomic():
+        club.is_active = True
+        club.approved_date = timezone.now()
+        club.save(update_fields=['is_active', 'approved_date'])
+        send_approval_email(club)
     
     return True, 'Club approved successfully'
 
@@ -210,11 +310,11 @@ def reject_club(club, reason):
     if not reason:
         return False, 'Rejection reason is required'
         
-    club.rejected_reason = reason
-    club.rejection_date = timezone.now()
-    club.save()
-    
-    send_rejection_email(club, reason)
+    with transaction.atomic():
+        club.rejected_reason = reason
+        club.rejection_date = timezone.now()
+        club.save()
+        send_rejection_email(club, reason)
     
     return True, 'Club rejected'
 
@@ -222,17 +322,10 @@ def join_club(club, user):
     """
     Join a club.
     """
-    if club.members.filter(id=user.id).exists():
+    if membership_cache.is_member(user, club.id):
         return False, 'Already a member'
     
-    membership, _ = models.ClubMembership.objects.get_or_create(club=club, user=user)
-    membership.is_subadmin = membership.is_subadmin or False
-    membership.save()
-    club.members.add(user)
-    
-    user.xp_points = F('xp_points') + 5
-    user.save(update_fields=['xp_points'])
-    user.refresh_from_db()
+    add_members(club, [user.id])
     
     return True, 'joined'
 
@@ -240,14 +333,13 @@ def leave_club(club, user):
     """
     Leave a club.
     """
-    if not club.members.filter(id=user.id).exists():
+    if not membership_cache.is_member(user, club.id):
         return False, 'Not a member'
     
-    if user == club.admin:
+    if user.id == club.admin_id:
         return False, 'Club admin cannot leave. Transfer admin role first.'
     
-    club.members.remove(user)
-    models.ClubMembership.objects.filter(club=club, user=user).delete()
+    remove_members(club, [user.id])
     
     return True, 'left'
 
@@ -255,14 +347,13 @@ def kick_member(club, user_to_kick):
     """
     Kick a member from a club.
     """
-    if not club.members.filter(id=user_to_kick.id).exists():
+    if not membership_cache.is_member(user_to_kick, club.id):
         return False, 'Not a member'
         
-    if user_to_kick == club.admin:
+    if user_to_kick.id == club.admin_id:
         return False, 'Cannot kick the club admin'
         
-    club.members.remove(user_to_kick)
-    models.ClubMembership.objects.filter(club=club, user=user_to_kick).delete()
+    remove_members(club, [user_to_kick.id])
     
     return True, 'Member kicked'
 
@@ -270,12 +361,104 @@ def set_subadmin(club, user, is_subadmin):
     """
     Set or remove subadmin status for a user in a club.
     """
-    membership, _ = models.ClubMembership.objects.get_or_create(club=club, user=user)
-    membership.is_subadmin = is_subadmin
-    membership.save()
+    membership, created = models.ClubMembership.objects.get_or_create(
+        club=club, user=user, defaults={'is_subadmin': is_subadmin}
+    )
+    if not created and membership.is_subadmin != is_subadmin:
+        membership.is_subadmin = is_subadmin
+        membership.save(update_fields=['is_subadmin'])
     
     return membership
 
+def resolve_users(user_ids=(), usernames=()):
+    """
+    Look up users by id and by username, with one query for each.
+    Returns {requested id or username: user_id} for the users that exist.
+    """
+    found = {}
+    if user_ids:
+        found.update((user_id, user_id) for user_id in models.User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    if usernames:
+        found.update(models.User.objects.filter(username__in=usernames).values_list('username', 'id'))
+    return found
+
+def _memberships_changed(club, user_ids, added):
+    # The bulk membership writes skip the model signals, so do their work here
+    membership_cache.invalidate(*user_ids)
+    invalidate_dashboards(*user_ids)
+    if added:
+        feed.backfill(user_ids, club.id)
+    else:
+        feed.remove(user_ids, club.id)
+    notify_memberships_changed(club.id, user_ids, added)
+
+def add_members(club, user_ids):
+    """
+    Add users to a club with a single INSERT, awarding the join XP to those
+    who weren't members yet. Returns {user_id: 'added' | 'already_member'}.
+    """
+    user_ids = set(user_ids)
+    with transaction.atomic():
+        existing = set(
+            models.ClubMembership.objects.filter(club=club, user_id__in=user_ids).values_list('user_id', flat=True)
+        )
+        added = sorted(user_ids - existing)
+        if added:
+            models.ClubMembership.objects.bulk_create(
+                [models.ClubMembership(club=club, user_id=user_id) for user_id in added],
+                ignore_conflicts=True,
+            )
+            award_xp_many(added, models.XPEvent.JOIN_CLUB, club)
+            _memberships_changed(club, added, added=True)
+    outcomes = {user_id: 'already_member' for user_id in existing}
+    outcomes.update((user_id, 'added') for user_id in added)
+    return outcomes
+
+def remove_members(club, user_ids):
+    """
+    Remove users from a club with a single DELETE. The club admin is never
+    removed. Returns {user_id: 'removed' | 'not_member' | 'is_admin'}.
+    """
+    user_ids = set(user_ids)
+    outcomes = {user_id: 'not_member' for user_id in user_ids}
+    if club.admin_id in user_ids:
+        outcomes[club.admin_id] = 'is_admin'
+        user_ids.discard(club.admin_id)
+    with transaction.atomic():
+        memberships = models.ClubMembership.objects.filter(club=club, user_id__in=user_ids)
+        removed = sorted(memberships.values_list('user_id', flat=True))
+        if removed:
+            # One DELETE, without the collector's per-row fetch and post_delete
+            # signals (nothing references memberships); their cache, dashboard
+            # and timeline work is done once for the batch below
+            table = models.ClubMembership._meta.db_table
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE club_id = %s AND user_id IN ({", ".join(["%s"] * len(removed))})',
+                    [club.id, *removed],
+                )
+            _memberships_changed(club, removed, added=False)
+    outcomes.update((user_id, 'removed') for user_id in removed)
+    return outcomes
+
+def set_subadmins(club, user_ids, is_subadmin):
+    """
+    Set or clear subadmin status for members of a club with a single
+    UPDATE. Returns {user_id: 'updated' | 'unchanged' | 'not_member'}.
+    """
+    user_ids = set(user_ids)
+    outcomes = {user_id: 'not_member' for user_id in user_ids}
+    with transaction.atomic():
+        memberships = models.ClubMembership.objects.filter(club=club, user_id__in=user_ids)
+        current = dict(memberships.values_list('user_id', 'is_subadmin'))
+        changed = sorted(user_id for user_id, flag in current.items() if flag != is_subadmin)
+        if changed:
+            memberships.filter(user_id__in=changed).update(is_subadmin=is_subadmin, updated_at=timezone.now())
+            membership_cache.invalidate(*changed)
+    outcomes.update((user_id, 'unchanged') for user_id in current)
+    outcomes.update((user_id, 'updated') for user_id in changed)
+    return outcomes
+
 def set_admin(club, new_admin):
     """
     Set a new admin for the club.
@@ -286,4 +469,178 @@ def set_admin(club, new_admin):
     # Ensure the new admin is a member
     models.ClubMembership.objects.get_or_create(club=club, user=new_admin)
     
-    return club
\ No newline at end of file
+    return club
+
+XP_REWARDS = {
+    models.XPEvent.JOIN_CLUB: 5,
+    models.XPEvent.POST: 10,
+    models.XPEvent.MESSAGE: 5,
+}
+
+_xp_awards_since_compaction = 0
+_xp_lock = threading.Lock()
+
+def award_xp(user, reason, club=None):
+    """
+    Record an XP award in the ledger. Every XP_COMPACTION_THRESHOLD awards
+    (per process) the ledger is compacted once the transaction commits.
+    """
+    award_xp_many([user.id], reason, club)
+
+def award_xp_many(user_ids, reason, club=None):
+    """
+    Record the same XP award for several users with a single INSERT.
+    """
+    global _xp_awards_since_compaction
+    models.XPEvent.objects.bulk_create([
+        models.XPEvent(user_id=user_id, club=club, amount=XP_REWARDS[reason], reason=reason) for user_id in user_ids
+    ])
+    with _xp_lock:
+        _xp_awards_since_compaction += len(user_ids)
+        threshold = getattr(settings, 'XP_COMPACTION_THRESHOLD', 500)
+        should_compact = _xp_awards_since_compaction >= threshold
+        if should_compact:
+            _xp_awards_since_compaction = 0
+    if should_compact:
+        # Runs on a user-facing request: one batch of about what this process
+        # awarded, and the compact_xp cron job drains any backlog
+        transaction.on_commit(lambda: compact_xp(batch_size=threshold, batches=1))
+
+def get_xp_points(user):
+    """
+    Current XP of a user: the compacted total plus awards still in the ledger.
+    """
+    pending = models.XPEvent.objects.filter(user=user, applied=False).aggregate(total=Sum('amount'))['total']
+    return user.xp_points + (pending or 0)
+
+def compact_xp(batch_size=None, batches=None):
+    """
+    Fold pending ledger entries into User.xp_points and the per-club
+    leaderboard totals, XP_COMPACTION_BATCH_SIZE entries per transaction,
+    until none are left or `batches` batches are done. Returns the number
+    of ledger entries applied.
+    """
+    batch_size = batch_size or getattr(settings, 'XP_COMPACTION_BATCH_SIZE', 5000)
+    applied = done = 0
+    while True:
+        count = _compact_xp_batch(batch_size)
+        applied += count
+        done += 1
+        if count < batch_size or (batches and done >= batches):
+            return applied
+
+def _compact_xp_batch(batch_size):
+    with transaction.atomic():
+        # Claim the entries first: a compaction running concurrently (the
+        # on_commit one and compact_xp, say) skips locked rows instead of
+        # adding them a second time. SQLite serializes writers instead.
+        claimed = list(
+            models.XPEvent.objects.filter(applied=False)
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', 'user_id', 'club_id', 'amount')[:batch_size]
+        )
+        if not claimed:
+            return 0
+
+        user_totals = {}
+        club_totals = {}
+        for _, user_id, club_id, amount in claimed:
+            user_totals[user_id] = user_totals.get(user_id, 0) + amount
+            if club_id is not None:
+                club_totals[(club_id, user_id)] = club_totals.get((club_id, user_id), 0) + amount
+
+        # One UPDATE per chunk of users, each adding its own total
+        user_totals = sorted(user_totals.items())
+        for start in range(0, len(user_totals), 1000):
+            chunk = user_totals[start:start + 1000]
+            models.User.objects.filter(id__in=[user_id for user_id, _ in chunk]).update(xp_points=F('xp_points') + Case(
+                *[When(id=user_id, then=Value(total)) for user_id, total in chunk],
+                output_field=IntegerField(),
+            ))
+
+        if club_totals:
+            club_ids = sorted({club_id for club_id, _ in club_totals})
+            user_ids = {user_id for _, user_id in club_totals}
+            # Leaderboard entries are read, added to and created here; locking
+            # their clubs keeps a concurrent compaction from doing the same
+            list(models.Club.objects.filter(id__in=club_ids).order_by('id').select_for_update().values_list('id', flat=True))
+            entries = models.LeaderboardEntry.objects.filter(club_id__in=club_ids, user_id__in=user_ids)
+            existing = {(entry.club_id, entry.user_id): entry for entry in entries}
+            changed, created = [], []
+            for key, total in club_totals.items():
+                entry = existing.get(key)
+                if entry is None:
+                    created.append(models.LeaderboardEntry(club_id=key[0], user_id=key[1], xp_points=total))
+                else:
+                    entry.xp_points += total
+                    changed.append(entry)
+            models.LeaderboardEntry.objects.bulk_update(changed, ['xp_points'], batch_size=1000)
+            models.LeaderboardEntry.objects.bulk_create(created, batch_size=1000)
+
+        models.XPEvent.objects.filter(id__in=[row[0] for row in claimed]).update(applied=True)
+        return len(claimed)
+
+def _ranked(rows):
+    """
+    Yield (row, rank) for rows sorted by descending xp, with tied xp sharing a rank.
+    """
+    rank, previous_xp = 0, None
+    for position, row in enumerate(rows, start=1):
+        if row[-1] != previous_xp:
+            rank, previous_xp = position, row[-1]
+        yield row, rank
+
+def rebuild_leaderboards():
+    """
+    Recompute the precomputed global and per-club rankings.
+    """
+    with transaction.atomic():
+        users = models.User.objects.filter(xp_points__gt=0).order_by('-xp_points', 'id').values_list('id', 'xp_points')
+        models.LeaderboardEntry.objects.filter(club__isnull=True).delete()
+        models.LeaderboardEntry.objects.bulk_create(
+            (models.LeaderboardEntry(user_id=user_id, xp_points=xp, rank=rank) for (user_id, xp), rank in _ranked(users.iterator())),
+            batch_size=1000,
+        )
+
+        changed = []
+        club_id, club_rows = None, []
+        entries = (
+            models.LeaderboardEntry.objects.filter(club__isnull=False)
+            .order_by('club_id', '-xp_points', 'user_id')
+            .values_list('id', 'club_id', 'rank', 'xp_points')
+        )
+        for row in entries.iterator():
+            if row[1] != club_id:
+                changed.extend(_rerank(club_rows))
+                club_id, club_rows = row[1], []
+            club_rows.append(row)
+        changed.extend(_rerank(club_rows))
+        models.LeaderboardEntry.objects.bulk_update(changed, ['rank'], batch_size=1000)
+
+def _rerank(rows):
+    return [
+        models.LeaderboardEntry(id=entry_id, rank=rank)
+        for (entry_id, _, current_rank, _), rank in _ranked(rows)
+        if rank != current_rank
+    ]
+
+def get_leaderboard(club_id=None, limit=10):
+    """
+    Top entries of the global (club_id=None) or a club leaderboard.
+    """
+    return (
+        models.LeaderboardEntry.objects.filter(club_id=club_id, rank__isnull=False)
+        .select_related('user')
+        .order_by('rank', 'user_id')[:limit]
+    )
+
+def get_leaderboard_entry(user, club_id=None):
+    """
+    The user's ranked entry on a leaderboard, or None if they aren't ranked yet.
+    """
+    return (
+        models.LeaderboardEntry.objects.filter(club_id=club_id, user=user, rank__isnull=False)
+        .select_related('user')
+        .first()
+    )
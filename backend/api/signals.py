@@ -0,0 +1,109 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import archive, feed, ical, models, services
+from .chat_groups import notify_memberships_changed
+from .membership_cache import membership_cache
+
+
+@receiver(post_save, sender=models.ClubMembership)
+@receiver(post_delete, sender=models.ClubMembership)
+def invalidate_membership(sender, instance, **kwargs):
+    membership_cache.invalidate(instance.user_id)
+    services.invalidate_dashboards(instance.user_id)
+
+
+@receiver(post_save, sender=models.ClubMembership)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        feed.backfill([instance.user_id], instance.club_id)
+        notify_memberships_changed(instance.club_id, [instance.user_id], added=True)
+
+
+@receiver(post_delete, sender=models.ClubMembership)
+def clear_timeline(sender, instance, **kwargs):
+    feed.remove([instance.user_id], instance.club_id)
+    notify_memberships_changed(instance.club_id, [instance.user_id], added=False)
+
+
+@receiver(m2m_changed, sender=models.Club.members.through)
+def invalidate_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # club.members.add() bulk-creates ClubMembership rows without post_save.
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        user_ids = [instance.pk]
+    elif action == 'pre_clear':
+        user_ids = list(instance.memberships.values_list('user_id', flat=True))
+    else:
+        user_ids = list(pk_set or ())
+    membership_cache.invalidate(*user_ids)
+    services.invalidate_dashboards(*user_ids)
+
+    # Timelines, per club: {club_id: [user_id, ...]}
+    if not reverse:
+        changes = {instance.pk: user_ids}
+    elif action == 'pre_clear':
+        changes = {club_id: [instance.pk] for club_id in instance.memberships.values_list('club_id', flat=True)}
+    else:
+        changes = {club_id: [instance.pk] for club_id in pk_set or ()}
+    for club_id, club_user_ids in changes.items():
+        if action == 'post_add':
+            feed.backfill(club_user_ids, club_id)
+        else:
+            feed.remove(club_user_ids, club_id)
+        notify_memberships_changed(club_id, club_user_ids, added=action == 'post_add')
+
+
+@receiver(post_init, sender=models.Club)
+def remember_club_state(sender, instance, **kwargs):
+    # Read __dict__ directly so deferred fields aren't fetched one row at a time.
+    instance._loaded_admin_id = instance.__dict__.get('admin_id')
+    instance._loaded_is_active = instance.__dict__.get('is_active')
+    instance._loaded_name = instance.__dict__.get('name')
+
+
+@receiver(post_save, sender=models.Club)
+def invalidate_club_state(sender, instance, created, **kwargs):
+    if created or instance.admin_id != instance._loaded_admin_id:
+        membership_cache.invalidate(instance._loaded_admin_id, instance.admin_id)
+    if not created and instance.is_active != instance._loaded_is_active:
+        membership_cache.invalidate(*instance.memberships.values_list('user_id', flat=True))
+    if not created and instance.name != instance._loaded_name:
+        # Dashboards and calendar feeds embed club names
+        services.invalidate_club_dashboards(instance.id)
+        ical.bump_versions(instance.id)
+    remember_club_state(sender, instance)
+
+
+@receiver(post_delete, sender=models.Club)
+def invalidate_deleted_club(sender, instance, **kwargs):
+    membership_cache.invalidate(instance.admin_id)
+
+
+@receiver(post_delete, sender=models.Club)
+def drop_club_archive(sender, instance, **kwargs):
+    club_id = instance.id
+    transaction.on_commit(lambda: archive.delete_club(club_id))
+
+
+@receiver(post_save, sender=models.Post)
+@receiver(post_delete, sender=models.Post)
+@receiver(post_save, sender=models.Event)
+@receiver(post_delete, sender=models.Event)
+def invalidate_club_activity(sender, instance, **kwargs):
+    services.invalidate_club_dashboards(instance.club_id)
+
+
+@receiver(post_save, sender=models.Event)
+@receiver(post_delete, sender=models.Event)
+def bump_calendar_version(sender, instance, **kwargs):
+    ical.bump_versions(instance.club_id)
+
+
+@receiver(post_save, sender=models.Post)
+@receiver(post_save, sender=models.Event)
+def fan_out_activity(sender, instance, created, **kwargs):
+    if created:
+        feed.fan_out(instance)
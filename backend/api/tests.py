@@ -0,0 +1,844 @@
+import asyncio
+import io
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import archive, benchmarks, chat_codec, chat_limits, outbox, presence, search, services
+from .chat_groups import club_group
+from .chat_history import RecentMessageBuffer
+from .consumers import ChatConsumer
+from .membership_cache import membership_cache
+from .models import Club, ClubMembership, Event, LeaderboardEntry, Message, OutboxEmail, Post, User, XPEvent
+from .routing import websocket_urlpatterns
+
+
+class ClubListQueryCountTests(TestCase):
+    """The club list costs the same number of queries however many clubs there are."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='member', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_clubs(self, count):
+        for _ in range(count):
+            admin = User.objects.create_user(username=f'admin{User.objects.count()}')
+            club = Club.objects.create(name=f'Club {admin.username}', admin=admin, is_active=True)
+            ClubMembership.objects.create(club=club, user=admin)
+            ClubMembership.objects.create(club=club, user=self.user)
+
+    def list_clubs(self):
+        # Cold caches, so every run pays for the membership lookup too
+        cache.clear()
+        response = self.client.get('/api/clubs/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assert_constant_queries(self):
+        # Memberships, administered clubs, the list validator and the clubs themselves
+        self.create_clubs(2)
+        with self.assertNumQueries(4):
+            self.assertEqual(len(self.list_clubs()), 2)
+        self.create_clubs(10)
+        with self.assertNumQueries(4):
+            clubs = self.list_clubs()
+        self.assertEqual(len(clubs), 12)
+        self.assertTrue(all(club['is_member'] and club['members_count'] == 2 for club in clubs))
+
+    def test_query_count_is_independent_of_club_count(self):
+        self.assert_constant_queries()
+
+    @override_settings(LEAN_LIST_RESPONSES=False)
+    def test_serializer_query_count_is_independent_of_club_count(self):
+        self.assert_constant_queries()
+
+
+class RecentMessageBufferTests(SimpleTestCase):
+    """The buffer follows (created_at, id) order, which write-behind ids don't."""
+
+    def buffer(self, *messages):
+        buffer = RecentMessageBuffer(maxlen=10)
+        buffer.subscribe(1)
+        buffer._warm.add(1)
+        for message_id, second in messages:
+            buffer.append(1, {'id': message_id, 'club': 1, 'created_at': f'2025-01-01T12:00:{second:02d}Z'})
+        return buffer
+
+    def test_since_follows_send_order_not_ids(self):
+        # Sent over a websocket, REST, then the websocket again: ids from two reserved blocks
+        buffer = self.buffer((1, 1), (501, 2), (2, 3))
+        self.assertEqual([m['id'] for m in buffer.latest(1, 10)], [1, 501, 2])
+        self.assertEqual([m['id'] for m in buffer.since(1, 501)], [2])
+        self.assertEqual([m['id'] for m in buffer.since(1, 1)], [501, 2])
+
+    def test_out_of_order_delivery_is_sorted(self):
+        buffer = self.buffer((1, 1), (2, 3), (501, 2))
+        self.assertEqual([m['id'] for m in buffer.latest(1, 10)], [1, 501, 2])
+
+    def test_unbuffered_last_id_falls_back(self):
+        self.assertIsNone(self.buffer((1, 1)).since(1, 7))
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class RestMessageBroadcastTests(TestCase):
+    """Messages posted through the REST API reach the club's chat group like websocket ones."""
+
+    def test_rest_message_is_broadcast_on_commit(self):
+        user = User.objects.create_user(username='member')
+        club = Club.objects.create(name='Club', admin=user, is_active=True)
+        ClubMembership.objects.create(club=club, user=user)
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(club_group(club.id), channel)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/messages/', {'club': club.id, 'text': 'hello'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(event['type'], 'chat_message')
+        self.assertEqual(event['message'], response.json())
+
+
+class DashboardCacheTests(TestCase):
+    """The dashboard's cold path has a fixed query count, and club writes outdate it without a member lookup."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='member')
+        self.clubs = []
+        for index in range(3):
+            club = Club.objects.create(name=f'Club {index}', admin=self.user, is_active=True)
+            ClubMembership.objects.create(club=club, user=self.user)
+            Post.objects.create(club=club, author=self.user, content=f'Post {index}')
+            Event.objects.create(club=club, title=f'Event {index}', date=timezone.now() + timedelta(days=index + 1))
+            self.clubs.append(club)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_dashboard(self):
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cold_path_query_count(self):
+        cache.clear()
+        # Membership cache (2), memberships, club sizes, timeline, posts, events
+        with self.assertNumQueries(7):
+            self.get_dashboard()
+        with self.assertNumQueries(0):
+            self.get_dashboard()
+
+    def test_club_write_outdates_dashboard(self):
+        self.get_dashboard()
+        # The insert and its timeline fan-out; nothing per member for the dashboards
+        with self.assertNumQueries(3):
+            Post.objects.create(club=self.clubs[0], author=self.user, content='Fresh')
+        self.assertEqual(self.get_dashboard()['recent_posts'][0]['content'], 'Fresh')
+
+
+class CompactXPTests(TestCase):
+    """Compaction applies every ledger entry exactly once, batch by batch."""
+
+    def test_entries_are_applied_once(self):
+        user = User.objects.create_user(username='member')
+        club = Club.objects.create(name='Club', admin=user, is_active=True)
+        services.award_xp_many([user.id] * 5, XPEvent.POST, club)
+        services.award_xp(user, XPEvent.JOIN_CLUB)
+
+        self.assertEqual(services.compact_xp(batch_size=4), 6)
+        self.assertEqual(services.compact_xp(batch_size=4), 0)
+        user.refresh_from_db()
+        self.assertEqual(user.xp_points, 55)
+        self.assertEqual(services.get_xp_points(user), 55)
+        self.assertEqual(LeaderboardEntry.objects.get(club=club, user=user).xp_points, 50)
+        self.assertFalse(XPEvent.objects.filter(applied=False).exists())
+
+    def test_users_are_updated_in_one_statement(self):
+        users = [User.objects.create_user(username=f'member{index}') for index in range(3)]
+        services.award_xp_many([user.id for user in users], XPEvent.POST)
+        services.award_xp(users[0], XPEvent.POST)
+        # Savepoint, claim, the users' UPDATE, marking the entries applied, release
+        with self.assertNumQueries(5):
+            self.assertEqual(services.compact_xp(), 4)
+        self.assertEqual(
+            list(User.objects.filter(id__in=[user.id for user in users]).order_by('id').values_list('xp_points', flat=True)),
+            [20, 10, 10],
+        )
+
+    @override_settings(XP_COMPACTION_THRESHOLD=2)
+    def test_threshold_compacts_one_batch(self):
+        user = User.objects.create_user(username='member')
+        services.award_xp_many([user.id] * 3, XPEvent.POST)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.award_xp_many([user.id] * 2, XPEvent.POST)
+        # One batch of XP_COMPACTION_THRESHOLD entries; the cron job drains the rest
+        self.assertEqual(XPEvent.objects.filter(applied=False).count(), 3)
+
+
+class BenchmarkBudgetTests(TestCase):
+    """The benchmark_api suite on a small dataset, held to benchmark_budgets.json."""
+
+    def test_endpoints_within_query_budgets(self):
+        benchmarks.seed(
+            users=40, clubs=6, members_per_club=8, messages_per_club=60,
+            posts_per_club=5, events_per_club=3, skew=1.0, seed=1,
+        )
+        results = benchmarks.run(iterations=2, warmup=1)
+        self.assertEqual(set(results), set(benchmarks.ENDPOINTS))
+        budgets = benchmarks.load_json(benchmarks.BUDGETS)
+        self.assertEqual(benchmarks.check(results, budgets), [])
+
+
+class RemoveMembersTests(TestCase):
+    """Bulk removal deletes in one statement and still does the signal handlers' work."""
+
+    def test_remove_members(self):
+        admin = User.objects.create_user(username='admin')
+        club = Club.objects.create(name='Club', admin=admin, is_active=True)
+        members = [User.objects.create_user(username=f'member{index}') for index in range(3)]
+        for user in [admin, *members]:
+            ClubMembership.objects.create(club=club, user=user)
+        self.assertTrue(membership_cache.is_member(members[0], club.id))
+
+        outcomes = services.remove_members(club, [admin.id, members[0].id, members[1].id, 999])
+
+        self.assertEqual(outcomes, {admin.id: 'is_admin', members[0].id: 'removed', members[1].id: 'removed', 999: 'not_member'})
+        self.assertEqual(
+            set(ClubMembership.objects.filter(club=club).values_list('user_id', flat=True)), {admin.id, members[2].id},
+        )
+        self.assertFalse(membership_cache.is_member(members[0], club.id))
+        self.assertTrue(membership_cache.is_member(members[2], club.id))
+
+
+class LeanListResponseTests(TestCase):
+    """The lean list responses are byte for byte the serializers'."""
+
+    def setUp(self):
+        cache.clear()
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir, True)
+        settings_override = override_settings(CHAT_ARCHIVE_DIR=archive_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(username='member')
+        other = User.objects.create_user(username='other')
+        self.club = Club.objects.create(name='Club', description='Chess & more', admin=self.user, is_active=True)
+        Club.objects.create(name='Pending', admin=other)
+        ClubMembership.objects.create(club=self.club, user=self.user)
+        Post.objects.create(club=self.club, author=other, content='Hello "world"')
+        Event.objects.create(club=self.club, title='Meetup', date=timezone.now() + timedelta(days=2, microseconds=5))
+        now = timezone.now()
+        for days_ago in (40, 39, 38, 2, 1, 0):
+            Message.objects.create(
+                club=self.club, author=self.user if days_ago % 2 else other,
+                text=f'Message from {days_ago} days ago', created_at=now - timedelta(days=days_ago, microseconds=days_ago),
+            )
+        # The three oldest messages move to the cold archive
+        self.addCleanup(archive.delete_club, self.club.id)
+        self.assertEqual(archive.archive_club(self.club.id, now - timedelta(days=30)), 3)
+
+    def assert_same_bodies(self, client, path):
+        with override_settings(LEAN_LIST_RESPONSES=False):
+            expected = client.get(path)
+        with override_settings(LEAN_LIST_RESPONSES=True):
+            actual = client.get(path)
+        self.assertEqual(expected.status_code, 200)
+        self.assertEqual(actual.content, expected.content, path)
+        return actual.json()
+
+    def test_lean_matches_serializers(self):
+        member, anonymous = APIClient(), APIClient()
+        member.force_authenticate(self.user)
+        for client in (member, anonymous):
+            for path in ('/api/clubs/', '/api/posts/', '/api/events/', f'/api/messages/?club={self.club.id}'):
+                self.assert_same_bodies(client, path)
+
+    def test_message_page_mixing_archived_and_live_rows(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        page = self.assert_same_bodies(client, f'/api/messages/?club={self.club.id}&limit=5')
+        self.assertEqual(len(page['results']), 5)
+        self.assertEqual(page['results'][0]['text'], 'Message from 39 days ago')
+        self.assertEqual(Message.objects.filter(club=self.club).count(), 3)
+        older = self.assert_same_bodies(client, page['previous'])
+        self.assertEqual([message['text'] for message in older['results']], ['Message from 40 days ago'])
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_OUTBOX_MAX_ATTEMPTS=2,
+    EMAIL_OUTBOX_RETRY_BASE_SECONDS=30,
+)
+class OutboxTests(TestCase):
+    """Queued emails are delivered by send_outbox, retried with backoff and eventually failed."""
+
+    def setUp(self):
+        self.email = outbox.queue_email('Club approved', 'Welcome!', ['founder@example.com', ''])
+
+    def test_pending_email_is_sent(self):
+        call_command('send_outbox', stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['founder@example.com'])
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, OutboxEmail.SENT)
+        self.assertEqual(self.email.attempts, 1)
+        self.assertIsNotNone(self.email.sent_at)
+        self.assertEqual(outbox.deliver_batch(), 0)
+
+    def test_failed_send_is_retried_with_backoff_then_failed(self):
+        with mock.patch.object(EmailBackend, 'send_messages', side_effect=ConnectionError('refused')):
+            started = timezone.now()
+            self.assertEqual(outbox.deliver_batch(), 1)
+            self.email.refresh_from_db()
+            self.assertEqual(self.email.status, OutboxEmail.PENDING)
+            self.assertEqual(self.email.attempts, 1)
+            self.assertEqual(self.email.last_error, 'ConnectionError: refused')
+            self.assertGreaterEqual(self.email.next_attempt_at, started + timedelta(seconds=30))
+            # Not due again until the backoff has passed
+            self.assertEqual(outbox.deliver_batch(), 0)
+
+            OutboxEmail.objects.filter(id=self.email.id).update(next_attempt_at=timezone.now())
+            self.assertEqual(outbox.deliver_batch(), 1)
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, OutboxEmail.FAILED)
+        self.assertEqual(self.email.attempts, 2)
+        self.assertEqual(outbox.deliver_batch(), 0)
+        self.assertEqual(mail.outbox, [])
+
+
+class SearchViewTests(TestCase):
+    """The search index follows inserts, updates and deletes, and the view filters its hits."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='member')
+        self.club = Club.objects.create(name='Astronomy Society', description='Telescopes', admin=self.user, is_active=True)
+        self.post = Post.objects.create(club=self.club, author=self.user, content='Astrophotography night recap')
+        self.event = Event.objects.create(club=self.club, title='Astro camp', date=timezone.now() + timedelta(days=3))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def hits(self, query, **params):
+        response = self.client.get('/api/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return {(hit['type'], hit['id']) for hit in response.json()['results']}
+
+    def test_prefix_matches_every_kind(self):
+        self.assertEqual(
+            self.hits('astr'), {('club', self.club.id), ('post', self.post.id), ('event', self.event.id)},
+        )
+
+    def test_type_filter(self):
+        self.assertEqual(self.hits('astr', type='post,event'), {('post', self.post.id), ('event', self.event.id)})
+
+    def test_update_and_delete_follow_the_rows(self):
+        self.event.title = 'Stargazing weekend'
+        self.event.save()
+        self.assertEqual(self.hits('camp'), set())
+        self.assertEqual(self.hits('stargaz'), {('event', self.event.id)})
+        self.post.delete()
+        self.assertEqual(self.hits('astrophotography'), set())
+
+    def test_inactive_clubs_are_hidden(self):
+        pending = Club.objects.create(name='Astrology Circle', admin=self.user)
+        self.assertNotIn(('club', pending.id), self.hits('astrolog'))
+        superuser = User.objects.create_superuser(username='root', password='pass')
+        self.client.force_authenticate(superuser)
+        self.assertIn(('club', pending.id), self.hits('astrolog'))
+
+    def test_ensure_sqlite_triggers_recreates_dropped_triggers(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite triggers')
+        with connection.cursor() as cursor:
+            # What a migration rebuilding api_post does to its triggers
+            cursor.execute('DROP TRIGGER api_post_search_ai')
+        search.ensure_sqlite_triggers(sender=None)
+        post = Post.objects.create(club=self.club, author=self.user, content='Meteor shower')
+        self.assertEqual(self.hits('meteor'), {('post', post.id)})
+
+
+class ConditionalListTests(TestCase):
+    """Unchanged lists answer 304; any write the response reflects changes its validators."""
+
+    paths = ('/api/clubs/', '/api/posts/', '/api/events/')
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='member')
+        self.club = Club.objects.create(name='Club', admin=self.user, is_active=True)
+        ClubMembership.objects.create(club=self.club, user=self.user)
+        self.post = Post.objects.create(club=self.club, author=self.user, content='Hello')
+        Event.objects.create(club=self.club, title='Meetup', date=timezone.now() + timedelta(days=2))
+        # Last-Modified is only sent for seconds that are over
+        earlier = timezone.now() - timedelta(minutes=1)
+        for model in (Club, ClubMembership, Post, Event):
+            model.objects.update(updated_at=earlier)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, path, **headers):
+        response = self.client.get(path, **headers)
+        self.assertIn(response.status_code, (200, 304))
+        return response
+
+    def test_unchanged_lists_are_not_modified(self):
+        for path in self.paths:
+            response = self.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304, path)
+            self.assertEqual(self.get(path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304, path)
+
+    def assert_write_invalidates(self, path, write):
+        before = self.get(path)
+        write()
+        for headers in ({'HTTP_IF_NONE_MATCH': before['ETag']}, {'HTTP_IF_MODIFIED_SINCE': before['Last-Modified']}):
+            response = self.get(path, **headers)
+            self.assertEqual(response.status_code, 200, (path, headers))
+            self.assertNotEqual(response['ETag'], before['ETag'])
+
+    def test_new_post(self):
+        self.assert_write_invalidates(
+            '/api/posts/', lambda: Post.objects.create(club=self.club, author=self.user, content='Again'),
+        )
+
+    def test_new_event(self):
+        self.assert_write_invalidates(
+            '/api/events/',
+            lambda: Event.objects.create(club=self.club, title='Social', date=timezone.now() + timedelta(days=4)),
+        )
+
+    def test_membership_change(self):
+        other = User.objects.create_user(username='other')
+        self.assert_write_invalidates('/api/clubs/', lambda: ClubMembership.objects.create(club=self.club, user=other))
+
+    def rename_club(self):
+        self.club.name = 'Renamed'
+        self.club.save()
+
+    def test_club_rename(self):
+        # Events embed their club's name too
+        for path in ('/api/clubs/', '/api/events/'):
+            with self.subTest(path=path):
+                self.assert_write_invalidates(path, self.rename_club)
+                Club.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+
+    def test_no_last_modified_within_the_current_second(self):
+        # A later write this second would share the timestamp and go unnoticed by If-Modified-Since
+        Post.objects.create(club=self.club, author=self.user, content='Just now')
+        self.assertNotIn('Last-Modified', self.get('/api/posts/'))
+
+    def test_deleted_post_changes_etag(self):
+        before = self.get('/api/posts/')
+        self.post.delete()
+        self.assertEqual(self.get('/api/posts/', HTTP_IF_NONE_MATCH=before['ETag']).status_code, 200)
+
+
+class ExportErrorTests(TestCase):
+    """Export errors are JSON, whichever export format was asked for."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin')
+        self.club = Club.objects.create(name='Club', admin=self.admin, is_active=True)
+        self.client = APIClient()
+
+    def test_validation_error_is_json(self):
+        self.client.force_authenticate(self.admin)
+        for export_format in ('ndjson', 'csv'):
+            response = self.client.get(f'/api/clubs/{self.club.id}/export/messages/?format={export_format}&start=bad')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertIn('start', response.json())
+
+    def test_permission_error_is_json(self):
+        self.client.force_authenticate(User.objects.create_user(username='member'))
+        response = self.client.get(f'/api/clubs/{self.club.id}/export/messages/?format=csv')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json(), {'detail': 'Only the club admin can export its data.'})
+
+    def test_export_streams_in_the_requested_format(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(f'/api/clubs/{self.club.id}/export/members/?format=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+
+
+class FakeClock:
+    """Stands in for the time module so deadlines can be stepped through without sleeping."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return 1_700_000_000 + self.now
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    PRESENCE_TIMEOUT_SECONDS=10,
+    PRESENCE_TICK_SECONDS=1,
+    PRESENCE_REFRESH_SECONDS=20,
+)
+class PresenceExpiryTests(SimpleTestCase):
+    """Connections sit in deadline buckets: heartbeats move them, ticks sweep the due ones."""
+
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch.object(presence, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Ticks are driven by the test, not the background task
+        patcher = mock.patch.object(presence.ClubPresence, '_ensure_running')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.presence = presence.ClubPresence()
+        self.channel_layer = get_channel_layer()
+        self.group_channel = self.new_channel()
+        async_to_sync(self.channel_layer.group_add)(club_group(1), self.group_channel)
+
+    def new_channel(self):
+        return async_to_sync(self.channel_layer.new_channel)()
+
+    def tick(self, seconds=0):
+        self.clock.now += seconds
+        async_to_sync(self.presence.run_tick)()
+
+    def receive(self, channel):
+        return async_to_sync(self.channel_layer.receive)(channel)
+
+    def test_join_is_published_and_broadcast(self):
+        self.presence.connect(self.new_channel(), 1, 7, 'ann')
+        self.tick()
+        self.assertEqual(self.presence.online(1), {7: 'ann'})
+        event = self.receive(self.group_channel)
+        self.assertEqual(event['type'], 'presence_delta')
+        self.assertEqual((event['joined'], event['left']), ([[7, 'ann']], []))
+
+    def test_heartbeat_moves_the_deadline(self):
+        channel = self.new_channel()
+        self.presence.connect(channel, 1, 7, 'ann')
+        self.tick()
+        self.clock.now += 8
+        self.presence.heartbeat(channel)
+        # Past the first deadline, within the refreshed one
+        self.tick(5)
+        self.assertEqual(self.presence.online(1), {7: 'ann'})
+        self.assertEqual(len(self.presence._buckets), 1)
+
+    def test_sweep_expires_only_missed_deadlines(self):
+        quiet, chatty = self.new_channel(), self.new_channel()
+        self.presence.connect(quiet, 1, 7, 'ann')
+        self.presence.connect(chatty, 1, 8, 'bob')
+        self.tick()
+        self.receive(self.group_channel)
+        self.clock.now += 9
+        self.presence.heartbeat(chatty)
+        self.tick(1)
+
+        self.assertEqual(self.presence.online(1), {8: 'bob'})
+        self.assertEqual(self.receive(quiet), {'type': 'presence_expired'})
+        event = self.receive(self.group_channel)
+        self.assertEqual((event['joined'], event['left']), ([], [7]))
+
+        self.tick(10)
+        self.assertEqual(self.presence.online(1), {})
+        self.assertEqual(self.presence._buckets, {})
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    PRESENCE_TIMEOUT_SECONDS=10,
+    PRESENCE_TICK_SECONDS=1,
+)
+class PresenceOnlineViewTests(TestCase):
+    """The online endpoint counts connected users until their deadline passes."""
+
+    def test_online_count_follows_expiry(self):
+        cache.clear()
+        clock = FakeClock()
+        user = User.objects.create_user(username='member')
+        club = Club.objects.create(name='Club', admin=user, is_active=True)
+        with mock.patch.object(presence, 'time', clock), \
+                mock.patch.object(presence.ClubPresence, '_ensure_running'):
+            club_presence = presence.ClubPresence()
+            client = APIClient()
+            client.force_authenticate(user)
+            with mock.patch('api.views.club_presence', club_presence):
+                club_presence.connect('chat.1', club.id, user.id, user.username)
+                async_to_sync(club_presence.run_tick)()
+                self.assertEqual(client.get(f'/api/clubs/{club.id}/online/').json(), {'club': club.id, 'online': 1})
+
+                clock.now += 10
+                async_to_sync(club_presence.run_tick)()
+                self.assertEqual(client.get(f'/api/clubs/{club.id}/online/').json(), {'club': club.id, 'online': 0})
+
+
+class ChatSocketTestCase(TestCase):
+    """Drives the chat consumers end to end over the in-memory channel layer."""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='pw')
+        self.club = Club.objects.create(name='Club', admin=self.user, is_active=True)
+
+    def communicator(self, path=None):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path or f'/ws/chat/{self.club.id}/')
+        communicator.scope['user'] = self.user
+        return communicator
+
+    async def drain(self, communicator, timeout=0.2):
+        """Every frame received until the socket has been quiet for `timeout` seconds."""
+        frames = []
+        while not await communicator.receive_nothing(timeout=timeout):
+            frames.append(await communicator.receive_json_from())
+        return frames
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    CHAT_COALESCE_WINDOW_MS=100,
+)
+class ChatCoalescingTests(ChatSocketTestCase):
+    """Broadcasts within CHAT_COALESCE_WINDOW_MS reach a connection as one batch frame."""
+
+    async def test_quick_messages_arrive_as_one_batch(self):
+        communicator = self.communicator()
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await self.drain(communicator)
+
+        await communicator.send_json_to({'message': 'first'})
+        await communicator.send_json_to({'message': 'second'})
+        frames = await self.drain(communicator)
+        await communicator.disconnect()
+
+        self.assertEqual([frame['type'] for frame in frames], ['batch'])
+        self.assertEqual([message['text'] for message in frames[0]['messages']], ['first', 'second'])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class MultiplexFrameValidationTests(ChatSocketTestCase):
+    """Malformed club ids and last_ids get an "invalid" error instead of breaking the connection."""
+
+    invalid = {'type': 'error', 'code': 'invalid', 'detail': 'Malformed frame.'}
+
+    async def test_malformed_frames_are_rejected(self):
+        communicator = self.communicator('/ws/clubs/')
+        await communicator.connect()
+
+        await communicator.send_json_to({'type': 'message', 'club': [self.club.id], 'message': 'hi'})
+        self.assertEqual(await self.drain(communicator), [self.invalid])
+        await communicator.send_json_to({'type': 'subscribe', 'clubs': [self.club.id], 'last_ids': [1]})
+        self.assertEqual(await self.drain(communicator), [self.invalid])
+
+        # Nothing was subscribed, and the connection still works
+        await communicator.send_json_to({'type': 'typing', 'club': self.club.id})
+        self.assertEqual(await self.drain(communicator), [
+            {'type': 'error', 'detail': 'Not subscribed to this club.', 'club': self.club.id},
+        ])
+        await communicator.send_json_to({'type': 'subscribe', 'clubs': [self.club.id], 'last_ids': {}})
+        self.assertEqual((await self.drain(communicator))[0]['clubs'], [self.club.id])
+        await communicator.disconnect()
+
+
+class ChatLimitsTests(SimpleTestCase):
+    """The token buckets and inbound queue behind the chat frame limits."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(chat_limits, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_refills_at_rate_up_to_burst(self):
+        bucket = chat_limits.TokenBucket(rate=2, burst=3)
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+        self.clock.now += 0.5
+        self.assertEqual([bucket.take() for _ in range(2)], [True, False])
+        self.clock.now += 60
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+
+    def test_user_bucket_is_shared_until_last_release(self):
+        buckets = chat_limits.UserBuckets()
+        first, second = buckets.acquire(7), buckets.acquire(7)
+        self.assertIs(first, second)
+        buckets.release(7)
+        self.assertIs(buckets.acquire(7), first)
+        buckets.release(7)
+        buckets.release(7)
+        self.assertIsNot(buckets.acquire(7), first)
+
+    async def test_queue_refuses_frames_beyond_its_size(self):
+        handled, gate = [], asyncio.Event()
+
+        async def handle(frame):
+            handled.append(frame)
+            await gate.wait()
+
+        queue = chat_limits.InboundQueue(handle, size=1)
+        self.assertTrue(queue.offer(1))
+        await asyncio.sleep(0)
+        # 1 is being handled, 2 waits behind it
+        self.assertEqual([queue.offer(2), queue.offer(3)], [True, False])
+        gate.set()
+        await asyncio.sleep(0.01)
+        self.assertEqual(handled, [1, 2])
+        queue.close()
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    CHAT_MAX_FRAME_SIZE=200,
+    CHAT_CONNECTION_RATE=0.001,
+    CHAT_CONNECTION_BURST=2,
+    CHAT_INBOUND_QUEUE_SIZE=1,
+)
+class ChatInboundLimitTests(ChatSocketTestCase):
+    """Frames over the size, rate or queue limits are turned away with one error frame per run."""
+
+    @staticmethod
+    def error(reason):
+        return {'type': 'error', 'code': reason, 'detail': chat_limits.DETAILS[reason]}
+
+    async def connect(self):
+        communicator = self.communicator()
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await self.drain(communicator)
+        return communicator
+
+    async def test_oversized_frame_is_rejected(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({'message': 'x' * 300})
+        self.assertEqual(await self.drain(communicator), [self.error(chat_limits.TOO_LARGE)])
+        await communicator.disconnect()
+
+    async def test_one_error_frame_per_run_of_rejections(self):
+        communicator = await self.connect()
+        for index in range(5):
+            await communicator.send_json_to({'message': f'm{index}'})
+        frames = await self.drain(communicator)
+        self.assertEqual([frame['text'] for frame in frames if 'text' in frame], ['m0', 'm1'])
+        self.assertEqual([frame for frame in frames if 'text' not in frame], [
+            self.error(chat_limits.THROTTLED_CONNECTION),
+        ])
+
+        # A different reason starts a new run, and so does going back to the first one
+        await communicator.send_json_to({'message': 'x' * 300})
+        await communicator.send_json_to({'message': 'm5'})
+        await communicator.send_json_to({'message': 'm6'})
+        self.assertEqual(await self.drain(communicator), [
+            self.error(chat_limits.TOO_LARGE),
+            self.error(chat_limits.THROTTLED_CONNECTION),
+        ])
+        await communicator.disconnect()
+
+    async def fill_queue(self):
+        """Connect with frame handling held at a gate, then send one frame more than fits."""
+        self.handled, self.gate = [], asyncio.Event()
+
+        async def handle_frame(consumer, frame):
+            self.handled.append(frame['message'])
+            await self.gate.wait()
+
+        with mock.patch.object(ChatConsumer, 'handle_frame', handle_frame):
+            communicator = await self.connect()
+        await communicator.send_json_to({'message': 'handled'})
+        # Let the first frame be taken off the queue before the next arrive
+        await communicator.receive_nothing(timeout=0.05)
+        await communicator.send_json_to({'message': 'queued'})
+        await communicator.send_json_to({'message': 'overflow'})
+        return communicator
+
+    @override_settings(CHAT_CONNECTION_BURST=20, CHAT_INBOUND_OVERFLOW='drop')
+    async def test_drop_overflow_drops_frames(self):
+        communicator = await self.fill_queue()
+        self.assertEqual(await self.drain(communicator), [self.error(chat_limits.OVERFLOW)])
+        self.gate.set()
+        await communicator.receive_nothing(timeout=0.05)
+        self.assertEqual(self.handled, ['handled', 'queued'])
+        await communicator.disconnect()
+
+    @override_settings(CHAT_CONNECTION_BURST=20, CHAT_INBOUND_OVERFLOW='close')
+    async def test_close_overflow_closes_the_socket(self):
+        communicator = await self.fill_queue()
+        self.assertEqual(await communicator.receive_output(), {'type': 'websocket.close', 'code': 1013})
+        self.assertEqual(self.handled, ['handled'])
+        await communicator.disconnect()
+
+
+class ChatCodecTests(SimpleTestCase):
+    """MessagePack frames decode with a stock msgpack.unpackb to the tagged maps chat_codec documents."""
+
+    created_at = datetime(2025, 1, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc)
+    timestamp = 1_735_732_800_123_456
+
+    def message(self, message_id, username):
+        return chat_codec.message_data(message_id, 3, username, f'text {message_id}', self.created_at)
+
+    def unpacked(self, message_id, *author):
+        fields = {0: chat_codec.TYPES['message'], 1: message_id, 2: 3, 4: f'text {message_id}', 5: self.timestamp}
+        fields.update(zip((3, 6), author))
+        return fields
+
+    def test_message_round_trip(self):
+        message = self.message(1, 'ann')
+        packed = chat_codec.MsgpackEncoder().message(message)
+        self.assertEqual(msgpack.unpackb(packed, strict_map_key=False), self.unpacked(1, 0, 'ann'))
+        # The body packed once per broadcast gives the same frame
+        body = chat_codec.pack_message_body(message)
+        self.assertEqual(chat_codec.MsgpackEncoder().message(message, body), packed)
+
+    def test_author_is_interned_on_first_use(self):
+        encoder = chat_codec.MsgpackEncoder()
+        frames = [
+            encoder.message(self.message(1, 'ann')),
+            encoder.message(self.message(2, 'ann')),
+            encoder.message(self.message(3, 'bob')),
+        ]
+        self.assertEqual([msgpack.unpackb(frame, strict_map_key=False) for frame in frames], [
+            self.unpacked(1, 0, 'ann'),
+            self.unpacked(2, 0),
+            self.unpacked(3, 1, 'bob'),
+        ])
+
+    def test_batch_round_trip(self):
+        encoder = chat_codec.MsgpackEncoder()
+        packed = chat_codec.pack_batch([
+            encoder.message(self.message(1, 'ann')),
+            encoder.message(self.message(2, 'ann')),
+        ])
+        expected = {0: chat_codec.TYPES['batch'], 7: [self.unpacked(1, 0, 'ann'), self.unpacked(2, 0)]}
+        self.assertEqual(msgpack.unpackb(packed, strict_map_key=False), expected)
+        # A batch sent as a frame (e.g. history) is encoded the same way
+        frame = {'type': 'batch', 'messages': [self.message(1, 'ann'), self.message(2, 'ann')]}
+        self.assertEqual(msgpack.unpackb(chat_codec.MsgpackEncoder().frame(frame), strict_map_key=False), expected)
+
+    def test_decode_client_frames(self):
+        frame = msgpack.packb({0: chat_codec.TYPES['subscribe'], 16: [3, 4], 20: {3: 41}})
+        self.assertEqual(chat_codec.decode(frame), {'type': 'subscribe', 'clubs': [3, 4], 'last_ids': {'3': 41}})
+        self.assertIsNone(chat_codec.decode(b'\xc1'))
+        self.assertIsNone(chat_codec.decode(msgpack.packb({99: 1})))
+        self.assertIsNone(chat_codec.decode(msgpack.packb([1, 2])))
@@ -26,4 +26,16 @@ urlpatterns = [
     
     # Dashboard data endpoint
     path('dashboard/', views.StudentDashboardAPIView.as_view(), name='student_dashboard_api'),
+
+    # Activity feed of the requesting user's clubs
+    path('feed/', views.FeedAPIView.as_view(), name='feed_api'),
+
+    # XP leaderboard (global, or per club with ?club=<id>)
+    path('leaderboard/', views.LeaderboardAPIView.as_view(), name='leaderboard_api'),
+
+    # Full-text search across clubs, posts and events
+    path('search/', views.SearchAPIView.as_view(), name='search_api'),
+
+    # Request/consumer timing metrics (superusers only)
+    path('_metrics/', views.MetricsAPIView.as_view(), name='metrics_api'),
 ]
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from rest_framework_simplejwt.tokens import RefreshToken
 
 @login_required
@@ -12,17 +12,29 @@ def get_jwt_for_social_auth(request):
 
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied, ValidationError
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
-from django.core.mail import send_mail
-from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.urls import reverse
 from django.utils import timezone
-
-from . import models, serializers, services
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
+from datetime import datetime, time
+
+from . import chat_codec, exports, feed, ical, lean, metrics, models, search, serializers, services
+from .chat_groups import broadcast_message
+from .conditional import ConditionalListMixin
+from .membership_cache import membership_cache
+from .pagination import KeysetPagination, MessageHistoryPagination, RosterPagination
+from .presence import club_presence
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
-from django.db.models import F
 from django.shortcuts import render, redirect
 
 
@@ -64,14 +76,35 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
         user = self.get_object()
         # Ensure the requesting user can only see their own memberships unless they are a superuser
         if request.user.is_superuser or request.user == user:
-            memberships = models.ClubMembership.objects.filter(user=user)
             # We want to return the clubs, not the membership objects directly
-            clubs = [membership.club for membership in memberships]
+            club_ids = models.ClubMembership.objects.filter(user=user).values('club_id')
+            clubs = services.annotate_clubs(models.Club.objects.filter(id__in=club_ids), request.user)
             serializer = serializers.ClubSerializer(clubs, many=True, context={'request': request})
             return Response(serializer.data)
         return Response({'detail': 'You do not have permission to view these memberships.'}, status=status.HTTP_403_FORBIDDEN)
 
 
+def parse_bound(query_params, name):
+    """A ?start=/?end= style bound: an ISO 8601 date (midnight) or datetime, made aware."""
+    value = query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: 'Enter an ISO 8601 date or datetime.'})
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class IsSuperUser(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_superuser)
+
+
 class IsClubAdminOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
@@ -82,12 +115,22 @@ class IsClubMemberOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return obj.members.filter(id=request.user.id).exists() or request.user.is_superuser
+        return membership_cache.is_member(request.user, obj.id) or request.user.is_superuser
 
 
-class ClubViewSet(viewsets.ModelViewSet):
+class ClubViewSet(ConditionalListMixin, lean.LeanListMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsClubAdminOrReadOnly]
     serializer_class = serializers.ClubSerializer
+    # ClubSerializer, from the annotate_clubs() annotations
+    lean_encoder = lean.RowEncoder(
+        ('id', 'id'),
+        ('name', 'name'),
+        ('description', 'description'),
+        ('admin_username', 'admin__username'),
+        ('members_count', 'members_count'),
+        ('is_member', 'is_member'),
+        ('is_active', 'is_active'),
+    )
     
     def get_serializer_class(self):
         """Use detailed serializer for individual club retrieval"""
@@ -95,23 +138,79 @@ class ClubViewSet(viewsets.ModelViewSet):
             return serializers.ClubDetailSerializer
         return serializers.ClubSerializer
 
-    def get_queryset(self):
-        # For list action: regular users see active clubs, superusers see all
-        if self.action == 'list' and not self.request.user.is_superuser:
-            return models.Club.objects.filter(is_active=True)
-        # For other actions: superusers see all, others see active
+    def get_visible_clubs(self):
+        # Superusers see all clubs, everyone else only sees active ones
         if self.request.user.is_superuser:
             return models.Club.objects.all()
         return models.Club.objects.filter(is_active=True)
 
+    def get_queryset(self):
+        queryset = services.annotate_clubs(self.get_visible_clubs(), self.request.user)
+        if self.action == 'retrieve':
+            queryset = queryset.annotate(
+                subadmins_count=Count('memberships', filter=Q(memberships__is_subadmin=True), distinct=True)
+            )
+        return queryset
+
+    def get_list_validator_parts(self, queryset):
+        # Rows are annotated with member counts, so memberships count too
+        clubs = self.get_visible_clubs()
+        return [
+            (clubs, 'updated_at'),
+            (models.ClubMembership.objects.filter(club__in=clubs), 'updated_at'),
+        ]
+
+    def get_list_validator_key(self, request):
+        # ... and with the requesting user's is_member flags
+        club_ids = sorted(membership_cache.get(request.user).club_ids)
+        return (super().get_list_validator_key(request), request.user.id, club_ids)
+
+    def retrieve(self, request, *args, **kwargs):
+        club = self.get_object()
+        data = self.get_serializer(club).data
+        # First page of the roster; the rest is paginated by the members action
+        paginator = RosterPagination()
+        page = paginator.paginate_queryset(services.club_roster(club.id), request, view=self)
+        paginator.base_url = request.build_absolute_uri(reverse('club-members', args=[club.id]))
+        data['members'] = serializers.ClubMembershipSerializer(page, many=True).data
+        data['members_next'] = paginator.get_next_link()
+        return Response(data)
+
+    @action(detail=True, methods=['get'])
+    def members(self, request, pk=None):
+        """
+        The club's members in the order they joined, cursor-paginated.
+        Filter with ?subadmin=true|false and ?search=<username prefix>.
+        """
+        club = get_object_or_404(self.get_visible_clubs().only('id'), pk=pk)
+        subadmin = request.query_params.get('subadmin')
+        queryset = services.club_roster(
+            club.id,
+            is_subadmin=None if subadmin in (None, '') else subadmin.lower() in ('true', '1'),
+            username_prefix=request.query_params.get('search', '').strip(),
+        )
+        paginator = RosterPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(serializers.ClubMembershipSerializer(page, many=True).data)
+
     def perform_create(self, serializer):
-        club = services.create_club(self.request.user, serializer.validated_data)
-        services.send_club_creation_notification(club, self.request.user)
+        with transaction.atomic():
+            club = services.create_club(self.request.user, serializer.validated_data)
+            services.send_club_creation_notification(club, self.request.user)
+        serializer.instance = club
         
+    @action(detail=True, methods=['get'])
+    def online(self, request, pk=None):
+        """How many users are connected to the club's chat right now."""
+        club = get_object_or_404(self.get_visible_clubs().only('id'), pk=pk)
+        return Response({'club': club.id, 'online': len(club_presence.online(club.id))})
+
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
     def pending(self, request):
         """List all pending clubs. Only superusers can see this."""
-        pending_clubs = models.Club.objects.filter(is_active=False, rejected_reason__isnull=True)
+        pending_clubs = services.annotate_clubs(
+            models.Club.objects.filter(is_active=False, rejected_reason__isnull=True), request.user
+        )
         page = self.paginate_queryset(pending_clubs)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -124,16 +223,11 @@ class ClubViewSet(viewsets.ModelViewSet):
     def approve(self, request, pk=None):
         """Approve a pending club. Only superusers can do this."""
         club = self.get_object()
-        club.is_active = True
-        club.approved_date = timezone.now()
-        club.save()
-        send_mail(
-            f'Club "{club.name}" Approved',
-            'Your club has been approved.',
-            settings.DEFAULT_FROM_EMAIL,
-            [club.admin.email],
-            fail_silently=True
-        )
+        with transaction.atomic():
+            club.is_active = True
+            club.approved_date = timezone.now()
+            club.save()
+            services.send_approval_email(club)
         return Response({'detail': 'Club approved'})
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
@@ -141,50 +235,110 @@ class ClubViewSet(viewsets.ModelViewSet):
         """Reject a pending club. Only superusers can do this."""
         club = self.get_object()
         reason = request.data.get('reason', 'No reason provided.')
-        club.rejected_reason = reason
-        club.rejection_date = timezone.now()
-        club.is_active = False
-        club.save()
-        send_mail(
-            f'Club "{club.name}" Rejected',
-            f'Your club has been rejected. Reason: {reason}',
-            settings.DEFAULT_FROM_EMAIL,
-            [club.admin.email],
-            fail_silently=True
-        )
+        with transaction.atomic():
+            club.rejected_reason = reason
+            club.rejection_date = timezone.now()
+            club.is_active = False
+            club.save()
+            services.send_rejection_email(club, reason)
         return Response({'detail': 'Club rejected'})
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def join(self, request, pk=None):
         club = get_object_or_404(models.Club, pk=pk)
-        if club.members.filter(id=request.user.id).exists():
+        if membership_cache.is_member(request.user, club.id):
             return Response({'detail': 'Already a member'}, status=status.HTTP_400_BAD_REQUEST)
         club.members.add(request.user)
-        user = request.user
-        user.xp_points = F('xp_points') + 5
-        user.save(update_fields=['xp_points'])
-        user.refresh_from_db()
-        return Response({'detail': 'joined', 'xp_points': user.xp_points})
-
-
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = models.Post.objects.all().order_by('-created_at')
+        services.award_xp(request.user, models.XPEvent.JOIN_CLUB, club)
+        return Response({'detail': 'joined', 'xp_points': services.get_xp_points(request.user)})
+
+    @action(detail=True, methods=['get'], url_path=r'export/(?P<export>messages|posts|members)',
+            renderer_classes=[exports.NDJSONRenderer, exports.CSVRenderer])
+    def export(self, request, pk=None, export=None):
+        """
+        Stream the club's messages, posts or members as NDJSON (default) or
+        CSV (?format=csv), optionally between ?start= and ?end=.
+        Club admin or superuser only.
+        """
+        club = get_object_or_404(self.get_visible_clubs().only('id'), pk=pk)
+        if not request.user.is_authenticated:
+            raise NotAuthenticated()
+        if not (request.user.is_superuser or membership_cache.is_admin(request.user, club.id)):
+            raise PermissionDenied('Only the club admin can export its data.')
+        rows = exports.rows(export, club.id, parse_bound(request.query_params, 'start'),
+                            parse_bound(request.query_params, 'end'))
+        renderer = request.accepted_renderer
+        if renderer.format == 'csv':
+            lines = exports.csv_lines(exports.columns(export), rows)
+        else:
+            lines = exports.ndjson_lines(exports.columns(export), rows)
+        response = exports.streaming_response(request, exports.chunked(lines), f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="club-{club.id}-{export}.{renderer.format}"'
+        return response
+
+    @action(detail=True, methods=['post'], url_path='members/add')
+    def add_members(self, request, pk=None):
+        """Add users to the club. Club admin or superuser only."""
+        return self._bulk_membership(request, services.add_members)
+
+    @action(detail=True, methods=['post'], url_path='members/remove')
+    def remove_members(self, request, pk=None):
+        """Remove users from the club (never its admin). Club admin or superuser only."""
+        return self._bulk_membership(request, services.remove_members)
+
+    @action(detail=True, methods=['post'], url_path='members/subadmin')
+    def set_subadmins(self, request, pk=None):
+        """Set (or with "is_subadmin": false, clear) subadmin status. Club admin or superuser only."""
+        return self._bulk_membership(request, services.set_subadmins, with_flag=True)
+
+    def _bulk_membership(self, request, operation, with_flag=False):
+        club = self.get_object()
+        serializer = serializers.BulkMembershipSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        targets = serializer.validated_data['user_ids'] + serializer.validated_data['usernames']
+        found = services.resolve_users(serializer.validated_data['user_ids'], serializer.validated_data['usernames'])
+        args = (serializer.validated_data['is_subadmin'],) if with_flag else ()
+        outcomes = operation(club, set(found.values()), *args)
+
+        results, summary = [], {}
+        for target in dict.fromkeys(targets):
+            user_id = found.get(target)
+            outcome = outcomes[user_id] if user_id is not None else 'not_found'
+            results.append({'user': target, 'user_id': user_id, 'status': outcome})
+            summary[outcome] = summary.get(outcome, 0) + 1
+        return Response({'summary': summary, 'results': results})
+
+
+class PostViewSet(ConditionalListMixin, lean.LeanListMixin, viewsets.ModelViewSet):
+    queryset = models.Post.objects.select_related('author').order_by('-created_at')
     serializer_class = serializers.PostSerializer
+    lean_encoder = lean.RowEncoder(
+        ('id', 'id'),
+        ('club', 'club_id'),
+        ('author_username', 'author__username'),
+        ('content', 'content'),
+        ('created_at', 'created_at', lean.format_datetime),
+    )
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def perform_create(self, serializer):
         post = serializer.save(author=self.request.user)
-        # increment xp for author
-        user = self.request.user
-        user.xp_points = F('xp_points') + 10
-        user.save(update_fields=['xp_points'])
-        user.refresh_from_db()
+        services.award_xp(self.request.user, models.XPEvent.POST, post.club)
 
 
-class MessageViewSet(viewsets.ModelViewSet):
-    queryset = models.Message.objects.all().order_by('created_at')
+class MessageViewSet(lean.LeanListMixin, viewsets.ModelViewSet):
+    queryset = models.Message.objects.select_related('author').order_by('created_at')
     serializer_class = serializers.MessageSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = MessageHistoryPagination
+    # 'pk' rather than 'id': the keyset cursors read row.pk
+    lean_encoder = lean.RowEncoder(
+        ('id', 'pk'),
+        ('club', 'club_id'),
+        ('author_username', 'author__username'),
+        ('text', 'text'),
+        ('created_at', 'created_at', lean.format_datetime),
+    )
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -195,26 +349,92 @@ class MessageViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         msg = serializer.save(author=self.request.user)
-        user = self.request.user
-        user.xp_points = F('xp_points') + 5
-        user.save(update_fields=['xp_points'])
-        user.refresh_from_db()
+        services.award_xp(self.request.user, models.XPEvent.MESSAGE, msg.club)
+        # Live chat connections (and their recent-message buffers) get REST messages too
+        broadcast_message(chat_codec.message_data(
+            msg.id, msg.club_id, self.request.user.username, msg.text, msg.created_at,
+        ))
 
 
-class EventViewSet(viewsets.ModelViewSet):
+class EventViewSet(ConditionalListMixin, lean.LeanListMixin, viewsets.ModelViewSet):
     queryset = models.Event.objects.all().order_by('date')
     serializer_class = serializers.EventSerializer
+    # EventSerializer; its club field is write-only
+    lean_encoder = lean.RowEncoder(
+        ('id', 'id'),
+        ('club_name', 'club__name'),
+        ('title', 'title'),
+        ('description', 'description'),
+        ('date', 'date', lean.format_datetime),
+    )
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
-        """Only show upcoming events."""
-        now = timezone.now()
-        return super().get_queryset().filter(date__gte=now).order_by('date')
+        """
+        Only show upcoming events. The list can be narrowed with ?start= and
+        ?end= (ISO 8601 dates or datetimes), ?club=<id> and ?mine=true.
+        """
+        queryset = super().get_queryset().select_related('club')
+        if self.action != 'list':
+            return queryset.filter(date__gte=timezone.now()).order_by('date')
+        params = self.request.query_params
+        club_id = params.get('club') or None
+        if club_id is not None and not club_id.isdigit():
+            raise ValidationError({'club': 'Must be an integer.'})
+        mine = params.get('mine', '').lower() in ('true', '1')
+        if mine and not self.request.user.is_authenticated:
+            raise NotAuthenticated()
+        return services.filter_events(
+            queryset, self.request.user,
+            start=parse_bound(params, 'start'), end=parse_bound(params, 'end'), club_id=club_id, mine=mine,
+        )
+
+    def get_list_validator_parts(self, queryset):
+        # Events embed their club's name
+        return [(queryset, 'updated_at'), (queryset, 'club__updated_at')]
+
+    @action(detail=False, methods=['get'], url_path='calendar', permission_classes=[permissions.AllowAny],
+            renderer_classes=[ical.ICalendarRenderer])
+    def calendar(self, request):
+        """
+        iCalendar feed of a club's events (?club=<id>), or of the requesting
+        user's clubs (authenticated, or with the ?token= from calendar_link).
+        Answers If-None-Match / If-Modified-Since polls with 304.
+        """
+        club_id = request.query_params.get('club')
+        if club_id:
+            if not club_id.isdigit():
+                raise ValidationError({'club': 'Must be an integer.'})
+            club = get_object_or_404(models.Club.objects.only('id', 'name'), id=club_id, is_active=True)
+            scope, name, club_ids = f'club:{club.id}', club.name, [club.id]
+        else:
+            token = request.query_params.get('token')
+            user = ical.user_for_token(token) if token else request.user
+            if user is None or not user.is_authenticated:
+                raise NotAuthenticated()
+            scope, name = f'user:{user.id}', f'{user.username} (Venti)'
+            club_ids = sorted(membership_cache.get(user).active_club_ids)
+
+        etag, last_modified = ical.validators(scope, club_ids)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = exports.streaming_response(request, ical.stream(name, club_ids), 'text/calendar; charset=utf-8')
+            response['Content-Disposition'] = 'inline; filename="events.ics"'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @action(detail=False, methods=['get'], url_path='calendar-link', permission_classes=[IsAuthenticated])
+    def calendar_link(self, request):
+        """Subscription URL of the requesting user's calendar feed, for calendar apps."""
+        url = request.build_absolute_uri(reverse('event-calendar'))
+        return Response({'url': replace_query_param(url, 'token', ical.feed_token(request.user))})
 
     def perform_create(self, serializer):
         """Ensure the user is a member of the club they are creating an event for."""
         club = serializer.validated_data.get('club')
-        if not club.members.filter(id=self.request.user.id).exists() and not self.request.user.is_superuser:
+        if not membership_cache.is_member(self.request.user, club.id) and not self.request.user.is_superuser:
             raise permissions.PermissionDenied("You must be a member of the club to create an event.")
         serializer.save()
 
@@ -226,6 +446,135 @@ class StudentDashboardAPIView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        dashboard_data = services.get_student_dashboard_data(request.user)
-        serializer = serializers.DashboardSerializer(dashboard_data)
-        return Response(serializer.data)
\ No newline at end of file
+        data, stamp = services.get_cached_dashboard(request.user)
+        if data is None:
+            dashboard_data = services.get_student_dashboard_data(request.user)
+            data = serializers.DashboardSerializer(dashboard_data).data
+            cache.set(
+                services.dashboard_cache_key(request.user.id), (stamp, data),
+                services.dashboard_cache_timeout(dashboard_data),
+            )
+        return Response(data)
+
+
+class FeedAPIView(APIView):
+    """
+    The requesting user's activity feed: newest posts and events of their
+    clubs first, paginated with ?limit= and the ?before= cursor of `next`.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_classes = {
+        feed.POST: serializers.PostSerializerForDashboard,
+        feed.EVENT: serializers.EventSerializerForDashboard,
+    }
+
+    def get(self, request):
+        pagination = KeysetPagination()
+        pagination.page_size = 20
+        before = pagination.decode_cursor(request.query_params.get(pagination.before_query_param))
+        items, has_more = feed.get_feed(request.user, before, pagination.get_page_size(request))
+        results = [
+            {'type': item.kind, 'item': self.serializer_classes[item.kind](instance).data}
+            for item, instance in items
+        ]
+        next_link = None
+        if has_more:
+            url = request.build_absolute_uri()
+            next_link = replace_query_param(url, pagination.before_query_param, pagination.encode_cursor(items[-1][0]))
+        return Response({'next': next_link, 'results': results})
+
+
+class LeaderboardAPIView(APIView):
+    """
+    Top-N of the global leaderboard, or of a club's with ?club=<id>,
+    plus the requesting user's own entry. Served from the precomputed
+    rankings maintained by the compact_xp command.
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    default_limit = 10
+    max_limit = 100
+
+    def get(self, request):
+        club_id = request.query_params.get('club') or None
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response({'detail': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if club_id is not None and not club_id.isdigit():
+            return Response({'detail': 'club must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = services.get_leaderboard(club_id, max(limit, 1))
+        me = None
+        if request.user.is_authenticated:
+            me = services.get_leaderboard_entry(request.user, club_id)
+        return Response({
+            'results': serializers.LeaderboardEntrySerializer(entries, many=True).data,
+            'me': serializers.LeaderboardEntrySerializer(me).data if me else None,
+        })
+
+
+class SearchAPIView(APIView):
+    """
+    Ranked full-text search over clubs, posts and events: ?q=<words>,
+    optionally ?type=club,post,event, paginated with ?limit= and ?offset=.
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    default_limit = 20
+    max_limit = 100
+    serializer_classes = {
+        'club': serializers.ClubSerializer,
+        'post': serializers.PostSerializer,
+        'event': serializers.EventSerializer,
+    }
+
+    def get(self, request):
+        terms = search.parse_terms(request.query_params.get('q'))
+        if not terms:
+            return Response({'detail': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        kinds = search.KINDS
+        if request.query_params.get('type'):
+            kinds = tuple(kind for kind in search.KINDS if kind in request.query_params['type'].split(','))
+            if not kinds:
+                return Response({'detail': f"type must be one of {', '.join(search.KINDS)}"},
+                                status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', self.default_limit)), 1), self.max_limit)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({'detail': 'limit and offset must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # One extra hit tells whether there is a next page
+        hits = search.search(terms, kinds, limit + 1, offset, include_inactive=request.user.is_superuser)
+        has_next = len(hits) > limit
+        hits = hits[:limit]
+        objects = search.load_objects(hits, request.user)
+        results = []
+        for kind, object_id, score in hits:
+            instance = objects.get((kind, object_id))
+            if instance is None:
+                continue
+            results.append({
+                'type': kind,
+                'id': object_id,
+                'score': round(score, 4),
+                'item': self.serializer_classes[kind](instance, context={'request': request}).data,
+            })
+
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'offset', offset + limit) if has_next else None,
+            'previous': replace_query_param(url, 'offset', max(offset - limit, 0)) if offset else None,
+            'results': results,
+        })
+
+
+class MetricsAPIView(APIView):
+    """
+    Per-route request and consumer timings in Prometheus text format, plus
+    rejected chat frames. Timings are only collected when
+    REQUEST_METRICS_ENABLED is on.
+    """
+    permission_classes = [IsSuperUser]
+
+    def get(self, request):
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -50,6 +50,15 @@ MIDDLEWARE = [
     'allauth.account.middleware.AccountMiddleware',
 ]
 
+# Opt-in request instrumentation: Server-Timing headers and /api/_metrics/
+REQUEST_METRICS_ENABLED = os.getenv('REQUEST_METRICS_ENABLED', 'False') == 'True'
+if REQUEST_METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'api.middleware.RequestMetricsMiddleware')
+
+# List endpoints (clubs, posts, messages, events) build their JSON from values_list() rows
+# instead of running the serializers; the output is the same either way
+LEAN_LIST_RESPONSES = os.getenv('LEAN_LIST_RESPONSES', 'True') == 'True'
+
 ROOT_URLCONF = 'core.urls'
 
 FRONTEND_BUILD_DIR = os.path.join(BASE_DIR, '..', 'frontend', 'build')
@@ -87,6 +96,22 @@ DATABASES = {
     )
 }
 
+# Cache
+# Shared Redis cache when REDIS_URL is set, per-process memory otherwise
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -137,6 +162,10 @@ if os.getenv('RENDER_EXTERNAL_HOSTNAME'):
 # --- Email Settings ---
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'admin@venti.com'
+# Notification emails go through the outbox table, drained by `manage.py send_outbox`
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', 100))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = int(os.getenv('EMAIL_OUTBOX_RETRY_BASE_SECONDS', 30))
 
 # --- Allauth Social Login Settings ---
 AUTHENTICATION_BACKENDS = ['allauth.account.auth_backends.AuthenticationBackend']
@@ -167,4 +196,96 @@ CHANNEL_LAYERS = {
             "hosts": [os.getenv('REDIS_URL', 'redis://127.0.0.1:6379')],
         },
     },
-}
\ No newline at end of file
+}
+
+# --- Chat History Settings ---
+# Per-process buffer of recent messages per club used to replay history on (re)connect
+CHAT_RECENT_BUFFER_SIZE = int(os.getenv('CHAT_RECENT_BUFFER_SIZE', 200))
+# Messages replayed to a client that connects without ?last_id=
+CHAT_REPLAY_SIZE = int(os.getenv('CHAT_REPLAY_SIZE', 50))
+# Cap for the database fallback when a client's gap exceeds the buffer
+CHAT_REPLAY_MAX_MESSAGES = int(os.getenv('CHAT_REPLAY_MAX_MESSAGES', 500))
+
+# --- Chat Archive Settings ---
+# `manage.py archive_messages` moves messages older than CHAT_ARCHIVE_AFTER_DAYS into
+# gzipped per-club, per-month segment files here; the history API reads through into them
+CHAT_ARCHIVE_DIR = os.getenv('CHAT_ARCHIVE_DIR', str(BASE_DIR / 'chat_archive'))
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv('CHAT_ARCHIVE_AFTER_DAYS', 180))
+CHAT_ARCHIVE_SEGMENT_ROWS = int(os.getenv('CHAT_ARCHIVE_SEGMENT_ROWS', 50000))
+# Decompressed segments kept in memory per process
+CHAT_ARCHIVE_CACHED_SEGMENTS = int(os.getenv('CHAT_ARCHIVE_CACHED_SEGMENTS', 8))
+
+# --- Chat Broadcast Settings ---
+# When > 0, chat messages reaching a client within this many milliseconds of each other
+# are sent as one {"type": "batch", "messages": [...]} frame; 0 sends one frame per message
+CHAT_COALESCE_WINDOW_MS = int(os.getenv('CHAT_COALESCE_WINDOW_MS', 0))
+# Clubs a single ws/clubs/ connection may subscribe to at once
+CHAT_MULTIPLEX_MAX_CLUBS = int(os.getenv('CHAT_MULTIPLEX_MAX_CLUBS', 100))
+
+# --- Chat Inbound Limits ---
+# Checked for every frame a chat client sends, before it touches the database (the size before it is parsed).
+# Rates are frames per second with a burst allowance, per connection and per user (per process).
+CHAT_MAX_FRAME_SIZE = int(os.getenv('CHAT_MAX_FRAME_SIZE', 8192))
+CHAT_MAX_MESSAGE_LENGTH = int(os.getenv('CHAT_MAX_MESSAGE_LENGTH', 2000))
+CHAT_CONNECTION_RATE = float(os.getenv('CHAT_CONNECTION_RATE', 5))
+CHAT_CONNECTION_BURST = int(os.getenv('CHAT_CONNECTION_BURST', 20))
+CHAT_USER_RATE = float(os.getenv('CHAT_USER_RATE', 10))
+CHAT_USER_BURST = int(os.getenv('CHAT_USER_BURST', 30))
+# Heartbeat and typing frames are limited per connection by their own rate instead
+CHAT_CONTROL_RATE = float(os.getenv('CHAT_CONTROL_RATE', 2))
+CHAT_CONTROL_BURST = int(os.getenv('CHAT_CONTROL_BURST', 10))
+# Frames a connection may have waiting to be handled; when full, new frames are dropped
+# ('drop') or the connection is closed with code 1013 ('close')
+CHAT_INBOUND_QUEUE_SIZE = int(os.getenv('CHAT_INBOUND_QUEUE_SIZE', 16))
+CHAT_INBOUND_OVERFLOW = os.getenv('CHAT_INBOUND_OVERFLOW', 'drop')
+
+# --- Chat Presence Settings ---
+# Club chat clients send a heartbeat every PRESENCE_HEARTBEAT_SECONDS; connections silent for
+# PRESENCE_TIMEOUT_SECONDS are dropped. Online sets are published to the cache every tick.
+PRESENCE_HEARTBEAT_SECONDS = int(os.getenv('PRESENCE_HEARTBEAT_SECONDS', 25))
+PRESENCE_TIMEOUT_SECONDS = int(os.getenv('PRESENCE_TIMEOUT_SECONDS', 70))
+PRESENCE_TICK_SECONDS = float(os.getenv('PRESENCE_TICK_SECONDS', 1))
+PRESENCE_REFRESH_SECONDS = int(os.getenv('PRESENCE_REFRESH_SECONDS', 20))
+# At most one typing notification per user and club in this interval
+PRESENCE_TYPING_INTERVAL_SECONDS = float(os.getenv('PRESENCE_TYPING_INTERVAL_SECONDS', 3))
+
+# --- Chat Write-Behind Settings ---
+# When True, chat messages are broadcast immediately and persisted in batches by a
+# per-process writer thread; False keeps the synchronous insert per message.
+CHAT_WRITE_BEHIND = os.getenv('CHAT_WRITE_BEHIND', 'False') == 'True'
+CHAT_WRITE_BEHIND_INTERVAL_MS = int(os.getenv('CHAT_WRITE_BEHIND_INTERVAL_MS', 20))
+CHAT_WRITE_BEHIND_BATCH_SIZE = int(os.getenv('CHAT_WRITE_BEHIND_BATCH_SIZE', 200))
+# Message ids reserved from the database sequence at a time
+CHAT_WRITE_BEHIND_ID_BLOCK = int(os.getenv('CHAT_WRITE_BEHIND_ID_BLOCK', 500))
+
+# --- Membership Cache Settings ---
+MEMBERSHIP_CACHE_TIMEOUT = int(os.getenv('MEMBERSHIP_CACHE_TIMEOUT', 300))
+# In-process LRU tier; the TTL bounds how stale other processes can be after a change
+MEMBERSHIP_CACHE_LOCAL_SIZE = int(os.getenv('MEMBERSHIP_CACHE_LOCAL_SIZE', 1024))
+MEMBERSHIP_CACHE_LOCAL_TTL = float(os.getenv('MEMBERSHIP_CACHE_LOCAL_TTL', 2))
+
+# --- Dashboard Cache Settings ---
+# Upper bound; entries also go stale when one of the user's clubs gets a post or event (bumping the
+# club's version stamp) and are dropped when the user's memberships change
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', 300))
+
+# --- Activity Feed Settings ---
+# New posts/events are written to each member's timeline, except in clubs with more
+# members than this, which are merged in when a feed is read instead
+FEED_FANOUT_MAX_MEMBERS = int(os.getenv('FEED_FANOUT_MAX_MEMBERS', 1000))
+# Entries kept per timeline; timelines are trimmed every FEED_TRIM_EVERY fan-outs per process
+FEED_TIMELINE_SIZE = int(os.getenv('FEED_TIMELINE_SIZE', 500))
+FEED_TRIM_EVERY = int(os.getenv('FEED_TRIM_EVERY', 100))
+# Recent posts and events (of each) copied into a new member's timeline
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 20))
+FEED_CLUB_SIZE_CACHE_TIMEOUT = int(os.getenv('FEED_CLUB_SIZE_CACHE_TIMEOUT', 300))
+
+# --- Calendar Feed Settings ---
+# Past events kept in the .ics feeds, so calendar clients don't drop them right away
+CALENDAR_PAST_DAYS = int(os.getenv('CALENDAR_PAST_DAYS', 30))
+
+# --- XP Settings ---
+# Ledger entries awarded per process before they are compacted into User.xp_points
+XP_COMPACTION_THRESHOLD = int(os.getenv('XP_COMPACTION_THRESHOLD', 500))
+# Ledger entries claimed and applied per compaction transaction
+XP_COMPACTION_BATCH_SIZE = int(os.getenv('XP_COMPACTION_BATCH_SIZE', 5000))
@@ -121,6 +121,11 @@ class ApiClient {
     return this.client.get(`/clubs/${clubId}/members/`);
   }
 
+  // Follows a `next`/`previous` link of a paginated response
+  getPage(url) {
+    return this.client.get(url);
+  }
+
   getClubJoinRequests(clubId) {
     return this.client.get(`/clubs/${clubId}/requests/`);
   }
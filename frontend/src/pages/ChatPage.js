@@ -17,6 +17,10 @@ function ChatPage() {
 
     socket.current.onmessage = (e) => {
       const data = JSON.parse(e.data);
+      if (data.type === "error") {
+        console.warn("Chat:", data.detail);
+        return;
+      }
       setMessages((prevMessages) => [...prevMessages, data.message]);
     };
 
@@ -12,7 +12,23 @@ import ErrorDisplay from "../components/common/ErrorDisplay";
 import "./ClubDashboard.css";
 
 // Members Tab Component
-const MembersTab = ({ members }) => (
+const MembersTab = ({ club }) => {
+  // The club payload carries the first page of the roster; the rest is paginated
+  const [members, setMembers] = useState(club.members);
+  const [next, setNext] = useState(club.members_next);
+
+  useEffect(() => {
+    setMembers(club.members);
+    setNext(club.members_next);
+  }, [club]);
+
+  const loadMore = async () => {
+    const response = await apiClient.getPage(next);
+    setMembers((prevMembers) => [...prevMembers, ...response.data.results]);
+    setNext(response.data.next);
+  };
+
+  return (
   <div className="members-list">
     {members.map((member) => (
       <div key={member.username} className="member-item card">
@@ -29,8 +45,14 @@ const MembersTab = ({ members }) => (
         {member.is_admin && <span className="admin-badge">Admin</span>}
       </div>
     ))}
+    {next && (
+      <button className="btn" onClick={loadMore}>
+        Load more
+      </button>
+    )}
   </div>
-);
+  );
+};
 
 // Join Requests Tab Component
 const RequestsTab = ({ clubId, refetchClub }) => {
@@ -82,13 +104,20 @@ const RequestsTab = ({ clubId, refetchClub }) => {
   );
 };
 
+// The server's PRESENCE_TYPING_INTERVAL_SECONDS
+const TYPING_INTERVAL_MS = 3000;
+
 const ClubDashboard = () => {
   const { clubId } = useParams();
   const { user } = useAuth();
   const [messages, setMessages] = useState([]);
   const [newMessage, setNewMessage] = useState("");
+  // Online members (id -> username) and who is typing (username -> when it expires)
+  const [online, setOnline] = useState({});
+  const [typing, setTyping] = useState({});
   const chatSocketRef = useRef(null);
   const chatMessagesRef = useRef(null);
+  const lastTypingSentRef = useRef(0);
   const [activeTab, setActiveTab] = useState("overview");
 
   const getClubDetails = useCallback(
@@ -102,20 +131,6 @@ const ClubDashboard = () => {
     refetch: refetchClub,
   } = useApi(getClubDetails);
 
-  const getClubMessages = useCallback(
-    () => apiClient.getClubMessages(clubId),
-    [clubId]
-  );
-  const {
-    data: initialMessages,
-    loading: messagesLoading,
-    error: messagesError,
-  } = useApi(getClubMessages);
-
-  useEffect(() => {
-    if (initialMessages) setMessages(initialMessages);
-  }, [initialMessages]);
-
   useEffect(() => {
     if (!club || !user || !club.chat_websocket_url) return;
 
@@ -125,15 +140,69 @@ const ClubDashboard = () => {
     const socketUrl = `${wsScheme}://${backendHost}${club.chat_websocket_url}?token=${accessToken}`;
 
     chatSocketRef.current = new WebSocket(socketUrl);
+    let heartbeat = null;
     chatSocketRef.current.onmessage = (e) => {
       const data = JSON.parse(e.data);
-      setMessages((prevMessages) => [...prevMessages, data]);
+      if (data.type === "history") {
+        // Sent on connect: the latest messages, or what we missed since ?last_id=
+        setMessages((prevMessages) => {
+          const seen = new Set(prevMessages.map((msg) => msg.id));
+          return [...prevMessages, ...data.messages.filter((msg) => !seen.has(msg.id))];
+        });
+        return;
+      }
+      if (data.type === "presence") {
+        // The full online list on connect, joined/left deltas afterwards
+        if (data.online) {
+          setOnline(Object.fromEntries(data.online.map((u) => [u.id, u.username])));
+          clearInterval(heartbeat);
+          heartbeat = setInterval(() => {
+            if (chatSocketRef.current?.readyState === WebSocket.OPEN) {
+              chatSocketRef.current.send(JSON.stringify({ type: "heartbeat" }));
+            }
+          }, data.heartbeat * 1000);
+          return;
+        }
+        setOnline((prevOnline) => {
+          const next = { ...prevOnline };
+          data.joined.forEach((u) => { next[u.id] = u.username; });
+          data.left.forEach((id) => { delete next[id]; });
+          return next;
+        });
+        return;
+      }
+      if (data.type === "error") {
+        // A frame of ours was dropped (too large, or sent too fast)
+        console.warn("Chat:", data.detail);
+        return;
+      }
+      if (data.type === "typing") {
+        const { username } = data.user;
+        setTyping((prevTyping) => ({ ...prevTyping, [username]: Date.now() + 4000 }));
+        setTimeout(() => setTyping((prevTyping) => {
+          const next = { ...prevTyping };
+          if (next[username] <= Date.now()) delete next[username];
+          return next;
+        }), 4000);
+        return;
+      }
+      // Chat messages, one per frame or coalesced into a batch by the server
+      const received = data.type === "batch" ? data.messages : [data];
+      setMessages((prevMessages) => [...prevMessages, ...received]);
+      setTyping((prevTyping) => {
+        const next = { ...prevTyping };
+        received.forEach((msg) => { delete next[msg.author_username]; });
+        return next;
+      });
     };
     chatSocketRef.current.onclose = () => console.error("Chat socket closed");
     chatSocketRef.current.onerror = (err) =>
       console.error("Chat socket error:", err);
 
-    return () => chatSocketRef.current?.close();
+    return () => {
+      clearInterval(heartbeat);
+      chatSocketRef.current?.close();
+    };
   }, [club, user]);
 
   useEffect(() => {
@@ -142,6 +211,16 @@ const ClubDashboard = () => {
     }
   }, [messages]);
 
+  const handleInputChange = (e) => {
+    setNewMessage(e.target.value);
+    // At most one typing notification per TYPING_INTERVAL_MS; the server would drop the rest
+    const now = Date.now();
+    if (chatSocketRef.current?.readyState === WebSocket.OPEN && now - lastTypingSentRef.current >= TYPING_INTERVAL_MS) {
+      lastTypingSentRef.current = now;
+      chatSocketRef.current.send(JSON.stringify({ type: "typing" }));
+    }
+  };
+
   const sendMessage = () => {
     if (
       newMessage.trim() &&
@@ -152,23 +231,21 @@ const ClubDashboard = () => {
     }
   };
 
-  if (loading || messagesLoading)
+  if (loading)
     return (
       <MainLayout>
         <LoadingSpinner />
       </MainLayout>
     );
-  if (error || messagesError)
+  if (error)
     return (
       <MainLayout>
-        <ErrorDisplay message={error?.message || messagesError?.message} />
+        <ErrorDisplay message={error?.message} />
       </MainLayout>
     );
   if (!club) return null;
 
-  const isMember =
-    user.is_superuser ||
-    club.members.some((member) => member.username === user.username);
+  const isMember = user.is_superuser || club.is_member;
   const isAdmin = user.is_superuser || club.admin_username === user.username;
 
   return (
@@ -214,7 +291,7 @@ const ClubDashboard = () => {
                 </p>
               </div>
             )}
-            {activeTab === "members" && <MembersTab members={club.members} />}
+            {activeTab === "members" && <MembersTab club={club} />}
             {activeTab === "requests" && isAdmin && (
               <RequestsTab clubId={clubId} refetchClub={refetchClub} />
             )}
@@ -224,6 +301,9 @@ const ClubDashboard = () => {
         <div className="club-chat-panel card">
           <h3>
             <span className="material-icons">chat</span> Club Chat
+            {isMember && (
+              <span className="chat-online">{Object.keys(online).length} online</span>
+            )}
           </h3>
           {isMember ? (
             <>
@@ -243,12 +323,17 @@ const ClubDashboard = () => {
                   </div>
                 ))}
               </div>
+              {Object.keys(typing).length > 0 && (
+                <div className="chat-typing">
+                  {Object.keys(typing).map((name) => `@${name}`).join(", ")} typing...
+                </div>
+              )}
               <div className="chat-input-area">
                 <input
                   type="text"
                   placeholder="Type your message..."
                   value={newMessage}
-                  onChange={(e) => setNewMessage(e.target.value)}
+                  onChange={handleInputChange}
                   onKeyPress={(e) => e.key === "Enter" && sendMessage()}
                 />
                 <button className="btn btn-primary" onClick={sendMessage}>